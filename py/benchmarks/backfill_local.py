@@ -0,0 +1,101 @@
+# backfill_local.py  (cadena completa sobre un lago en disco: sin S3, Glue ni red)
+#
+#   python py/benchmarks/backfill_local.py --lake /data/lake                 # bronze1 → predictive
+#   python py/benchmarks/backfill_local.py --lake /data/lake --seed 5000     # sembrar datos sintéticos antes
+#   python py/benchmarks/backfill_local.py --lake /data/lake --stages cups quality
+#
+# El lago tiene un directorio por bucket (<lake>/<bucket>/<key>), el mismo layout que
+# --STORAGE_ROOT del job de Glue. Las Lambdas leen con mmap vía storage.LocalStore; el
+# catálogo y el disparo del job de predicción se omiten (acción "offline").
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _configure(lake: str) -> None:
+    """Antes de importar los módulos: los clientes S3 de nivel de módulo ya salen locales."""
+    os.environ["STORAGE_ROOT"] = "file://" + os.path.abspath(lake) + "/"
+    os.environ["CATALOG_SYNC"] = "false"
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+
+def _seed(lake: str, patients: int, cups_files: int, cups_rows: int) -> None:
+    import generators
+    bronze = os.path.join(lake, "serverless-architecture-smes-analytics-bronze-zone")
+    inputs = {
+        f"bronze1/procedimientos/cups_{i:03d}.xlsx": generators.cups_workbook(cups_rows, seed=i, patients=patients)
+        for i in range(cups_files)
+    }
+    inputs["bronze1/pacientes/pacientes.csv"] = generators.patients_csv(patients)
+    inputs["bronze1/mensual_proc/mensual_procedimientos.xlsx"] = generators.monthly_workbook(200)
+    for key, body in inputs.items():
+        path = os.path.join(bronze, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(body)
+
+
+def stages(mods, lake: str):
+    glue = mods["glue"]
+
+    def run_glue() -> dict:
+        import storage
+        glue.STORAGE_ROOT = os.environ["STORAGE_ROOT"]
+        glue.s3 = storage.LocalStore(lake)
+        glue.run_pipeline()
+        with glue.s3.open(Bucket=glue.OUTPUT_BUCKET, Key=glue.OUTPUT_KEY) as body:
+            rows = max(body.read().count(b"\n") - 1, 0)
+        return {"status": "SUCCESS", "rows": rows}
+
+    return [
+        ("cups", lambda: mods["cups"].process_cups()),
+        ("pacientes", lambda: mods["pacientes"].process_pacientes()),
+        ("mensual_proc", lambda: mods["mensual_proc"].process_mensual_proc()),
+        ("quality", lambda: mods["quality"].lambda_handler({}, None)),
+        ("glue", run_glue),
+    ]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Backfill local de la cadena bronze → predictive")
+    parser.add_argument("--lake", required=True, help="directorio raíz del lago (un subdirectorio por bucket)")
+    parser.add_argument("--stages", nargs="*", default=[], help="subconjunto de etapas (en orden)")
+    parser.add_argument("--seed", type=int, default=0, help="sembrar bronze1 con N pacientes sintéticos")
+    parser.add_argument("--cups-files", type=int, default=3)
+    parser.add_argument("--cups-rows", type=int, default=5_000)
+    args = parser.parse_args(argv)
+
+    _configure(args.lake)
+    if args.seed:
+        _seed(args.lake, args.seed, args.cups_files, args.cups_rows)
+
+    import bench_pipeline   # carga de los paquetes Lambda y del script de Glue
+    mods = bench_pipeline.load_modules()
+    mods["glue"].EXECUTION_MODE = "pandas"
+
+    failed = False
+    print(f"{'etapa':<13}{'estado':<11}{'wall s':>9}{'filas':>10}")
+    for name, fn in stages(mods, args.lake):
+        if args.stages and name not in args.stages:
+            continue
+        start = time.perf_counter()
+        try:
+            out = fn()
+        except Exception as exc:
+            out = {"status": "ERROR", "message": f"{type(exc).__name__}: {exc}"}
+        rows = out.get("rows", out.get("quality", {}).get("rows", 0))
+        print(f"{name:<13}{str(out.get('status')):<11}{time.perf_counter() - start:>9.3f}{rows or 0:>10}")
+        if out.get("status") == "ERROR":
+            print(f"  {out.get('message')}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, HERE)
+    sys.exit(main())
@@ -0,0 +1,143 @@
+# bench_cleaning.py  (micro-benchmark: limpieza por celda vs. etapa vectorizada)
+#
+#   python py/benchmarks/bench_cleaning.py --rows 200000 --repeat 3
+#   python py/benchmarks/bench_cleaning.py --dates --rows 1000000   # solo el parseo de fechas
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "shared"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda_function_transform"))
+import cleaning  # noqa: E402
+from cups import KEY_COLS, ORDERED_COLS  # noqa: E402
+
+
+# ─────────── Datos sintéticos ────────────────────────────────────────────
+def synthetic_frame(rows: int, seed: int = 7) -> pd.DataFrame:
+    """Frame con la forma de un libro CUPS leído con dtype=str."""
+    rng = np.random.default_rng(seed)
+    days = rng.integers(1, 29, rows)
+    months = rng.integers(1, 13, rows)
+    years = rng.choice([2023, 2024], rows)
+    fechas = pd.Series([f"{d:02d}/{m:02d}/{y}" for d, m, y in zip(days, months, years)])
+    fechas[rng.random(rows) < 0.02] = np.nan
+
+    def col(prefix: str, card: int, null_ratio: float = 0.05) -> pd.Series:
+        s = pd.Series([f"  {prefix} {i} " for i in rng.integers(0, card, rows)])
+        s[rng.random(rows) < null_ratio] = np.nan
+        return s
+
+    return pd.DataFrame({
+        "fecha": fechas,
+        "nombre del paciente": col("Paciente", 5_000),
+        "numero de documento - historia clinica": col("", 5_000),
+        "medico interno responsable": col("Dr RM 12.345", 40),
+        "medico externo responsable": col("Dr", 40, 0.6),
+        "promotor de salud": col("Promotor", 10, 0.6),
+        "actividad_servicio": col("Ozonoterapia", 30),
+    })
+
+
+def synthetic_dates(rows: int, seed: int = 7) -> pd.Series:
+    """Columna 'fecha' de libros reales: texto dd/mm/aaaa mezclado con celdas de fecha de Excel."""
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D")
+    text = pd.Series(days.strftime("%d/%m/%Y"))
+    excel = rng.random(rows) < 0.3
+    text[excel] = days[excel].strftime("%Y-%m-%d %H:%M:%S")
+    text[rng.random(rows) < 0.01] = "sin fecha"
+    text[rng.random(rows) < 0.02] = np.nan
+    return text
+
+
+# ─────────── Implementaciones ────────────────────────────────────────────
+def legacy(frame: pd.DataFrame) -> pd.DataFrame:
+    """Ruta original de cups.py (applymap + apply + doble to_datetime)."""
+    df = frame.applymap(lambda x: str(x).strip() if pd.notna(x) else "")
+    df["fecha"] = pd.to_datetime(df["fecha"], dayfirst=True, errors="coerce")
+    df["fecha"] = df["fecha"].apply(
+        lambda d: d.replace(year=2024) if pd.notnull(d) and d.year == 2023 else d
+    )
+    df.replace({"": pd.NA}, inplace=True)
+    df.dropna(how="all", subset=KEY_COLS, inplace=True)
+    df.fillna("", inplace=True)
+    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce").dt.strftime("%d/%m/%Y")
+    return df[ORDERED_COLS]
+
+
+def vectorized(frame: pd.DataFrame) -> pd.DataFrame:
+    """Ruta actual: cleaning.clean_frame + drop_empty_keys + format_dates."""
+    df = cleaning.clean_frame(frame, date_col="fecha", dayfirst=True, year_fix=(2023, 2024))
+    df = cleaning.drop_empty_keys(df, KEY_COLS)
+    df["fecha"] = cleaning.format_dates(df["fecha"])
+    return df[ORDERED_COLS]
+
+
+def dates_per_element(values: pd.Series) -> pd.Series:
+    """Inferencia valor por valor (la única lectura correcta con formatos mezclados)."""
+    return pd.to_datetime(values, format="mixed", dayfirst=True, errors="coerce")
+
+
+def dates_parser(values: pd.Series) -> pd.Series:
+    """cleaning.DateParser: formato detectado una vez, únicos memoizados."""
+    return cleaning.DateParser()(values)
+
+
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, encoding="utf-8-sig", lineterminator="\n")
+    return buf.getvalue()
+
+
+def bench(fn, frame: pd.DataFrame, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de la limpieza CUPS")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dates", action="store_true", help="medir solo el parseo de la columna 'fecha'")
+    args = parser.parse_args(argv)
+
+    if args.dates:
+        values = synthetic_dates(args.rows)
+        if not dates_per_element(values).equals(dates_parser(values)):
+            print("ERROR: las fechas difieren entre implementaciones")
+            return 1
+        t_old = bench(dates_per_element, values, args.repeat)
+        t_new = bench(dates_parser, values, args.repeat)
+        print(f"filas            : {args.rows:,}  ({values.nunique():,} valores distintos)")
+        print(f"por elemento     : {t_old:8.3f} s  {args.rows / t_old:12,.0f} filas/s")
+        print(f"DateParser       : {t_new:8.3f} s  {args.rows / t_new:12,.0f} filas/s")
+        print(f"speed-up         : {t_old / t_new:8.1f}x  (mismas fechas)")
+        return 0
+
+    frame = synthetic_frame(args.rows)
+    if to_csv_bytes(legacy(frame)) != to_csv_bytes(vectorized(frame)):
+        print("ERROR: la salida CSV difiere entre implementaciones")
+        return 1
+
+    t_old = bench(legacy, frame, args.repeat)
+    t_new = bench(vectorized, frame, args.repeat)
+    print(f"filas            : {args.rows:,}")
+    print(f"legacy           : {t_old:8.3f} s  {args.rows / t_old:12,.0f} filas/s")
+    print(f"vectorizado      : {t_new:8.3f} s  {args.rows / t_new:12,.0f} filas/s")
+    print(f"speed-up         : {t_old / t_new:8.1f}x  (CSV idéntico byte a byte)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
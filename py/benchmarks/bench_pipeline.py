@@ -0,0 +1,315 @@
+# bench_pipeline.py  (benchmark offline de la cadena completa contra S3/Glue en memoria)
+#
+#   python py/benchmarks/bench_pipeline.py --patients 50000 --cups-files 4 --cups-rows 20000
+#   python py/benchmarks/bench_pipeline.py --save base.json          # guardar línea base
+#   python py/benchmarks/bench_pipeline.py --baseline base.json      # falla si hay regresión
+#
+# Etapas (en orden, cada repetición sobre un bucket recién sembrado):
+#   cups → pacientes → mensual_proc → quality (silver1 → gold1) → glue (run_pipeline)
+#
+#   --glue-mode spark ejecuta el job con Spark local (requiere pyspark y Java): los
+#   buckets del stub se vuelcan a un directorio temporal que hace de STORAGE_ROOT.
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from statistics import median
+from typing import Dict, List
+
+import boto3
+
+import generators
+import stubs
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PY = os.path.dirname(HERE)
+TRANSFORM_DIR = os.path.join(PY, "lambda_function_transform")
+QUALITY_DIR = os.path.join(PY, "lambda_function_quality")
+GLUE_SCRIPT = os.path.join(PY, "glue_prediction_pacientes", "glue_prediction_pacientes.py")
+
+SHARED_DIR = os.path.join(PY, "shared")
+
+
+def _module_names(*directories: str) -> tuple:
+    return tuple(sorted({n[:-3] for d in directories for n in os.listdir(d) if n.endswith(".py")}))
+
+
+# Módulos de cada zip (paquete + py/shared): se descartan antes de cargar otro paquete,
+# como en Lambda, donde cada función importa los suyos. storage se conserva: los stubs
+# ya construyeron su backend con él.
+SHARED_MODULES = tuple(m for m in _module_names(TRANSFORM_DIR, QUALITY_DIR, SHARED_DIR) if m != "storage")
+
+BRONZE = "serverless-architecture-smes-analytics-bronze-zone"
+GLUE_DB = "smes_analytics"
+
+
+# ─────────── Memoria ─────────────────────────────────────────────────────
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # fuera de Linux: máximo histórico del proceso
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class PeakRSS:
+    """Muestrea el RSS en un hilo mientras dura el bloque y guarda el pico."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval, self.peak = interval, 0
+        self._stop = threading.Event()
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "PeakRSS":
+        self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+# ─────────── Carga de los módulos bajo prueba ────────────────────────────
+def _load(path: str, alias: str, directory: str):
+    """Importa `path` como `alias` resolviendo sus imports desde `directory`."""
+    for name in SHARED_MODULES:
+        sys.modules.pop(name, None)
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.spec_from_file_location(alias, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[alias] = module
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(directory)
+    return module
+
+
+def _load_glue_job():
+    """El script de Glue ejecuta run_pipeline() al importarse: se compila sin esa llamada."""
+    with open(GLUE_SCRIPT, encoding="utf-8") as fh:
+        source = fh.read()
+    head, sep, tail = source.rpartition("run_pipeline()")
+    if not sep or tail.strip():
+        raise RuntimeError("No se encontró la llamada final a run_pipeline() en el job de Glue")
+    module = type(sys)("glue_prediction_pacientes")
+    module.__file__ = GLUE_SCRIPT
+    exec(compile(head, GLUE_SCRIPT, "exec"), module.__dict__)
+    return module
+
+
+def load_modules() -> Dict[str, object]:
+    """Módulos de las Lambdas y del job; boto3.client ya debe apuntar a los stubs."""
+    mods = {
+        "cups": _load(os.path.join(TRANSFORM_DIR, "cups.py"), "bench_cups", TRANSFORM_DIR),
+        "pacientes": _load(os.path.join(TRANSFORM_DIR, "pacientes.py"), "bench_pacientes", TRANSFORM_DIR),
+        "mensual_proc": _load(os.path.join(TRANSFORM_DIR, "mensual_proc.py"), "bench_mensual_proc", TRANSFORM_DIR),
+        "quality": _load(os.path.join(QUALITY_DIR, "lambda_function.py"), "bench_quality", QUALITY_DIR),
+        "glue": _load_glue_job(),
+    }
+    return mods
+
+
+# ─────────── Escenario ───────────────────────────────────────────────────
+def build_inputs(args) -> Dict[str, bytes]:
+    """Genera una sola vez los objetos de bronze1 (key → bytes)."""
+    inputs = {
+        f"bronze1/procedimientos/cups_{i:03d}.xlsx":
+            generators.cups_workbook(args.cups_rows, seed=i, patients=args.patients)
+        for i in range(args.cups_files)
+    }
+    inputs["bronze1/pacientes/pacientes.csv"] = generators.patients_csv(
+        args.patients, encoding=args.encoding
+    )
+    inputs["bronze1/mensual_proc/mensual_procedimientos.xlsx"] = generators.monthly_workbook(args.monthly_rows)
+    return inputs
+
+
+def _rows_in(s3: stubs.CountingStore, bucket: str, prefix: str) -> int:
+    """Filas de datos en los CSV bajo `prefix` (para etapas que no reportan filas)."""
+    return sum(s3.body(bucket, obj["Key"]).count(b"\n") - 1 for obj in s3.list(bucket, prefix)
+               if obj["Key"].endswith(".csv"))
+
+
+def _dump_buckets(s3: stubs.CountingStore, root: str) -> None:
+    """Copia los objetos del stub a `root/<bucket>/<key>` (entrada de Spark local)."""
+    for (bucket, key), (body, _, _) in list(s3.objects.items()):
+        path = os.path.join(root, bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(body)
+
+
+def _local_rows(root: str, bucket: str, prefix: str) -> int:
+    """Filas en los part-*.csv que escribe Spark local bajo `prefix`."""
+    folder = os.path.join(root, bucket, prefix)
+    if not os.path.isdir(folder):
+        return 0
+    rows = 0
+    for name in os.listdir(folder):
+        if name.startswith("part-") and name.endswith(".csv"):
+            with open(os.path.join(folder, name), "rb") as fh:
+                rows += max(fh.read().count(b"\n") - 1, 0)
+    return rows
+
+
+def _run_glue(glue, s3: stubs.CountingStore) -> dict:
+    if glue.EXECUTION_MODE != "spark":
+        glue.run_pipeline()
+        return {"status": "SUCCESS"}
+    root = tempfile.mkdtemp(prefix="bench_lake_")
+    _dump_buckets(s3, root)
+    glue.STORAGE_ROOT = "file://" + root + "/"
+    glue.run_pipeline()
+    return {"status": "SUCCESS", "rows": _local_rows(root, glue.OUTPUT_BUCKET, os.path.dirname(glue.OUTPUT_KEY))}
+
+
+def stages(mods, s3: stubs.CountingStore) -> List[tuple]:
+    """(nombre, función, filas(resultado)) en el orden de la cadena."""
+    glue = mods["glue"]
+    return [
+        ("cups", lambda: mods["cups"].process_cups(s3=s3), lambda r: r.get("rows", 0)),
+        ("pacientes", lambda: mods["pacientes"].process_pacientes(s3=s3), lambda r: r.get("rows", 0)),
+        ("mensual_proc", lambda: mods["mensual_proc"].process_mensual_proc(s3=s3), lambda r: r.get("rows", 0)),
+        ("quality", lambda: mods["quality"].lambda_handler({}, None),
+         lambda r: _rows_in(s3, mods["quality"].GOLD_BUCKET, mods["quality"].GOLD1_PREFIX)),
+        ("glue", lambda: _run_glue(glue, s3),
+         lambda r: r.get("rows") or _rows_in(s3, glue.OUTPUT_BUCKET, os.path.dirname(glue.OUTPUT_KEY))),
+    ]
+
+
+def run_once(mods, inputs: Dict[str, bytes], only: List[str]) -> Dict[str, dict]:
+    """Siembra un S3 nuevo, ejecuta la cadena y mide cada etapa."""
+    s3, glue = stubs.CountingStore(), stubs.InMemoryGlue(databases=[GLUE_DB])
+    glue.crawlers.update(f"crawler_{name}" for name in mods["glue"].DATASETS)
+    for key, body in inputs.items():
+        s3.seed(BRONZE, key, body)
+    # Los módulos con clientes a nivel de módulo apuntan al S3 de esta repetición
+    mods["quality"].s3, mods["quality"].glue = s3, glue
+    mods["glue"].s3, mods["glue"].glue = s3, glue
+    mods["pacientes"].catalog._glue = mods["mensual_proc"].catalog._glue = glue
+
+    results = {}
+    for name, fn, count_rows in stages(mods, s3):
+        if only and name not in only:   # se ejecuta igual: alimenta a las etapas siguientes
+            try:
+                fn()
+            except Exception:
+                pass
+            continue
+        before = s3.counters()
+        with PeakRSS() as mem:
+            start = time.perf_counter()
+            try:
+                out = fn()
+            except Exception as exc:   # la etapa falla: se reporta y la cadena sigue
+                out = {"status": "ERROR", "message": f"{type(exc).__name__}: {exc}"}
+            wall = time.perf_counter() - start
+        after = s3.counters()
+        rows = count_rows(out)
+        results[name] = {
+            "status": out.get("status"),
+            "message": out.get("message", ""),
+            "wall_s": wall,
+            "rows": rows,
+            "rows_per_s": rows / wall if wall else 0.0,
+            "peak_rss_mb": mem.peak / 1024 ** 2,
+            **{k: after[k] - before[k] for k in after},
+        }
+    return results
+
+
+def summarize(runs: List[Dict[str, dict]]) -> Dict[str, dict]:
+    """Mediana por métrica entre repeticiones (el estado es el de la última)."""
+    summary = {}
+    for name in runs[-1]:
+        samples = [run[name] for run in runs]
+        summary[name] = {k: (samples[-1][k] if k in ("status", "message") else median(s[k] for s in samples))
+                         for k in samples[-1]}
+    return summary
+
+
+def print_table(summary: Dict[str, dict]) -> None:
+    header = f"{'etapa':<13}{'estado':<9}{'wall s':>9}{'filas':>10}{'filas/s':>12}{'RSS MB':>9}" \
+             f"{'req':>7}{'MB in':>9}{'MB out':>9}{'MB copia':>10}"
+    print(header)
+    print("─" * len(header))
+    for name, m in summary.items():
+        print(f"{name:<13}{str(m['status']):<9}{m['wall_s']:>9.3f}{m['rows']:>10.0f}{m['rows_per_s']:>12,.0f}"
+              f"{m['peak_rss_mb']:>9.1f}{m['requests']:>7.0f}{m['bytes_in'] / 1024 ** 2:>9.2f}"
+              f"{m['bytes_out'] / 1024 ** 2:>9.2f}{m['bytes_copied'] / 1024 ** 2:>10.2f}")
+    for name, m in summary.items():
+        if m["status"] == "ERROR":
+            print(f"  {name}: {m['message']}")
+
+
+def compare(summary: Dict[str, dict], baseline_path: str, tolerance: float) -> List[str]:
+    """Etapas cuyo wall time supera la línea base en más de `tolerance` (fracción)."""
+    with open(baseline_path, encoding="utf-8") as fh:
+        baseline = json.load(fh)["stages"]
+    regressions = []
+    for name, m in summary.items():
+        base = baseline.get(name)
+        if base and m["wall_s"] > base["wall_s"] * (1 + tolerance):
+            regressions.append(f"{name}: {base['wall_s']:.3f}s → {m['wall_s']:.3f}s")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline de la cadena bronze → predictive")
+    parser.add_argument("--patients", type=int, default=20_000, help="filas del CSV de pacientes")
+    parser.add_argument("--cups-files", type=int, default=3, help="libros CUPS en bronze1")
+    parser.add_argument("--cups-rows", type=int, default=5_000, help="filas por libro CUPS")
+    parser.add_argument("--monthly-rows", type=int, default=200, help="filas por pestaña mensual")
+    parser.add_argument("--encoding", default="utf-8", help="encoding del CSV de pacientes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--glue-mode", choices=("pandas", "spark"), default="pandas",
+                        help="ruta de ejecución del job de Glue")
+    parser.add_argument("--stages", nargs="*", default=[], help="subconjunto de etapas a medir")
+    parser.add_argument("--save", help="escribe los resultados como JSON (línea base)")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="regresión permitida (0.25 = +25%%)")
+    args = parser.parse_args(argv)
+
+    # Todo cliente creado por boto3 (también los de nivel de módulo) es un stub
+    boto3.client = stubs.client_factory(stubs.CountingStore(), stubs.InMemoryGlue())
+    mods = load_modules()
+    mods["glue"].EXECUTION_MODE = args.glue_mode
+
+    t0 = time.perf_counter()
+    inputs = build_inputs(args)
+    print(f"datos sintéticos: {len(inputs)} objetos, "
+          f"{sum(map(len, inputs.values())) / 1024 ** 2:.1f} MB en {time.perf_counter() - t0:.1f}s")
+
+    runs = [run_once(mods, inputs, args.stages) for _ in range(args.repeat)]
+    summary = summarize(runs)
+    print_table(summary)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump({"args": vars(args), "stages": summary}, fh, indent=2, default=str)
+    if args.baseline:
+        regressions = compare(summary, args.baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESIÓN", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
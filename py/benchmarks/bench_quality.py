@@ -0,0 +1,129 @@
+# bench_quality.py  (micro-benchmark: split responsable/RM y clasificación, por fila vs. por valor único)
+#
+#   python py/benchmarks/bench_quality.py --rows 500000 --catalog 300
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "shared"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda_function_quality"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")   # el handler crea clientes al importarse
+import classify  # noqa: E402
+from lambda_function import PROC_MAP, RM_PATTERN, _clasificar_proc, _remove_accents, _split_responsable  # noqa: E402
+
+DOCTOR_SAMPLES = [
+    "Dr. Carlos Ruiz RM 12.345", "Dra. Paula León - RM: 67890", "Dr. Mario Sáenz", "", "   ",
+    "RM 123", "rm:4,56 Dr. Uno", "Dr. RMX 12", "Dr. Dos RM 1 RM 2", "  Dra. Tres -  ", "xRM 99",
+    "Dr. Cuatro - RM", "Dr. Cinco RM\t77.1",
+]
+ACTIVITY_SAMPLES = [
+    "Ozonoterapia mayor", "Sueroterapia vitamina C", "Biopuntura lumbar", "Terapia Neural facial",
+    "Consulta de control", "OZONOTERAPIA MENOR", "Sueroterapía NAD+", "Valoración inicial",
+    "biopuntura + ozonoterapia", "TERAPIA  NEURAL", "", "Terápia neural",
+]
+
+
+# ─────────── Implementaciones originales (por fila) ──────────────────────
+def legacy_split(val):
+    if not isinstance(val, str):
+        return "sin responsable", "sin RM"
+    original = val.strip()
+    if original == "":
+        return "sin responsable", "sin RM"
+    match = RM_PATTERN.search(original)
+    rm_clean = re.sub(r"[^0-9]", "", match.group(1)) if match else "sin RM"
+    nombre = RM_PATTERN.sub("", original).rstrip(" -").strip()
+    if nombre == "":
+        nombre = "sin responsable"
+    return nombre, rm_clean
+
+
+def legacy_classify(actividad, catalog=PROC_MAP):
+    if not isinstance(actividad, str):
+        return "otro"
+    act_low = _remove_accents(actividad.lower())
+    for clave, categoria in catalog.items():
+        if clave in act_low:
+            return categoria
+    return "otro"
+
+
+# ─────────── Datos sintéticos ────────────────────────────────────────────
+def synthetic(rows: int, seed: int = 11) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    doctors = np.array(DOCTOR_SAMPLES + [f"Dr. Médico {i} RM {i}.{i:03d}" for i in range(60)], dtype=object)
+    acts = np.array(ACTIVITY_SAMPLES + [f"Procedimiento {i} ozono" for i in range(80)], dtype=object)
+    df = pd.DataFrame({
+        "medico interno responsable": doctors[rng.integers(0, len(doctors), rows)],
+        "actividad_servicio": acts[rng.integers(0, len(acts), rows)],
+    })
+    df.loc[rng.random(rows) < 0.03, "medico interno responsable"] = np.nan
+    df.loc[rng.random(rows) < 0.03, "actividad_servicio"] = np.nan
+    return df
+
+
+def synthetic_catalog(size: int, seed: int = 5) -> dict:
+    """Catálogo grande que conserva las cuatro claves reales al frente."""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz "))
+    catalog = dict(PROC_MAP)
+    while len(catalog) < size:
+        key = "".join(rng.choice(letters, rng.integers(3, 9))).strip()
+        if key:
+            catalog.setdefault(key, f"categoria {len(catalog)}")
+    return catalog
+
+
+def timed(label: str, fn, repeat: int):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<28}{best:>9.3f}s")
+    return out, best
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Clasificación en LambdaQuality: por fila vs. por valor único")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--catalog", type=int, default=300, help="claves del catálogo sintético")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    df = synthetic(args.rows)
+    col_doc, col_act = df["medico interno responsable"], df["actividad_servicio"]
+
+    print(f"split responsable/RM ({args.rows:,} filas)")
+    (old, t_old) = timed("por fila", lambda: tuple(map(list, zip(*col_doc.map(legacy_split)))), args.repeat)
+    (new, t_new) = timed("por valor único", lambda: _split_responsable(col_doc), args.repeat)
+    assert old[0] == new[0].tolist() and old[1] == new[1].tolist(), "split distinto"
+    print(f"  speedup {t_old / t_new:.1f}x")
+
+    print(f"clasificación PROC_MAP ({len(PROC_MAP)} claves)")
+    (old, t_old) = timed("por fila", lambda: col_act.map(legacy_classify), args.repeat)
+    (new, t_new) = timed("autómata por valor único", lambda: _clasificar_proc(col_act), args.repeat)
+    assert old.tolist() == new.tolist(), "clasificación distinta"
+    print(f"  speedup {t_old / t_new:.1f}x")
+
+    catalog = synthetic_catalog(args.catalog)
+    automaton = classify.KeywordAutomaton(catalog)
+    normalize = lambda act: _remove_accents(act.lower())  # noqa: E731
+    print(f"clasificación catálogo sintético ({len(catalog)} claves)")
+    (old, t_old) = timed("por fila", lambda: col_act.map(lambda a: legacy_classify(a, catalog)), args.repeat)
+    (new, t_new) = timed("autómata por valor único",
+                         lambda: classify.classify(col_act, automaton, normalize, "otro"), args.repeat)
+    assert old.tolist() == new.tolist(), "clasificación distinta (catálogo grande)"
+    print(f"  speedup {t_old / t_new:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# generators.py  (datos sintéticos con la forma de los archivos reales de bronze1)
+from __future__ import annotations
+
+import io
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = ["Ana", "Luis", "María", "José", "Camila", "Andrés", "Lucía", "Jorge", "Sofía", "Iván"]
+LAST_NAMES  = ["Gómez", "Pérez", "Rodríguez", "Martínez", "López", "Díaz", "Muñoz", "Rojas", "Ortiz", "Vargas"]
+ACTIVITIES  = [
+    "Ozonoterapia mayor", "Sueroterapia vitamina C", "Biopuntura lumbar", "Terapia Neural facial",
+    "Consulta de control", "OZONOTERAPIA MENOR", "Sueroterapía NAD+", "Valoración inicial",
+]
+DOCTORS     = ["Dr. Carlos Ruiz RM 12.345", "Dra. Paula León - RM: 67890", "Dr. Mario Sáenz", ""]
+MONTHS      = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio",
+               "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+MONTHLY_COLS = [
+    "Procedimiento", "Número de eventos", "Efectos adversos", "Utilidad promedio",
+    "Ingresos promedio por procedimiento",
+    "Equipo de promoción procedimientos menores", "Equipode promoción laboratorio",
+    "Equipo de promoción medicina estética", "Equipo de promoción exámenes diagnosticos complementarios",
+    "Equipo de crecimiento y calidad procedimientos menores", "Equipo de crecimiento y calidad laboratorio",
+    "Equipo de crecimiento y calidad medicina estética",
+    "Equipo de crecimiento y calidad exámenes diagnosticos complementarios",
+]
+
+
+def patient_names(n: int, seed: int = 0) -> List[tuple]:
+    """(primer nombre, segundo nombre, primer apellido, segundo apellido) estables por índice.
+
+    El i-ésimo nombre no depende de `n`, así pacientes y CUPS comparten personas.
+    """
+    f, l = len(FIRST_NAMES), len(LAST_NAMES)
+    out = []
+    for i in range(seed, seed + n):
+        out.append((FIRST_NAMES[i % f], FIRST_NAMES[(i // f + 3) % f] if i % 3 else "",
+                    LAST_NAMES[(i // f) % l], LAST_NAMES[(i // (f * l)) % l]))
+    return out
+
+
+def _full_name(parts: tuple) -> str:
+    return " ".join(p for p in parts if p)
+
+
+def patients_csv(rows: int, seed: int = 0, encoding: str = "utf-8", bad_lines: float = 0.001) -> bytes:
+    """CSV ';' como el export de pacientes (fechas d/m/Y, algunas líneas mal formadas)."""
+    rng = np.random.default_rng(seed + 1)
+    names = patient_names(rows, seed)
+    sexo = rng.choice(["F", "M", "", "0"], rows, p=[0.45, 0.45, 0.05, 0.05])
+    genero = np.where(rng.random(rows) < 0.3, "", np.where(sexo == "F", "femenino", "masculino"))
+    days, months = rng.integers(1, 29, rows), rng.integers(1, 13, rows)
+    years = rng.integers(2019, 2025, rows)
+    ages = rng.integers(18, 85, rows)
+
+    out = io.StringIO()
+    out.write("Id Paciente;Primer Nombre;Segundo Nombre;Primer Apellido;Segundo Apellido;"
+              "Sexo;Identidad de Género;Edad actual;Fecha Ingreso;Ciudad\n")
+    bad = rng.random(rows) < bad_lines
+    for i, (p1, p2, a1, a2) in enumerate(names):
+        out.write(f"{100000 + i};{p1};{p2};{a1};{a2};{sexo[i]};{genero[i]};{ages[i]} años;"
+                  f"{days[i]:02d}/{months[i]:02d}/{years[i]};Bogotá")
+        out.write(";extra;campos\n" if bad[i] else "\n")
+    return out.getvalue().encode(encoding)
+
+
+def cups_workbook(rows: int, seed: int = 0, patients: int = 1000) -> bytes:
+    """Libro .xlsx CUPS: encabezados con tildes, espacios, fechas 2023/2024 y filas vacías."""
+    rng = np.random.default_rng(seed + 100)
+    names = [_full_name(n).upper() for n in patient_names(patients, 0)]
+    pick = rng.integers(0, patients, rows)
+    days, months = rng.integers(1, 29, rows), rng.integers(1, 13, rows)
+    years = rng.choice([2023, 2024], rows)
+    df = pd.DataFrame({
+        "Fecha": [f"{d:02d}/{m:02d}/{y}" for d, m, y in zip(days, months, years)],
+        "Nombre del Paciente": [f" {names[i]} " for i in pick],
+        "Número de documento - Historia clínica": [str(100000 + i) for i in pick],
+        "Médico interno responsable": rng.choice(DOCTORS, rows),
+        "Médico externo responsable": np.where(rng.random(rows) < 0.7, "", "Dr. Externo"),
+        "Promotor de salud": np.where(rng.random(rows) < 0.6, "", "Promotor 1"),
+        "Actividad/Servicio": rng.choice(ACTIVITIES, rows),
+    })
+    empty = rng.random(rows) < 0.01
+    df.loc[empty, ["Nombre del Paciente", "Número de documento - Historia clínica", "Actividad/Servicio"]] = None
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False, engine="openpyxl")
+    return buf.getvalue()
+
+
+def monthly_workbook(rows_per_sheet: int, seed: int = 0, extra_sheets: int = 1) -> bytes:
+    """Libro con 12 pestañas "<Mes> 2024", fila de totales y pestañas ajenas."""
+    rng = np.random.default_rng(seed + 200)
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        for i in range(extra_sheets):
+            pd.DataFrame({"Resumen": ["anual"]}).to_excel(writer, sheet_name=f"Resumen {i + 1}", index=False)
+        for month in MONTHS:
+            data = {
+                "Procedimiento": rng.choice(ACTIVITIES, rows_per_sheet),
+                "Número de eventos": rng.integers(0, 200, rows_per_sheet).astype(str),
+                "Efectos adversos": rng.integers(0, 5, rows_per_sheet).astype(str),
+                "Utilidad promedio": rng.integers(50_000, 500_000, rows_per_sheet).astype(str),
+                "Ingresos promedio por procedimiento": rng.integers(100_000, 900_000, rows_per_sheet).astype(str),
+            }
+            for col in MONTHLY_COLS[5:]:
+                data[col] = [f"Equipo {month}"] + [None] * (rows_per_sheet - 1)
+            df = pd.DataFrame(data, columns=MONTHLY_COLS)
+            totals = pd.DataFrame([["Numero total de eventos"] + [""] * (len(MONTHLY_COLS) - 1),
+                                   ["Notas"] + [""] * (len(MONTHLY_COLS) - 1)], columns=MONTHLY_COLS)
+            pd.concat([df, totals]).to_excel(writer, sheet_name=f"{month} 2024", index=False)
+    return buf.getvalue()
@@ -0,0 +1,97 @@
+# profile_imports.py  (tiempo de import de cada handler: lo que paga el init de la Lambda)
+#
+#   python py/benchmarks/profile_imports.py                      # tabla por paquete + imports más caros
+#   python py/benchmarks/profile_imports.py --save init.json     # guardar línea base del deploy
+#   python py/benchmarks/profile_imports.py --baseline init.json # falla si el init creció
+#
+# Cada medición es un intérprete nuevo con `python -X importtime -c "import lambda_function"`
+# desde el directorio del paquete, con py/shared en el path como en el zip (así se ve un
+# arranque en frío, sin caché de módulos).
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from statistics import median
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PY = os.path.dirname(HERE)
+PACKAGES = {
+    "transform": os.path.join(PY, "lambda_function_transform"),
+    "quality": os.path.join(PY, "lambda_function_quality"),
+    "glue_tables": os.path.join(PY, "lambda_tables_glue"),
+}
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(directory: str, module: str = "lambda_function") -> dict:
+    """{"total_ms", "top": [(módulo de primer nivel, ms acumulados)]} de un arranque en frío."""
+    env = {**os.environ, "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+           "PYTHONDONTWRITEBYTECODE": "1", "PYTHONPATH": os.path.join(PY, "shared")}   # como en el zip
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=directory, env=env, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    total, top = 0.0, []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        cumulative, depth, name = int(m.group(2)) / 1000, len(m.group(3)) // 2, m.group(4)
+        if name == module and depth == 0:
+            total = cumulative
+        elif depth == 1:   # imports directos del handler
+            top.append((name, cumulative))
+    return {"total_ms": total, "top": sorted(top, key=lambda kv: -kv[1])}
+
+
+def run(repeat: int) -> Dict[str, dict]:
+    results = {}
+    for name, directory in PACKAGES.items():
+        samples = [profile(directory) for _ in range(repeat)]
+        results[name] = {"total_ms": median(s["total_ms"] for s in samples), "top": samples[-1]["top"]}
+    return results
+
+
+def compare(results: Dict[str, dict], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path, encoding="utf-8") as fh:
+        baseline = json.load(fh)["packages"]
+    return [
+        f"{name}: {baseline[name]['total_ms']:.0f} ms → {m['total_ms']:.0f} ms"
+        for name, m in results.items()
+        if name in baseline and m["total_ms"] > baseline[name]["total_ms"] * (1 + tolerance)
+    ]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tiempo de import (init) de los handlers Lambda")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="imports directos más caros por paquete")
+    parser.add_argument("--save", help="escribe los resultados como JSON (línea base)")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="aumento permitido (0.25 = +25%%)")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    print(f"{'paquete':<13}{'init ms':>9}   imports más caros")
+    for name, m in results.items():
+        heavy = ", ".join(f"{mod} {ms:.0f}" for mod, ms in m["top"][:args.top])
+        print(f"{name:<13}{m['total_ms']:>9.0f}   {heavy}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump({"python": sys.version.split()[0], "packages": results}, fh, indent=2)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESIÓN", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
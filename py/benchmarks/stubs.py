@@ -0,0 +1,211 @@
+# stubs.py  (S3 / Glue / Lambda en memoria para correr los flujos sin AWS)
+#
+# S3 es storage.MemoryStore (el mismo backend "memory" de las Lambdas) con contadores
+# de llamadas y bytes para la tabla del benchmark.
+from __future__ import annotations
+
+import io
+import json
+import os
+import sys
+import threading
+from collections import Counter
+
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+import storage  # noqa: E402
+
+
+class CountingStore(storage.MemoryStore):
+    """storage.MemoryStore que además cuenta llamadas y bytes transferidos.
+
+    `bytes_in` son bytes leídos por el cliente, `bytes_out` bytes subidos y
+    `bytes_copied` bytes copiados del lado del servidor (copy_object). Las llamadas
+    internas del backend (p. ej. el get_object de copy_object) no se cuentan.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls: Counter = Counter()
+        self.bytes_in = self.bytes_out = self.bytes_copied = 0
+        self._inner = threading.local()
+
+    # ---- contadores -----------------------------------------------------
+    def _count(self, op: str, bytes_in: int = 0, bytes_out: int = 0, copied: int = 0) -> None:
+        with self._lock:
+            self.calls[op] += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.bytes_copied += copied
+
+    def counters(self) -> dict:
+        with self._lock:
+            return {"requests": sum(self.calls.values()), "bytes_in": self.bytes_in,
+                    "bytes_out": self.bytes_out, "bytes_copied": self.bytes_copied}
+
+    def seed(self, bucket: str, key: str, body: bytes) -> None:
+        """Carga un objeto sin contarlo como tráfico."""
+        super().put_object(Bucket=bucket, Key=key, Body=body)
+
+    def body(self, bucket: str, key: str) -> bytes:
+        return self.objects[(bucket, key)][0]
+
+    def _call(self, op: str, method, kwargs: dict, measure=None):
+        """Ejecuta `method` y la cuenta solo si no es una llamada anidada del backend."""
+        outer = not getattr(self._inner, "active", False)
+        self._inner.active = True
+        try:
+            out = method(**kwargs)
+        finally:
+            if outer:
+                self._inner.active = False
+        if outer:
+            self._count(op, **(measure(out) if measure else {}))
+        return out
+
+    def _size(self, bucket: str, key: str) -> int:
+        return (self._stat(bucket, key) or {"Size": 0})["Size"]
+
+    # ---- API S3 (contada) -------------------------------------------------
+    def get_paginator(self, name: str):
+        self._count(name)
+        return super().get_paginator(name)
+
+    def head_object(self, **kw) -> dict:
+        return self._call("head_object", super().head_object, kw)
+
+    def get_object(self, **kw) -> dict:
+        return self._call("get_object", super().get_object, kw, lambda out: {"bytes_in": out["ContentLength"]})
+
+    def open(self, **kw):
+        return self._call("get_object", super().open, kw,
+                          lambda out: {"bytes_in": self._size(kw["Bucket"], kw["Key"])})
+
+    def put_object(self, **kw) -> dict:
+        return self._call("put_object", super().put_object, kw,
+                          lambda out: {"bytes_out": self._size(kw["Bucket"], kw["Key"])})
+
+    def copy_object(self, **kw) -> dict:
+        return self._call("copy_object", super().copy_object, kw,
+                          lambda out: {"copied": self._size(kw["Bucket"], kw["Key"])})
+
+    def delete_object(self, **kw) -> dict:
+        return self._call("delete_object", super().delete_object, kw)
+
+    def delete_objects(self, **kw) -> dict:
+        return self._call("delete_objects", super().delete_objects, kw)
+
+    def create_multipart_upload(self, **kw) -> dict:
+        return self._call("create_multipart_upload", super().create_multipart_upload, kw)
+
+    def _part_size(self, kw: dict) -> int:
+        return len(self._uploads[kw["UploadId"]]["parts"][kw["PartNumber"]][0])
+
+    def upload_part(self, **kw) -> dict:
+        return self._call("upload_part", super().upload_part, kw, lambda out: {"bytes_out": self._part_size(kw)})
+
+    def upload_part_copy(self, **kw) -> dict:
+        return self._call("upload_part_copy", super().upload_part_copy, kw,
+                          lambda out: {"copied": self._part_size(kw)})
+
+    def complete_multipart_upload(self, **kw) -> dict:
+        return self._call("complete_multipart_upload", super().complete_multipart_upload, kw)
+
+    def abort_multipart_upload(self, **kw) -> dict:
+        return self._call("abort_multipart_upload", super().abort_multipart_upload, kw)
+
+
+class _GlueExceptions:
+    class EntityNotFoundException(ClientError):
+        def __init__(self, name: str):
+            super().__init__({"Error": {"Code": "EntityNotFoundException", "Message": name}}, "Get")
+
+
+class InMemoryGlue:
+    """Glue en memoria: registra las llamadas; bases, crawlers y tablas se crean a demanda."""
+
+    exceptions = _GlueExceptions
+
+    def __init__(self, databases=(), crawlers=()):
+        self.databases, self.crawlers = set(databases), set(crawlers)
+        self.calls: Counter = Counter()
+        self.job_runs: list = []
+        self.tables: dict = {}       # (db, tabla) → TableInput
+        self.partitions: dict = {}   # (db, tabla) → {valores}
+        self._lock = threading.Lock()
+
+    def start_job_run(self, JobName: str, **kwargs) -> dict:
+        self.calls["start_job_run"] += 1
+        self.job_runs.append({"JobName": JobName, **kwargs})
+        return {"JobRunId": f"jr_{len(self.job_runs):04d}"}
+
+    def get_job_runs(self, JobName: str, **_) -> dict:
+        self.calls["get_job_runs"] += 1
+        return {"JobRuns": [{"Id": f"jr_{i + 1:04d}", "JobRunState": run.get("JobRunState", "SUCCEEDED")}
+                            for i, run in enumerate(self.job_runs) if run["JobName"] == JobName][::-1]}
+
+    def get_database(self, Name: str, **_) -> dict:
+        self.calls["get_database"] += 1
+        if Name not in self.databases:
+            raise _GlueExceptions.EntityNotFoundException(Name)
+        return {"Database": {"Name": Name}}
+
+    def get_crawler(self, Name: str, **_) -> dict:
+        self.calls["get_crawler"] += 1
+        if Name not in self.crawlers:
+            raise _GlueExceptions.EntityNotFoundException(Name)
+        return {"Crawler": {"Name": Name, "State": "READY"}}
+
+    def get_table(self, DatabaseName: str, Name: str, **_) -> dict:
+        self.calls["get_table"] += 1
+        table = self.tables.get((DatabaseName, Name))
+        if table is None:
+            raise _GlueExceptions.EntityNotFoundException(Name)
+        return {"Table": {**table, "DatabaseName": DatabaseName}}
+
+    def create_table(self, DatabaseName: str, TableInput: dict, **_) -> dict:
+        self.calls["create_table"] += 1
+        with self._lock:
+            self.tables[(DatabaseName, TableInput["Name"])] = TableInput
+        return {}
+
+    def update_table(self, DatabaseName: str, TableInput: dict, **_) -> dict:
+        self.calls["update_table"] += 1
+        if (DatabaseName, TableInput["Name"]) not in self.tables:
+            raise _GlueExceptions.EntityNotFoundException(TableInput["Name"])
+        with self._lock:
+            self.tables[(DatabaseName, TableInput["Name"])] = TableInput
+        return {}
+
+    def batch_create_partition(self, DatabaseName: str, TableName: str, PartitionInputList: list, **_) -> dict:
+        self.calls["batch_create_partition"] += 1
+        errors = []
+        with self._lock:
+            existing = self.partitions.setdefault((DatabaseName, TableName), set())
+            for part in PartitionInputList:
+                values = tuple(part["Values"])
+                if values in existing:
+                    errors.append({"PartitionValues": list(values),
+                                   "ErrorDetail": {"ErrorCode": "AlreadyExistsException"}})
+                existing.add(values)
+        return {"Errors": errors} if errors else {}
+
+
+class InMemoryLambda:
+    def __init__(self):
+        self.invocations: list = []
+
+    def invoke(self, FunctionName: str, Payload=b"{}", **_) -> dict:
+        self.invocations.append(FunctionName)
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps({"status": "SUCCESS"}).encode())}
+
+
+def client_factory(s3: CountingStore, glue: InMemoryGlue, lambda_client: InMemoryLambda | None = None):
+    """Reemplazo de boto3.client que devuelve los stubs según el servicio."""
+    clients = {"s3": s3, "glue": glue, "lambda": lambda_client or InMemoryLambda()}
+
+    def client(service: str, *args, **kwargs):
+        return clients[service]
+
+    return client
@@ -0,0 +1,154 @@
+# test_spark_parity.py  (paridad del job de predicción: modo pandas vs. Spark local)
+#
+#   python -m pytest py/benchmarks/test_spark_parity.py
+#   python py/benchmarks/test_spark_parity.py
+#
+# Siembra un lago local pequeño (documentos, nombres exactos, variantes difusas, empates
+# de similitud, documentos que el nombre contradice y un bloque de más de MAX_BLOCK
+# nombres) y compara PatientIndex.match / build_training_set con spark_load /
+# spark_match / spark_training_set sobre master("local[2]"). Sin pyspark o sin Java
+# se omite: hasta que pase, el template despliega --EXECUTION_MODE pandas.
+from __future__ import annotations
+
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import boto3  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import bench_pipeline  # noqa: E402
+import storage  # noqa: E402  (py/shared, vía stubs)
+import stubs  # noqa: E402
+
+SPARK = importlib.util.find_spec("pyspark") is not None and (
+    shutil.which("java") is not None or bool(os.environ.get("JAVA_HOME")))
+
+BIG_SURNAME = "Garcia"   # token compartido por más de MAX_BLOCK nombres
+FIRST = ["Ana", "Luis", "Maria", "Jose", "Camila", "Andres", "Lucia", "Jorge", "Sofia", "Ivan",
+         "Pedro", "Marta", "Diego", "Laura", "Pablo", "Elena", "Hugo", "Rosa", "Tomas", "Irene"]
+LAST = ["Gomez", "Perez", "Rodriguez", "Martinez", "Lopez", "Diaz", "Munoz", "Rojas", "Ortiz", "Vargas",
+        "Castro", "Suarez", "Rincon", "Herrera", "Salazar", "Mendoza", "Cardenas", "Quintero", "Arias", "Pineda"]
+TIPOS = ["ozonoterapia", "sueroterapia", "biopuntura", "terapia neural"]
+
+
+def _typo(name: str, rng) -> str:
+    """Una sustitución de letra fuera de la primera de cada palabra."""
+    chars = list(name)
+    spots = [i for i, c in enumerate(chars) if c.isalpha() and i > 0 and chars[i - 1] != " "]
+    i = spots[rng.integers(len(spots))]
+    chars[i] = "x" if chars[i] != "x" else "z"
+    return "".join(chars)
+
+
+def fixture(seed: int = 3) -> tuple:
+    """(pacientes.csv ';', procedimientos.csv ',') como los escribe gold1."""
+    rng = np.random.default_rng(seed)
+    patients = [
+        ("P0", "Ana María Pérez", "femenino", "34 años", "00123"),
+        ("P1", "Juan Carlos Gómez Ruiz", "masculino", "51", "456"),
+        ("P2", "Juan Carlos Gómez Ruiz", "masculino", "52", "789"),        # nombre repetido
+        ("P3", "Camilo Torres Ba", "masculino", "40", ""),
+        ("P4", "Camilo Torres Bc", "masculino", "41", ""),                 # empate con P3
+        ("P5", "Lina Mora", "", "29", "1000"),                             # sin género
+        ("P6", "Oscar Ruiz Lara", "masculino", "", "2000"),                # sin edad
+        ("P7", "Beatriz Salas Nieto", "femenino", "63", "0000"),           # documento vacío
+    ]
+    for i in range(620):   # bloque BIG_SURNAME > MAX_BLOCK
+        patients.append((f"G{i}", f"{FIRST[i % 20]} {LAST[i // 20 % 20]} {BIG_SURNAME} {LAST[(i // 400 + i) % 20]}",
+                         rng.choice(["femenino", "masculino", ""]), f"{rng.integers(18, 85)} años",
+                         str(3000 + i) if i % 4 else ""))
+    for i in range(200):   # nombres sin el apellido común
+        patients.append((f"N{i}", f"{FIRST[i % 20]} {LAST[(i * 3) % 20]} {LAST[(i * 11 + 5) % 20]}",
+                         rng.choice(["femenino", "masculino"]), str(rng.integers(18, 85)), str(9000 + i)))
+
+    procs = [
+        ("01/01/2024", "Ana Maria Perez", "123", "ozonoterapia"),                 # documento + nombre
+        ("02/01/2024", "Pedro Infante", "456", "biopuntura"),                     # documento contradicho
+        ("03/01/2024", "JUAN CARLOS GOMEZ RUIZ", "", "sueroterapia"),             # exacto → P1
+        ("04/01/2024", "Camilo Torres Bx", "", "terapia neural"),                 # empate → P3
+        ("05/01/2024", "Lina Mora", "1000", "ozonoterapia"),
+        ("06/01/2024", "Oscar Ruiz Lara", "2000", "biopuntura"),
+        ("07/01/2024", "Beatriz Salas Nieto", "0", "sueroterapia"),
+        ("08/01/2024", "", "", "ozonoterapia"),                                   # sin nombre
+        ("09/01/2024", "Ana María Pérez", "123", ""),                             # sin tipo
+        ("10/01/2024", "Nadie Conocido Jamas", "", "biopuntura"),
+    ]
+    pool = [p[1] for p in patients[8:]]
+    for i in range(400):
+        name = pool[rng.integers(len(pool))]
+        kind = rng.integers(3)
+        shown = name if kind == 0 else _typo(name, rng) if kind == 1 else name.upper()
+        procs.append((f"{1 + i % 28:02d}/02/2024", shown, "", TIPOS[rng.integers(len(TIPOS))]))
+
+    pat = pd.DataFrame(patients, columns=["Id Paciente", "nombre_completo", "genero", "Edad actual",
+                                          "NUMERO DE DOCUMENTO"])
+    proc = pd.DataFrame(procs, columns=["fecha", "nombre del paciente",
+                                        "numero de documento - historia clinica", "tipo de procedimiento"])
+    return (pat.to_csv(sep=";", index=False).encode("utf-8-sig"),
+            proc.to_csv(index=False).encode("utf-8"))
+
+
+class SparkParity(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        boto3.client = stubs.client_factory(stubs.CountingStore(), stubs.InMemoryGlue())
+        cls.lake = tempfile.mkdtemp(prefix="parity_lake_")
+        cls.glue = glue = bench_pipeline._load_glue_job()
+        glue.STORAGE_ROOT = "file://" + cls.lake + "/"
+        glue.s3 = storage.LocalStore(cls.lake)
+        pat_csv, proc_csv = fixture()
+        glue.s3.put_object(Bucket=glue.BUCKET, Key=glue.PATIENTS_KEY, Body=pat_csv)
+        glue.s3.put_object(Bucket=glue.BUCKET, Key=glue.PROCS_PREFIX + "procedimientos_fixture.csv", Body=proc_csv)
+
+        df_pat, cls.df_proc = glue.load_patients_and_procs(full_rebuild=True)
+        cls.index = glue.PatientIndex(df_pat)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.lake, ignore_errors=True)
+
+    def pandas_matches(self) -> list:
+        pos = self.index.match(self.df_proc["name_norm"], self.df_proc.get(self.glue.PROC_DOC_COL))
+        ids = self.index.patients["Id Paciente"].astype(str).to_numpy()
+        return [ids[p] if p >= 0 else None for p in pos]
+
+    def test_fixture_exercises_every_step(self):
+        """El fixture cubre documento, exacto, difuso, empate, contradicción y bloque grande."""
+        matches = self.pandas_matches()
+        self.assertEqual(matches[:4], ["P0", None, "P1", "P3"])
+        self.assertGreater(max(map(len, self.index.blocks.values())), self.glue.MAX_BLOCK)
+        self.assertGreater(sum(m is not None for m in matches[10:]), 300)
+
+    @unittest.skipUnless(SPARK, "requiere pyspark y Java")
+    def test_match_and_training_set(self):
+        from pyspark.sql import SparkSession, functions as F
+        glue = self.glue
+        SparkSession.builder.master("local[2]").appName("parity").getOrCreate()
+        spark = glue.spark_session()   # getOrCreate: reutiliza la sesión local con la conf del job
+        try:
+            patients, procs = glue.spark_load(spark)
+            matched = glue.spark_match(patients, procs)
+            ids = patients.select("_pat", F.col("`Id Paciente`").alias("pat_id"))
+            got = (matched.join(ids, "_pat", "left").orderBy("_proc")
+                   .select("pat_id").toPandas()["pat_id"].tolist())
+            self.assertEqual([g if isinstance(g, str) else None for g in got], self.pandas_matches())
+
+            want = glue.build_training_set(self.index, self.df_proc)
+            cols = glue.FEATURE_COLS + [glue.TARGET_COL]
+            have = glue.spark_training_set(patients, matched)
+            pd.testing.assert_frame_equal(have[cols].reset_index(drop=True).astype(str),
+                                          want[cols].reset_index(drop=True).astype(str))
+        finally:
+            spark.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# build_packages.py  (arma los zip de despliegue: código del paquete + módulos de py/shared)
+#
+#   python py/build_packages.py                                # todos los paquetes
+#   python py/build_packages.py lambda_function_quality        # solo uno
+#
+# Los módulos comunes (storage, runtime, metrics, catalog, naming, parquet_writer, s3_move,
+# s3_stream) tienen una sola fuente en py/shared y se copian a la raíz de cada zip al
+# construirlo; build() falla si un paquete trae su propia copia.
+# Los zip resultantes se suben a PyLambda/ (Lambdas) y PyGlue/ (job de Glue, --extra-py-files).
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import zipfile
+
+PY = os.path.dirname(os.path.abspath(__file__))
+SHARED_DIR = os.path.join(PY, "shared")
+PACKAGES = ("lambda_function_transform", "lambda_function_quality", "glue_prediction_pacientes")
+
+
+def _modules(directory: str) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith(".py"))
+
+
+def build(package: str, out_dir: str = PY) -> str:
+    """Escribe <out_dir>/<paquete>.zip y devuelve su ruta."""
+    source = os.path.join(PY, package)
+    own = _modules(source)
+    clash = set(own) & set(_modules(SHARED_DIR))
+    if clash:
+        raise RuntimeError(f"{package} tiene copias propias de módulos compartidos: {sorted(clash)}")
+    path = os.path.join(out_dir, f"{package}.zip")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for directory, names in ((source, own), (SHARED_DIR, _modules(SHARED_DIR))):
+            for name in names:
+                zf.write(os.path.join(directory, name), arcname=name)
+    return path
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Zips de despliegue de las Lambdas y el job de Glue")
+    parser.add_argument("packages", nargs="*", help=f"paquetes a construir (todos: {', '.join(PACKAGES)})")
+    parser.add_argument("--out", default=PY, help="directorio de salida de los zip")
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.packages) - set(PACKAGES))
+    if unknown:
+        parser.error(f"paquetes desconocidos: {unknown}")
+    for package in args.packages or PACKAGES:
+        print(build(package, args.out))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,12 @@
-import io, json, re, unicodedata, logging, boto3
+import hashlib, importlib.util, io, json, os, re, sys, unicodedata, logging, boto3
+from collections import defaultdict
+from functools import reduce
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
 import pandas as pd
 import numpy as np
+import joblib
+import sklearn
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.compose import ColumnTransformer
@@ -12,6 +18,16 @@ from sklearn.metrics import accuracy_score, classification_report
 logger = logging.getLogger("glue-logreg")
 logger.setLevel(logging.INFO)
 
+def job_arg(name: str, default: str = "") -> str:
+    """Lee un argumento opcional del job (--NAME valor); getResolvedOptions exige que exista."""
+    opt = f"--{name}"
+    if opt in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(opt) + 1]
+    return default
+
+def job_flag(name: str) -> bool:
+    return job_arg(name, "false").lower() in {"1", "true", "yes"}
+
 REGION        = "us-east-1"
 DB_NAME       = "smes_analytics"
 GLUE_ROLE_ARN = "arn:aws:iam::#cuenta:role/glue_service_role_for_crawlers"
@@ -24,26 +40,70 @@ OUTPUT_BUCKET      = "serverless-architecture-smes-analytics-predictive"
 OUTPUT_KEY         = "prediction/recomendacion_procedimientos/recomendacion.csv"
 RECOMENDACION_PATH = f"s3://{OUTPUT_BUCKET}/prediction/recomendacion_procedimientos/"
 
+# Salida columnar (Parquet) por dataset: --FORMAT_<DATASET> parquet|csv
+PATIENTS_PARQUET_KEY  = "gold1/parquet/pacientes/pacientes.parquet"
+PROCS_PARQUET_PREFIX  = "gold1/parquet/procedimientos/"
+OUTPUT_PARQUET_KEY    = "prediction/parquet/recomendacion_pacientes/recomendacion.parquet"
+RECOMENDACION_PARQUET_PATH = f"s3://{OUTPUT_BUCKET}/prediction/parquet/recomendacion_pacientes/"
+
+# Snapshot columnar de procedimientos ya ingeridos + manifiesto (key → ETag)
+PROCS_SNAPSHOT_KEY = "state/procedimientos/snapshot.parquet"
+PROCS_MANIFEST_KEY = "state/procedimientos/manifest.json"
+SOURCE_KEY_COL     = "_source_key"
+
+# Manifiesto de la compactación de LambdaQuality (generación publicada + entradas retiradas)
+COMPACTION_STATE_KEY = "state/compaction/procedimientos.json"
+COMPACT_GEN_RE       = re.compile(r"procedimientos_compact_[^/]*_g(\d+)-[0-9a-f]{8}-\d+\.(?:csv|parquet)$")
+
+# Registro de modelos: un artefacto por huella de los datos de entrenamiento
+MODEL_PREFIX  = "models/prediction_pacientes/"
+MODEL_VERSION = "logreg-genero-edad-v1"    # cambiarla al tocar features o hiperparámetros
+FEATURE_COLS  = ["genero", "age_years"]
+TARGET_COL    = "tipo de procedimiento"
+SCORE_BATCH   = int(job_arg("SCORE_BATCH", "50000"))
+
+# Ejecución: "pandas" (todo en el driver), "spark" (executors) o "auto" (spark si la entrada es grande)
+EXECUTION_MODE  = job_arg("EXECUTION_MODE", "auto").lower()
+SPARK_MIN_BYTES = int(job_arg("SPARK_MIN_BYTES", str(256 * 1024 ** 2)))
+STORAGE_ROOT    = job_arg("STORAGE_ROOT", "s3://")   # Spark local: file:///tmp/lake/ (un directorio por bucket)
+
 DATASETS = {
     "pacientes": {
         "path": "s3://serverless-architecture-smes-analytics-gold-zone/gold1/pacientes/",
         "classifiers": ["csv_semicolon"],
+        "format": job_arg("FORMAT_PACIENTES", "csv"),
     },
     "procedimientos": {
         "path": "s3://serverless-architecture-smes-analytics-gold-zone/gold1/procedimientos/",
         "classifiers": ["csv_comma"],
+        "format": job_arg("FORMAT_PROCEDIMIENTOS", "csv"),
     },
     "recomendacion_pacientes": {
         "path": RECOMENDACION_PATH,
         "classifiers": ["csv_comma"],
+        "format": job_arg("FORMAT_RECOMENDACION_PACIENTES", "csv"),
+        "parquet_path": RECOMENDACION_PARQUET_PATH,
     },
     "consolidado_procedimientos": {
         "path": "s3://serverless-architecture-smes-analytics-gold-zone/gold1/mensual_proc/",
         "classifiers": ["csv_semicolon"],
+        "format": job_arg("FORMAT_CONSOLIDADO_PROCEDIMIENTOS", "csv"),
     },
 }
 
-s3 = boto3.client("s3")
+def offline() -> bool:
+    """--STORAGE_ROOT file:///…: backfill local, sin S3 ni Glue Data Catalog."""
+    return not STORAGE_ROOT.startswith("s3://")
+
+# Módulos de py/shared: en Glue llegan en el zip del job (--extra-py-files, build_packages.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+import catalog
+import storage
+
+if offline():
+    s3 = storage.LocalStore(STORAGE_ROOT)
+else:
+    s3 = boto3.client("s3")
 glue = boto3.client("glue", region_name=REGION)
 lambda_client = boto3.client("lambda", region_name=REGION)
 
@@ -53,34 +113,270 @@ def normalize_name(name: str) -> str:
     n = unicodedata.normalize("NFD", str(name).strip().upper())
     return "".join(c for c in n if unicodedata.category(c) != "Mn")
 
+def normalize_names(values: pd.Series) -> pd.Series:
+    """normalize_name por valor único (los nombres se repiten mucho)."""
+    codes, uniques = pd.factorize(values)
+    mapped = np.array([normalize_name(u) for u in uniques] + [""], dtype=object)
+    return pd.Series(mapped[codes], index=values.index)      # código -1 (NaN) → ""
+
 def age_to_years(raw):
     if pd.isna(raw): return np.nan
     m = re.search(r"(\d+)", str(raw))
     return float(m.group(1)) if m else np.nan
 
-def read_csv_from_s3(key: str, delimiter: str = ",") -> pd.DataFrame:
-    obj = s3.get_object(Bucket=BUCKET, Key=key)
-    return pd.read_csv(io.BytesIO(obj["Body"].read()), encoding="utf-8-sig", delimiter=delimiter)
+def open_object(bucket: str, key: str):
+    """Archivo legible sobre un objeto: mmap en el backend local, BytesIO en S3."""
+    opener = getattr(s3, "open", None)
+    if opener is not None:
+        return opener(Bucket=bucket, Key=key)
+    return io.BytesIO(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
 
-def load_patients_and_procs():
-    df_pat = read_csv_from_s3(PATIENTS_KEY, delimiter=";")
-    df_pat["name_norm"] = df_pat["nombre_completo"].apply(normalize_name)
-    df_pat["age_years"] = df_pat["Edad actual"].apply(age_to_years)
+def read_csv_from_s3(key: str, delimiter: str = ",", dtype=None) -> pd.DataFrame:
+    with open_object(BUCKET, key) as body:
+        return pd.read_csv(body, encoding="utf-8-sig", delimiter=delimiter, dtype=dtype)
+
+def read_parquet_from_s3(key: str) -> pd.DataFrame:
+    with open_object(BUCKET, key) as body:
+        return pd.read_parquet(body)
+
+def read_proc_object(key: str) -> pd.DataFrame:
+    """Lee un archivo gold de procedimientos (CSV o Parquet) como texto, igual que el CSV."""
+    if not key.endswith(".parquet"):
+        return read_csv_from_s3(key, dtype=str)
+    df = read_parquet_from_s3(key)
+    if "fecha" in df.columns:
+        df["fecha"] = pd.to_datetime(df["fecha"]).dt.strftime("%d/%m/%Y")
+    return df.astype(object).where(df.notna(), np.nan)
+
+# ───────────────────── Carga incremental de procedimientos ---------------------
+def compaction_state() -> dict:
+    try:
+        return json.loads(s3.get_object(Bucket=BUCKET, Key=COMPACTION_STATE_KEY)["Body"].read())
+    except s3.exceptions.NoSuchKey:
+        return {}
+
+def list_proc_objects() -> dict:
+    """{key: etag} de los CSV bajo PROCS_PREFIX y los Parquet bajo PROCS_PARQUET_PREFIX.
+
+    Omite lo que la compactación ya retiró y sus salidas aún no publicadas, así una
+    compactación a medio camino no duplica ni pierde filas.
+    """
+    state = compaction_state()
+    retired, published = set(state.get("retired", [])), state.get("generation", 0)
+
+    def visible(key: str) -> bool:
+        m = COMPACT_GEN_RE.search(key)
+        return key not in retired and (int(m.group(1)) if m else 0) <= published
 
     paginator = s3.get_paginator("list_objects_v2")
+    return {
+        obj["Key"]: obj["ETag"]
+        for prefix, ext in ((PROCS_PREFIX, ".csv"), (PROCS_PARQUET_PREFIX, ".parquet"))
+        for page in paginator.paginate(Bucket=BUCKET, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(ext) and visible(obj["Key"])
+    }
+
+def read_procs_state():
+    """Devuelve (manifiesto, snapshot) o ({}, None) si aún no existen."""
+    try:
+        raw = s3.get_object(Bucket=OUTPUT_BUCKET, Key=PROCS_MANIFEST_KEY)["Body"].read()
+        manifest = json.loads(raw)["objects"]
+        body = s3.get_object(Bucket=OUTPUT_BUCKET, Key=PROCS_SNAPSHOT_KEY)["Body"].read()
+    except s3.exceptions.NoSuchKey:
+        return {}, None
+    return manifest, pd.read_parquet(io.BytesIO(body))
+
+def write_procs_state(manifest: dict, snapshot: pd.DataFrame):
+    """Escribe primero el snapshot y luego el manifiesto (punto de commit).
+
+    Si el job muere entre los dos PUT queda un snapshot más nuevo que el manifiesto:
+    load_procs_incremental solo confía en las filas de objetos que el manifiesto registra.
+    """
+    buf = io.BytesIO()
+    snapshot.to_parquet(buf, index=False, compression="snappy")
+    s3.put_object(Bucket=OUTPUT_BUCKET, Key=PROCS_SNAPSHOT_KEY, Body=buf.getvalue())
+    s3.put_object(
+        Bucket=OUTPUT_BUCKET,
+        Key=PROCS_MANIFEST_KEY,
+        Body=json.dumps({
+            "objects": manifest,
+            "rows": len(snapshot),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+def load_procs_incremental(full_rebuild: bool = False) -> pd.DataFrame:
+    """Lee solo los CSV nuevos o modificados y los fusiona con el snapshot."""
+    current = list_proc_objects()
+    manifest, snapshot = ({}, None) if full_rebuild else read_procs_state()
+
+    stale = {k for k, etag in manifest.items() if current.get(k) != etag}
+    new_keys = [k for k, etag in current.items() if manifest.get(k) != etag]
+    logger.info("Procedimientos: %d en snapshot, %d nuevos, %d obsoletos%s",
+                len(manifest) - len(stale), len(new_keys), len(stale),
+                " (reconstrucción completa)" if full_rebuild else "")
+
     frames = []
-    for page in paginator.paginate(Bucket=BUCKET, Prefix=PROCS_PREFIX):
-        for obj in page.get("Contents", []):
-            if obj["Key"].endswith(".csv"):
-                frames.append(read_csv_from_s3(obj["Key"]))
+    if snapshot is not None:   # solo filas de objetos confirmados por el manifiesto
+        frames.append(snapshot[snapshot[SOURCE_KEY_COL].isin(set(manifest) - stale)])
+    for key in new_keys:
+        df = read_proc_object(key)
+        df[SOURCE_KEY_COL] = key
+        frames.append(df)
+    if not frames:
+        raise ValueError(f"No hay procedimientos en s3://{BUCKET}/{PROCS_PREFIX}")
     df_proc = pd.concat(frames, ignore_index=True)
-    df_proc["name_norm"] = df_proc["nombre del paciente"].apply(normalize_name)
+
+    if new_keys or stale:
+        write_procs_state(current, df_proc)
+    return df_proc
+
+def load_patients_and_procs(full_rebuild: bool = False):
+    if DATASETS["pacientes"]["format"] == "parquet":
+        df_pat = read_parquet_from_s3(PATIENTS_PARQUET_KEY)
+    else:
+        df_pat = read_csv_from_s3(PATIENTS_KEY, delimiter=";")
+    df_pat["name_norm"] = normalize_names(df_pat["nombre_completo"])
+    df_pat["age_years"] = df_pat["Edad actual"].apply(age_to_years)
+
+    df_proc = load_procs_incremental(full_rebuild=full_rebuild)
+    df_proc["name_norm"] = normalize_names(df_proc["nombre del paciente"])
     return df_pat, df_proc
 
+# ───────────────────── Índice de pacientes -------------------------------------
+MATCH_THRESHOLD = float(job_arg("MATCH_THRESHOLD", "0.9"))  # similitud mínima del cruce difuso
+DOC_NAME_MIN    = 0.8     # el documento solo cuenta si el nombre también coincide
+MAX_BLOCK       = 500     # bloques más grandes no discriminan: se ignoran (igual en Spark)
+PROC_DOC_COL    = "numero de documento - historia clinica"
+PAT_DOC_COLS    = ("NUMERO DE DOCUMENTO", "NUMERO DOCUMENTO", "DOCUMENTO", "HISTORIA CLINICA")
+_NOT_CONSONANT  = str.maketrans("", "", "AEIOUYHW")
+
+def doc_keys(values: pd.Series) -> pd.Series:
+    """Documento como clave: solo dígitos, sin ceros a la izquierda; vacío → NA."""
+    if pd.api.types.is_float_dtype(values):   # CSV leído sin dtype: 123 → 123.0, no "1230"
+        values = values.round().astype("Int64")
+    digits = values.astype("string").str.replace(r"\D", "", regex=True).str.lstrip("0")
+    return digits.mask(digits == "")
+
+def _sorted_tokens(name: str) -> str:
+    return " ".join(sorted(name.split()))
+
+def _block_key(token: str) -> str:
+    """Clave fonética simple: inicial + consonantes sin repeticiones (4 letras)."""
+    rest = token[1:].translate(_NOT_CONSONANT)
+    return (token[0] + "".join(c for i, c in enumerate(rest) if i == 0 or c != rest[i - 1]))[:4]
+
+def _block_keys(name: str) -> set:
+    return {_block_key(t) for t in name.split() if len(t) >= 3}
+
+def _similarity(a: str, b: str) -> float:
+    return SequenceMatcher(None, _sorted_tokens(a), _sorted_tokens(b)).ratio()
+
+class PatientIndex:
+    """Cruce de procedimientos con pacientes: documento → nombre exacto → nombre difuso.
+
+    Se construye una vez por ejecución. El cruce difuso solo compara contra los
+    pacientes que comparten un bloque fonético de algún token, ignorando los bloques
+    de más de MAX_BLOCK pacientes; así el costo crece casi linealmente con el
+    historial. Empates de similitud → el paciente de menor posición (como spark_match).
+    """
+
+    def __init__(self, patients: pd.DataFrame):
+        self.patients = patients.reset_index(drop=True)
+        self.names = self.patients["name_norm"].to_numpy()
+        self.sorted_names = [_sorted_tokens(n) for n in self.names]
+
+        doc_col = next((c for c in self.patients.columns if normalize_name(c) in PAT_DOC_COLS), None)
+        self.by_doc: dict = {}
+        if doc_col is not None:
+            for pos, doc in enumerate(doc_keys(self.patients[doc_col])):
+                if not pd.isna(doc):
+                    self.by_doc.setdefault(doc, pos)
+
+        self.by_name: dict = {}
+        self.blocks = defaultdict(list)
+        for pos, name in enumerate(self.names):
+            if name and name not in self.by_name:
+                self.by_name[name] = pos
+                for key in _block_keys(name):
+                    self.blocks[key].append(pos)
+        self._fuzzy_cache: dict = {}
+        logger.info("Índice de pacientes: %d documentos (%s), %d nombres, %d bloques",
+                    len(self.by_doc), doc_col, len(self.by_name), len(self.blocks))
+
+    def _fuzzy(self, name: str) -> int:
+        """Mejor paciente (posición) con similitud ≥ MATCH_THRESHOLD, o -1."""
+        if name in self._fuzzy_cache:
+            return self._fuzzy_cache[name]
+        blocks = (self.blocks.get(k, []) for k in _block_keys(name))
+        matcher = SequenceMatcher(None)
+        matcher.set_seq2(_sorted_tokens(name))
+        best, best_pos, seen = MATCH_THRESHOLD, -1, set()
+        for block in blocks:
+            if len(block) > MAX_BLOCK:                  # bloque poco selectivo: se descarta entero
+                continue
+            for pos in block:
+                if pos in seen:
+                    continue
+                seen.add(pos)
+                matcher.set_seq1(self.sorted_names[pos])
+                if matcher.real_quick_ratio() < best or matcher.quick_ratio() < best:
+                    continue
+                score = matcher.ratio()
+                if score > best or (score == best and (best_pos == -1 or pos < best_pos)):
+                    best, best_pos = score, pos
+        self._fuzzy_cache[name] = best_pos
+        return best_pos
+
+    def match(self, names: pd.Series, docs: pd.Series | None = None) -> np.ndarray:
+        """Posición en `patients` de cada fila (-1 si no hay paciente)."""
+        names = names.fillna("").reset_index(drop=True)
+        pos = pd.Series(-1, index=names.index)
+        stats = {}
+
+        # 1) Documento / historia clínica, si el nombre también coincide
+        if docs is not None and self.by_doc:
+            cand = doc_keys(docs.reset_index(drop=True)).map(self.by_doc)
+            rows = pd.DataFrame({"name": names, "cand": cand})
+            pairs = rows.dropna().drop_duplicates()
+            pairs["ok"] = [not n or _similarity(n, self.names[int(c)]) >= DOC_NAME_MIN
+                           for n, c in zip(pairs["name"], pairs["cand"])]
+            use = rows.merge(pairs, on=["name", "cand"], how="left")["ok"].astype("boolean").fillna(False).to_numpy(bool)
+            pos[use] = cand[use].astype(int)
+            stats["documento"] = int(use.sum())
+
+        # 2) Nombre normalizado exacto
+        todo = (pos < 0) & (names != "")
+        exact = names[todo].map(self.by_name).dropna().astype(int)
+        pos[exact.index] = exact
+        stats["nombre"] = len(exact)
+
+        # 3) Nombre difuso por bloques (una vez por nombre único)
+        todo = (pos < 0) & (names != "")
+        fuzzy = names[todo].map({n: self._fuzzy(n) for n in names[todo].unique()})
+        pos[fuzzy.index] = fuzzy
+        stats["difuso"] = int((fuzzy >= 0).sum())
+        stats["sin paciente"] = int((pos < 0).sum())
+        logger.info("Cruce de %d procedimientos: %s", len(names), stats)
+        return pos.to_numpy()
+
+def build_training_set(index: PatientIndex, df_proc: pd.DataFrame) -> pd.DataFrame:
+    """Un procedimiento por paciente (el primero con tipo) con sus atributos."""
+    pos = index.match(df_proc["name_norm"], df_proc.get(PROC_DOC_COL))
+    hist = pd.DataFrame({"_pos": pos, "tipo de procedimiento": df_proc["tipo de procedimiento"].to_numpy()})
+    hist = (hist[hist["_pos"] >= 0]
+            .dropna(subset=["tipo de procedimiento"])
+            .sort_values("_pos", kind="stable")
+            .drop_duplicates(subset=["_pos"]))
+    df_join = index.patients.iloc[hist["_pos"].to_numpy()].reset_index(drop=True)
+    df_join["tipo de procedimiento"] = hist["tipo de procedimiento"].to_numpy()
+    return df_join.dropna(subset=["genero", "age_years"])
+
 # ───────────────────── Modelado ------------------------------------------------
 def build_and_train(df_join):
-    feature_cols = ["genero", "age_years"]
-    X, y = df_join[feature_cols], df_join["tipo de procedimiento"]
+    X, y = df_join[FEATURE_COLS], df_join[TARGET_COL]
 
     X_tr, X_ts, y_tr, y_ts = train_test_split(X, y, test_size=0.20, stratify=y, random_state=42)
 
@@ -96,31 +392,313 @@ def build_and_train(df_join):
     pipe.fit(X_tr, y_tr)
 
     y_pred = pipe.predict(X_ts)
-    logger.info("Exactitud (test) = %.4f", accuracy_score(y_ts, y_pred))
+    metrics = {
+        "accuracy": float(accuracy_score(y_ts, y_pred)),
+        "report": classification_report(y_ts, y_pred, zero_division=0, output_dict=True),
+        "train_rows": len(X_tr), "test_rows": len(X_ts),
+    }
+    logger.info("Exactitud (test) = %.4f", metrics["accuracy"])
     logger.info("\n%s", classification_report(y_ts, y_pred, zero_division=0))
+    return pipe, metrics
+
+# ───────────────────── Registro de modelos -------------------------------------
+def training_fingerprint(df_join) -> str:
+    """Huella del set de entrenamiento (independiente del orden) + versión del modelo."""
+    data = (df_join[FEATURE_COLS + [TARGET_COL]]
+            .sort_values(FEATURE_COLS + [TARGET_COL], na_position="last")
+            .reset_index(drop=True))
+    h = hashlib.sha256(f"{MODEL_VERSION}|sklearn={sklearn.__version__}".encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:32]
+
+def load_cached_model(fingerprint: str):
+    """(pipeline, metadatos) del registro, o None si esa huella no está entrenada."""
+    base = f"{MODEL_PREFIX}{fingerprint}/"
+    try:
+        meta = json.loads(s3.get_object(Bucket=OUTPUT_BUCKET, Key=f"{base}metadata.json")["Body"].read())
+        body = s3.get_object(Bucket=OUTPUT_BUCKET, Key=f"{base}model.joblib")["Body"].read()
+    except s3.exceptions.NoSuchKey:
+        return None
+    return joblib.load(io.BytesIO(body)), meta
+
+def save_model(fingerprint: str, pipe, metrics: dict, rows: int):
+    """Guarda primero el modelo y luego los metadatos (punto de commit)."""
+    base = f"{MODEL_PREFIX}{fingerprint}/"
+    buf = io.BytesIO()
+    joblib.dump(pipe, buf, compress=3)
+    s3.put_object(Bucket=OUTPUT_BUCKET, Key=f"{base}model.joblib", Body=buf.getvalue())
+    s3.put_object(
+        Bucket=OUTPUT_BUCKET,
+        Key=f"{base}metadata.json",
+        Body=json.dumps({
+            "fingerprint": fingerprint,
+            "model_version": MODEL_VERSION,
+            "sklearn": sklearn.__version__,
+            "rows": rows,
+            "metrics": metrics,
+            "trained_at": datetime.now(timezone.utc).isoformat(),
+        }).encode("utf-8"),
+        ContentType="application/json",
+    )
+    logger.info("Modelo registrado → s3://%s/%s", OUTPUT_BUCKET, base)
+
+def get_model(df_join, force_retrain: bool = False):
+    """Modelo del registro si los datos no cambiaron; si no, entrena y lo registra."""
+    fingerprint = training_fingerprint(df_join)
+    cached = None if force_retrain else load_cached_model(fingerprint)
+    if cached is not None:
+        pipe, meta = cached
+        logger.info("Modelo en caché %s (exactitud %.4f, entrenado %s): se omite el entrenamiento",
+                    fingerprint, meta["metrics"]["accuracy"], meta["trained_at"])
+        return pipe
+    pipe, metrics = build_and_train(df_join)
+    save_model(fingerprint, pipe, metrics, len(df_join))
     return pipe
 
 # ───────────────────── Predicción y carga a S3 ---------------------------------
 def predict_and_upload(pipe, df_pat):
-    feature_cols = ["genero", "age_years"]
     pred_df = df_pat[["Id Paciente", "nombre_completo", "genero", "age_years"]].copy()
-    mask = pred_df["genero"].notna() & pred_df["age_years"].notna()
-    pred_df.loc[mask, "predicted_tipo_procedimiento"] = pipe.predict(
-        pred_df.loc[mask, feature_cols]
-    )
+    mask = (pred_df["genero"].notna() & pred_df["age_years"].notna()).to_numpy()
+    rows = np.flatnonzero(mask)
+    preds = np.empty(len(rows), dtype=object)
+    for start in range(0, len(rows), SCORE_BATCH):        # puntuación por lotes
+        batch = rows[start:start + SCORE_BATCH]
+        preds[start:start + len(batch)] = pipe.predict(pred_df.iloc[batch][FEATURE_COLS])
+    pred_df.loc[mask, "predicted_tipo_procedimiento"] = preds
     pred_df["predicted_tipo_procedimiento"].fillna("unknown", inplace=True)
 
-    buf = io.StringIO()
-    pred_df.to_csv(buf, index=False)
-    buf.seek(0)
+    if DATASETS["recomendacion_pacientes"]["format"] == "parquet":
+        out_key = OUTPUT_PARQUET_KEY
+        buf = io.BytesIO()
+        pred_df.astype({"Id Paciente": "string", "nombre_completo": "string", "genero": "string",
+                        "predicted_tipo_procedimiento": "string", "age_years": "float64"}) \
+               .to_parquet(buf, index=False, compression="snappy")
+        body, content_type = buf.getvalue(), "application/vnd.apache.parquet"
+    else:
+        out_key = OUTPUT_KEY
+        buf = io.StringIO()
+        pred_df.to_csv(buf, index=False)
+        buf.seek(0)
+        body, content_type = buf.getvalue().encode("utf-8-sig"), "text/csv"
 
     s3.put_object(
         Bucket=OUTPUT_BUCKET,
-        Key=OUTPUT_KEY,
-        Body=buf.getvalue().encode("utf-8-sig"),
-        ContentType="text/csv",
+        Key=out_key,
+        Body=body,
+        ContentType=content_type,
     )
-    logger.info("Archivo escrito → s3://%s/%s", OUTPUT_BUCKET, OUTPUT_KEY)
+    clear_output_prefix(os.path.dirname(out_key) + "/", keep=out_key)
+    logger.info("Archivo escrito → s3://%s/%s", OUTPUT_BUCKET, out_key)
+    register_output_table()
+
+def clear_output_prefix(prefix: str, keep: str):
+    """Borra lo que quede de otra ejecución (p. ej. part-* del modo Spark) junto a `keep`."""
+    paginator = s3.get_paginator("list_objects_v2")
+    stale = [
+        {"Key": obj["Key"]}
+        for page in paginator.paginate(Bucket=OUTPUT_BUCKET, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if obj["Key"] != keep
+    ]
+    for i in range(0, len(stale), 1000):
+        s3.delete_objects(Bucket=OUTPUT_BUCKET, Delete={"Objects": stale[i:i + 1000], "Quiet": True})
+
+# ───────────────────── Catálogo (sin crawler) ----------------------------------
+OUTPUT_TABLE   = "recomendacion_pacientes"
+OUTPUT_COLUMNS = ["id paciente", "nombre_completo", "genero", "age_years", "predicted_tipo_procedimiento"]
+OUTPUT_SCHEMA  = {"age_years": "float"}   # tipos Glue de la salida Parquet (en CSV todo es texto)
+
+def register_output_table():
+    """Crea o alinea la tabla de predicciones (catalog.register); el crawler queda de respaldo."""
+    if offline():
+        return
+    out = DATASETS["recomendacion_pacientes"]
+    fmt = "parquet" if out["format"] == "parquet" else "csv"
+    prefix = (out["parquet_path"] if fmt == "parquet" else out["path"])[len(f"s3://{OUTPUT_BUCKET}/"):]
+    synced = catalog.register(OUTPUT_TABLE, OUTPUT_BUCKET, prefix,
+                              catalog.columns(OUTPUT_COLUMNS, OUTPUT_SCHEMA, fmt), fmt, glue=glue)
+    if synced["action"] == "error":   # la salida ya está escrita: el catálogo no debe tumbar el job
+        logger.warning("No se pudo registrar %s en el catálogo: %s", OUTPUT_TABLE, synced["error"])
+    else:
+        logger.info("Tabla %s en %s: %s", OUTPUT_TABLE, DB_NAME, synced["action"])
+
+# ───────────────────── Ejecución distribuida (Spark) ---------------------------
+def storage_uri(bucket: str, key: str) -> str:
+    root = STORAGE_ROOT if STORAGE_ROOT.endswith("/") else STORAGE_ROOT + "/"
+    return f"{root}{bucket}/{key}"
+
+def input_bytes() -> int:
+    """Tamaño de la entrada (pacientes + procedimientos gold) para elegir el modo."""
+    paginator = s3.get_paginator("list_objects_v2")
+    prefixes = (os.path.dirname(PATIENTS_KEY) + "/", os.path.dirname(PATIENTS_PARQUET_KEY) + "/",
+                PROCS_PREFIX, PROCS_PARQUET_PREFIX)
+    return sum(
+        obj.get("Size", 0)
+        for prefix in prefixes
+        for page in paginator.paginate(Bucket=BUCKET, Prefix=prefix)
+        for obj in page.get("Contents", [])
+    )
+
+def resolve_mode() -> str:
+    if EXECUTION_MODE in ("pandas", "spark"):
+        return EXECUTION_MODE
+    size = input_bytes()
+    spark_ok = importlib.util.find_spec("pyspark") is not None
+    mode = "spark" if spark_ok and size >= SPARK_MIN_BYTES else "pandas"
+    logger.info("Modo %s (entrada %.1f MB, umbral %.1f MB)", mode, size / 1024 ** 2, SPARK_MIN_BYTES / 1024 ** 2)
+    return mode
+
+def spark_session():
+    from pyspark.sql import SparkSession
+    spark = SparkSession.builder.appName("prediction_pacientes").getOrCreate()
+    spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
+    spark.conf.set("spark.sql.execution.arrow.maxRecordsPerBatch", str(SCORE_BATCH))
+    spark.sparkContext._jsc.hadoopConfiguration().set(
+        "mapreduce.fileoutputcommitter.marksuccessfuljobs", "false")   # sin _SUCCESS para el crawler
+    return spark
+
+# UDFs vectorizadas: la misma lógica que el modo pandas, ejecutada en los executors
+def similarity_series(a: pd.Series, b: pd.Series) -> pd.Series:
+    return pd.Series([_similarity(x or "", y or "") for x, y in zip(a, b)], index=a.index)
+
+def block_keys_series(names: pd.Series) -> pd.Series:
+    return pd.Series([sorted(_block_keys(n or "")) for n in names], index=names.index)
+
+def _spark_select(df, cols):
+    """Columnas `cols` como texto (las que falten, nulas) y sin BOM en los encabezados."""
+    from pyspark.sql import functions as F
+    df = df.toDF(*[c.lstrip("\ufeff") for c in df.columns])
+    return df.select([F.col(f"`{c}`").cast("string").alias(c) if c in df.columns
+                      else F.lit(None).cast("string").alias(c) for c in cols])
+
+def spark_load(spark):
+    """(pacientes, procedimientos) como DataFrames de Spark con las columnas de trabajo."""
+    from pyspark.sql import functions as F
+    norm = F.pandas_udf(normalize_names, "string")
+
+    pat_cols = ["Id Paciente", "nombre_completo", "genero", "Edad actual"]
+    if DATASETS["pacientes"]["format"] == "parquet":
+        raw_pat = spark.read.parquet(storage_uri(BUCKET, PATIENTS_PARQUET_KEY))
+    else:
+        raw_pat = spark.read.csv(storage_uri(BUCKET, PATIENTS_KEY), sep=";", header=True,
+                                 quote='"', escape='"', encoding="UTF-8")
+    doc_col = next((c.lstrip("\ufeff") for c in raw_pat.columns
+                    if normalize_name(c.lstrip("\ufeff")) in PAT_DOC_COLS), None)
+    patients = (_spark_select(raw_pat, pat_cols + ([doc_col] if doc_col and doc_col not in pat_cols else []))
+                .withColumn("_pat", F.monotonically_increasing_id())
+                .withColumn("name_norm", norm("nombre_completo"))
+                .withColumn("age_years", F.when(
+                    F.regexp_extract("Edad actual", r"(\d+)", 1) != "",
+                    F.regexp_extract("Edad actual", r"(\d+)", 1).cast("double")))
+                .withColumn("doc_key", _spark_doc_key(doc_col) if doc_col else F.lit(None).cast("string")))
+
+    proc_cols = ["nombre del paciente", PROC_DOC_COL, TARGET_COL]
+    keys = list(list_proc_objects())
+    frames = []
+    csv_uris = [storage_uri(BUCKET, k) for k in keys if k.endswith(".csv")]
+    pq_uris = [storage_uri(BUCKET, k) for k in keys if k.endswith(".parquet")]
+    if csv_uris:
+        frames.append(_spark_select(spark.read.csv(csv_uris, header=True, multiLine=True, escape='"'), proc_cols))
+    if pq_uris:
+        frames.append(_spark_select(spark.read.parquet(*pq_uris), proc_cols))
+    if not frames:
+        raise ValueError(f"No hay procedimientos en s3://{BUCKET}/{PROCS_PREFIX}")
+    procs = (reduce(lambda a, b: a.unionByName(b), frames)
+             .withColumn("_proc", F.monotonically_increasing_id())
+             .withColumn("name_norm", norm("nombre del paciente"))
+             .withColumn("doc_key", _spark_doc_key(PROC_DOC_COL)))
+    return patients, procs
+
+def _spark_doc_key(col: str):
+    """doc_keys en Spark: solo dígitos, sin ceros a la izquierda; vacío → null."""
+    from pyspark.sql import functions as F
+    digits = F.regexp_replace(F.regexp_replace(F.col(f"`{col}`"), r"\D", ""), "^0+", "")
+    return F.when(digits != "", digits)
+
+def spark_match(patients, procs):
+    """Mismos pasos que PatientIndex.match (documento → nombre exacto → difuso por bloques)."""
+    from pyspark.sql import functions as F
+    from pyspark.sql.window import Window
+    sim = F.pandas_udf(similarity_series, "double")
+    blocks = F.pandas_udf(block_keys_series, "array<string>")
+
+    pat_names = patients.select("_pat", F.col("name_norm").alias("pat_name"))
+    first_by_doc = (patients.where(F.col("doc_key").isNotNull())
+                    .groupBy("doc_key").agg(F.min("_pat").alias("doc_pat")))
+    first_by_name = (patients.where(F.col("name_norm") != "")
+                     .groupBy("name_norm").agg(F.min("_pat").alias("name_pat")))
+
+    # 1) Documento, si el nombre también coincide
+    m = (procs.join(first_by_doc, "doc_key", "left")
+              .join(pat_names.withColumnRenamed("_pat", "doc_pat"), "doc_pat", "left")
+              .withColumn("doc_pat", F.when(
+                  F.col("doc_pat").isNotNull()
+                  & ((F.col("name_norm") == "") | (sim("name_norm", "pat_name") >= DOC_NAME_MIN)),
+                  F.col("doc_pat")))
+              .drop("pat_name"))
+    # 2) Nombre exacto
+    m = m.join(first_by_name, "name_norm", "left")
+
+    # 3) Difuso: nombres únicos sin paciente × pacientes del mismo bloque fonético
+    pending = (m.where(F.col("doc_pat").isNull() & F.col("name_pat").isNull() & (F.col("name_norm") != ""))
+                .select("name_norm").distinct()
+                .withColumn("block", F.explode(blocks("name_norm"))))
+    cand = (first_by_name.select(F.col("name_norm").alias("pat_name"), "name_pat")
+            .withColumn("block", F.explode(blocks("pat_name"))))
+    small = cand.groupBy("block").count().where(F.col("count") <= MAX_BLOCK).select("block")
+    best = Window.partitionBy("name_norm").orderBy(F.col("score").desc(), F.col("fuzzy_pat"))
+    fuzzy = (pending.join(cand.join(small, "block"), "block")
+             .select("name_norm", "pat_name", F.col("name_pat").alias("fuzzy_pat")).distinct()
+             .withColumn("score", sim("name_norm", "pat_name"))
+             .where(F.col("score") >= MATCH_THRESHOLD)
+             .withColumn("rank", F.row_number().over(best))
+             .where(F.col("rank") == 1)
+             .select("name_norm", "fuzzy_pat"))
+    m = m.join(fuzzy, "name_norm", "left")
+    return m.withColumn("_pat", F.coalesce("doc_pat", "name_pat", "fuzzy_pat"))
+
+def spark_training_set(patients, matched) -> pd.DataFrame:
+    """Un procedimiento por paciente (el primero con tipo), traído al driver para entrenar."""
+    from pyspark.sql import functions as F
+    from pyspark.sql.window import Window
+    first = Window.partitionBy("_pat").orderBy("_proc")
+    hist = (matched.where(F.col("_pat").isNotNull() & F.col(f"`{TARGET_COL}`").isNotNull())
+                   .withColumn("rank", F.row_number().over(first))
+                   .where(F.col("rank") == 1)
+                   .select("_pat", F.col(f"`{TARGET_COL}`")))
+    df_join = (patients.join(hist, "_pat")
+                       .where(F.col("genero").isNotNull() & F.col("age_years").isNotNull())
+                       .orderBy("_pat")
+                       .select(*FEATURE_COLS, F.col(f"`{TARGET_COL}`"))
+                       .toPandas())
+    logger.info("Pacientes con historial = %d", len(df_join))
+    return df_join
+
+def spark_predict_and_write(spark, pipe, patients):
+    """Difunde el modelo, puntúa con mapInPandas y escribe en paralelo (part-*)."""
+    model = spark.sparkContext.broadcast(pipe)
+
+    def score(batches):
+        clf = model.value
+        for pdf in batches:
+            mask = pdf["genero"].notna() & pdf["age_years"].notna()
+            pred = pd.Series("unknown", index=pdf.index, dtype=object)
+            if mask.any():
+                pred[mask] = clf.predict(pdf.loc[mask, FEATURE_COLS])
+            pdf["predicted_tipo_procedimiento"] = pred
+            yield pdf
+
+    schema = ("`Id Paciente` string, nombre_completo string, genero string, "
+              "age_years double, predicted_tipo_procedimiento string")
+    scored = patients.select("Id Paciente", "nombre_completo", "genero", "age_years").mapInPandas(score, schema)
+    if DATASETS["recomendacion_pacientes"]["format"] == "parquet":
+        out = storage_uri(OUTPUT_BUCKET, os.path.dirname(OUTPUT_PARQUET_KEY) + "/")
+        scored.write.mode("overwrite").option("compression", "snappy").parquet(out)
+    else:
+        out = storage_uri(OUTPUT_BUCKET, os.path.dirname(OUTPUT_KEY) + "/")
+        scored.write.mode("overwrite").option("header", True).csv(out)
+    logger.info("Predicciones escritas → %s", out)
+    register_output_table()
 
 # ───────────────────── Validación Glue posterior a predicción ------------------
 def validate_glue_components():
@@ -151,22 +729,34 @@ def invoke_lambda_to_create_components():
     logger.info("Respuesta LambdaGlue: %s", json.dumps(payload, indent=2))
 
 # ───────────────────── Pipeline completo ---------------------------------------
-def run_pipeline():
-    logger.info("▶ Ejecutando pipeline predictivo…")
-    df_pat, df_proc = load_patients_and_procs()
+def run_pandas():
+    df_pat, df_proc = load_patients_and_procs(full_rebuild=job_flag("FULL_REBUILD"))
+
+    # Índice construido una vez: arma el set de entrenamiento y define a quién se puntúa
+    index = PatientIndex(df_pat)
+    df_join = build_training_set(index, df_proc)
+
+    logger.info("Pacientes con historial = %d", len(df_join))
+    model = get_model(df_join, force_retrain=job_flag("FORCE_RETRAIN"))
+    predict_and_upload(model, index.patients)
 
-    df_join = (df_pat
-               .merge(df_proc[["name_norm", "tipo de procedimiento"]],
-                      on="name_norm", how="inner")
-               .dropna(subset=["genero", "age_years", "tipo de procedimiento"])
-               .drop_duplicates(subset=["name_norm"]))
+def run_spark():
+    spark = spark_session()
+    patients, procs = spark_load(spark)
+    patients = patients.cache()
+    df_join = spark_training_set(patients, spark_match(patients, procs))
+    model = get_model(df_join, force_retrain=job_flag("FORCE_RETRAIN"))
+    spark_predict_and_write(spark, model, patients)
+    patients.unpersist()
 
-    logger.info("Pacientes con historial = %d", df_join["name_norm"].nunique())
-    model = build_and_train(df_join)
-    predict_and_upload(model, df_pat)
+def run_pipeline():
+    logger.info("▶ Ejecutando pipeline predictivo…")
+    run_spark() if resolve_mode() == "spark" else run_pandas()
 
     # Validación y llamada a Lambda si falta algo
-    if not validate_glue_components():
+    if offline():
+        logger.info("Backfill local en %s: sin validación del catálogo", STORAGE_ROOT)
+    elif not validate_glue_components():
         invoke_lambda_to_create_components()
     else:
         logger.info("✔ Todos los componentes de Glue existen.")
@@ -0,0 +1,123 @@
+# classify.py  (motor de clasificación: trabajo por valor único + autómata de palabras clave)
+from __future__ import annotations
+
+import re
+import sys
+from collections import deque
+from typing import Callable, Mapping, Optional, Tuple
+
+import runtime
+
+pd = runtime.lazy("pandas")
+
+NO_MATCH = sys.maxsize   # prioridad de "ninguna clave" en el autómata
+
+
+def map_unique(values: pd.Series, fn: Callable[[pd.Series], pd.Series]) -> pd.Series:
+    """Aplica `fn` a los valores únicos (sin NaN) y expande el resultado a `values`.
+
+    Los NaN quedan NaN: el llamador decide su valor por defecto.
+    """
+    codes, uniques = pd.factorize(values)
+    out = fn(pd.Series(uniques, dtype=object)).reindex(codes)
+    out.index = values.index
+    return out
+
+
+class KeywordAutomaton:
+    """Aho-Corasick sobre las claves de `catalog` (clave → categoría).
+
+    Respeta la prioridad del catálogo: si un texto contiene varias claves gana
+    la que aparece antes en `catalog`, igual que recorrer el dict con `in`.
+    """
+
+    def __init__(self, catalog: Mapping[str, str]):
+        self.labels = list(catalog.values())
+        self._goto: list = [{}]
+        self._fail: list = [0]
+        self._best: list = [NO_MATCH]  # menor prioridad que termina en el nodo (o sus sufijos)
+
+        for prio, keyword in enumerate(catalog):
+            node = 0
+            for ch in keyword:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(NO_MATCH)
+                node = nxt
+            self._best[node] = min(self._best[node], prio)
+
+        # Enlaces de fallo por BFS; cada nodo hereda la mejor clave de su sufijo
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._best[child] = min(self._best[child], self._best[self._fail[child]])
+                queue.append(child)
+
+    def first(self, text: str) -> Optional[int]:
+        """Índice (en el catálogo) de la clave de mayor prioridad contenida en `text`."""
+        goto, fail, best_at = self._goto, self._fail, self._best
+        best, node = best_at[0], 0
+        for ch in text:
+            if best == 0:
+                break
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if best_at[node] < best:
+                best = best_at[node]
+        return None if best == NO_MATCH else best
+
+    def label(self, text: str, default: str) -> str:
+        idx = self.first(text)
+        return default if idx is None else self.labels[idx]
+
+
+def classify(
+    values: pd.Series,
+    automaton: KeywordAutomaton,
+    normalize: Callable[[str], str],
+    default: str,
+) -> pd.Series:
+    """Categoría por fila: normaliza y busca cada valor único una sola vez."""
+    def per_unique(uniques: pd.Series) -> pd.Series:
+        return uniques.map(
+            lambda v: automaton.label(normalize(v), default) if isinstance(v, str) else default
+        )
+    return map_unique(values, per_unique).fillna(default)
+
+
+def split_rm(
+    values: pd.Series,
+    pattern: re.Pattern,
+    empty_name: str,
+    empty_rm: str,
+) -> Tuple[pd.Series, pd.Series]:
+    """Separa "nombre ... RM 12.345" en (nombre, dígitos del RM) por valor único.
+
+    Equivale a: strip; RM = dígitos del primer grupo de `pattern` (o `empty_rm`);
+    nombre = texto sin el patrón, sin " -" final (o `empty_name` si queda vacío).
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    is_str = uniques.map(lambda v: isinstance(v, str)).astype(bool)
+    text = uniques[is_str].str.strip()
+
+    rm = (text.str.extract(pattern, expand=False)
+              .str.replace(r"[^0-9]", "", regex=True)
+              .fillna(empty_rm))
+    nombre = text.str.replace(pattern, "", regex=True).str.rstrip(" -").str.strip()
+    nombre = nombre.mask(nombre == "", empty_name)
+
+    names = nombre.reindex(uniques.index).fillna(empty_name).reindex(codes).fillna(empty_name)
+    rms = rm.reindex(uniques.index).fillna(empty_rm).reindex(codes).fillna(empty_rm)
+    names.index = rms.index = values.index
+    return names, rms
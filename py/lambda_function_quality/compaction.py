@@ -0,0 +1,262 @@
+# compaction.py  (compactación de gold procedimientos: archivos por periodo, sin duplicados)
+#
+# Cada corrida de LambdaQuality deja un procedimientos_gold_<ts> nuevo. La compactación
+# (LambdaCompactGold, programada; nunca dentro de la corrida de LambdaQuality) junta esos archivos con los compactados de los mismos periodos (año/mes de "fecha"),
+# quita duplicados por KEY_COLS + fecha (gana la carga más reciente) y escribe
+# procedimientos_compact_<YYYYMM>_g<gen>-<corrida>-<n> de ~TARGET_BYTES cada uno.
+#
+# El cambio se publica con un manifiesto (s3://<gold>/state/compaction/procedimientos.json):
+#   1. se escriben las salidas de la generación g (aún invisibles: g > generación publicada)
+#   2. PUT condicional del manifiesto con generation=g y retired=<entradas>  ← punto de commit
+#   3. se borran las entradas retiradas y se limpia retired
+# visible() aplica esa regla para los lectores que listan el prefijo; un fallo entre pasos
+# se completa (o se deshace) en la siguiente compactación.
+from __future__ import annotations
+
+import io
+import json
+import math
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+import parquet_writer
+import runtime
+import s3_move
+import storage
+
+pd = runtime.lazy("pandas")
+
+MIN_FILES    = int(os.environ.get("COMPACT_MIN_FILES", "24"))    # archivos sin compactar que disparan la compactación
+TARGET_BYTES = int(os.environ.get("COMPACT_TARGET_BYTES", str(128 * 1024 ** 2)))
+MAX_FILES    = int(os.environ.get("COMPACT_MAX_FILES", "200"))   # entradas nuevas por pasada (las más antiguas)
+MAX_BYTES    = int(os.environ.get("COMPACT_MAX_BYTES", str(512 * 1024 ** 2)))
+SAMPLE_ROWS  = 1000   # filas serializadas para estimar el tamaño de un periodo
+STATE_KEY    = "state/compaction/procedimientos.json"
+ORPHAN_AGE_S = 900   # una salida no publicada más vieja que el timeout de la Lambda quedó huérfana
+
+# Mismas claves que cups.KEY_COLS (LambdaTransform) + la fecha del procedimiento
+KEY_COLS   = ["nombre del paciente", "numero de documento - historia clinica", "actividad_servicio"]
+DEDUP_COLS = KEY_COLS + ["fecha"]
+NO_PERIOD  = "sinfecha"
+
+_COMPACT_RE = re.compile(r"procedimientos_compact_(\d{6}|" + NO_PERIOD + r")_g(\d+)-[0-9a-f]{8}-\d+\.(?:csv|parquet)$")
+_CONFLICT   = {"PreconditionFailed", "ConditionalRequestConflict"}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+# ───────────────────── Manifiesto ─────────────────────────────────────────
+def read_state(s3, bucket: str) -> Tuple[dict, Optional[str]]:
+    """(manifiesto, etag) o ({}, None) si aún no hubo compactación."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=STATE_KEY)
+    except s3.exceptions.NoSuchKey:
+        return {}, None
+    return json.loads(obj["Body"].read()), obj["ETag"]
+
+
+def _write_state(s3, bucket: str, state: dict, etag: Optional[str]) -> Optional[str]:
+    """PUT condicional; devuelve el ETag nuevo o None si otra compactación publicó antes."""
+    cond = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        resp = s3.put_object(Bucket=bucket, Key=STATE_KEY, Body=json.dumps(state).encode("utf-8"),
+                             ContentType="application/json", **cond)
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") in _CONFLICT:
+            return None
+        raise
+    return resp.get("ETag")
+
+
+def generation(key: str) -> Optional[int]:
+    """Generación de un archivo compactado (None si es una salida normal de LambdaQuality)."""
+    m = _COMPACT_RE.search(key)
+    return int(m.group(2)) if m else None
+
+
+def visible(keys: Iterable[str], state: dict) -> List[str]:
+    """Keys que un lector debe usar: sin entradas retiradas ni salidas aún no publicadas."""
+    retired = set(state.get("retired", []))
+    published = state.get("generation", 0)
+    return [k for k in keys if k not in retired and (generation(k) or 0) <= published]
+
+
+# ───────────────────── Lectura / escritura ─────────────────────────────────
+def _list(s3, bucket: str, prefix: str, ext: str) -> List[dict]:
+    paginator = s3.get_paginator("list_objects_v2")
+    return [
+        obj
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(ext)
+    ]
+
+
+def _read(s3, bucket: str, key: str) -> pd.DataFrame:
+    """Archivo gold como texto (Parquet → fecha dd/mm/aaaa, igual que el CSV)."""
+    with storage.open_stream(s3, bucket, key) as body:
+        if not key.endswith(".parquet"):
+            return pd.read_csv(body, dtype=str, encoding="utf-8-sig", keep_default_na=False)
+        df = pd.read_parquet(body)
+    if "fecha" in df.columns:
+        df["fecha"] = pd.to_datetime(df["fecha"]).dt.strftime("%d/%m/%Y")
+    return df.astype("string").fillna("").astype(object)
+
+
+def _period(key: str) -> Optional[str]:
+    """Periodo de un compactado (en el nombre) o de una partición Parquet (en la ruta)."""
+    m = _COMPACT_RE.search(key)
+    if m:
+        return m.group(1)
+    m = re.search(r"anio=(\d{4})/mes=(\d{2})/", key)
+    return f"{m.group(1)}{m.group(2)}" if m else None
+
+
+def _periods(fecha: pd.Series) -> pd.Series:
+    dates = pd.to_datetime(fecha, format="%d/%m/%Y", errors="coerce")
+    return dates.dt.strftime("%Y%m").fillna(NO_PERIOD)
+
+
+def _csv_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, encoding="utf-8-sig", lineterminator="\n")
+    return buf.getvalue()
+
+
+def _estimated_bytes(df: pd.DataFrame) -> int:
+    """Tamaño CSV estimado a partir de una muestra de SAMPLE_ROWS filas."""
+    if len(df) <= SAMPLE_ROWS:
+        return len(_csv_bytes(df))
+    sample = _csv_bytes(df.sample(n=SAMPLE_ROWS, random_state=0))
+    return math.ceil(len(sample) / SAMPLE_ROWS * len(df))
+
+
+def _chunks(df: pd.DataFrame, nbytes: int) -> List[pd.DataFrame]:
+    """Parte `df` en trozos de ~TARGET_BYTES según el tamaño serializado estimado."""
+    n = max(1, math.ceil(nbytes / TARGET_BYTES))
+    size = math.ceil(len(df) / n)
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)] or [df]
+
+
+def _write_period(s3, bucket: str, prefix: str, fmt: str, period: str, gen: str,
+                  df: pd.DataFrame, schema: Dict[str, str]) -> List[str]:
+    keys: List[str] = []
+    for n, chunk in enumerate(_chunks(df, _estimated_bytes(df)), start=1):
+        basename = f"procedimientos_compact_{period}_g{gen}-{n:03d}"
+        if fmt == "parquet":
+            keys += parquet_writer.write_parquet(s3, chunk, bucket, prefix, basename,
+                                                 schema=schema, partition_col="fecha")
+        else:
+            key = f"{prefix}{basename}.csv"
+            s3.put_object(Bucket=bucket, Key=key, Body=_csv_bytes(chunk))
+            keys.append(key)
+    return keys
+
+
+# ───────────────────── Compactación ────────────────────────────────────────
+def _recover(s3, bucket: str, state: dict, etag: Optional[str], listing: List[dict]) -> Tuple[dict, Optional[str], List[dict]]:
+    """Termina un borrado interrumpido y quita salidas de generaciones nunca publicadas."""
+    published = state.get("generation", 0)
+    retired = set(state.get("retired", []))
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ORPHAN_AGE_S)
+    orphans = [o["Key"] for o in listing
+               if (generation(o["Key"]) or 0) > published and o["LastModified"] < cutoff]
+    leftover = [o["Key"] for o in listing if o["Key"] in retired]
+    errors = s3_move.delete_objects(s3, bucket, orphans + leftover) if orphans or leftover else {}
+    keep = set(visible((o["Key"] for o in listing), state))   # sin retiradas ni salidas de otra compactación en curso
+    if retired and not errors:
+        state = {**state, "retired": []}
+        etag = _write_state(s3, bucket, state, etag) or etag
+    return state, etag, [o for o in listing if o["Key"] in keep]
+
+
+def _batch(raw: List[dict]) -> List[dict]:
+    """Las entradas más antiguas hasta MAX_FILES / MAX_BYTES (al menos una)."""
+    batch: List[dict] = []
+    nbytes = 0
+    for obj in raw:
+        if batch and (len(batch) >= MAX_FILES or nbytes + obj.get("Size", 0) > MAX_BYTES):
+            break
+        batch.append(obj)
+        nbytes += obj.get("Size", 0)
+    return batch
+
+
+def compact(s3, bucket: str, prefix: str, fmt: str = "csv", schema: Optional[Dict[str, str]] = None,
+            force: bool = False) -> dict:
+    """Compacta gold procedimientos bajo `prefix`; devuelve un resumen para la respuesta.
+
+    Sin `force` solo actúa si hay al menos MIN_FILES archivos sin compactar. Cada pasada
+    toma las entradas más antiguas hasta MAX_FILES / MAX_BYTES; el resto queda en
+    `pending_files` para la siguiente (la más reciente sigue ganando en los duplicados).
+    """
+    ext = ".parquet" if fmt == "parquet" else ".csv"
+    state, etag = read_state(s3, bucket)
+    state, etag, listing = _recover(s3, bucket, state, etag, _list(s3, bucket, prefix, ext))
+
+    raw = sorted((o for o in listing if generation(o["Key"]) is None),
+                 key=lambda o: (o["LastModified"], o["Key"]))
+    if not raw or (len(raw) < MIN_FILES and not force):
+        return {"action": "skipped", "pending_files": len(raw), "min_files": MIN_FILES}
+    pending = len(raw)
+    raw = _batch(raw)
+
+    # 1) Entradas: salidas nuevas + compactados de los periodos que tocan (más antiguos primero)
+    new_frames = [_read(s3, bucket, o["Key"]) for o in raw]
+    new_rows = pd.concat(new_frames, ignore_index=True)
+    periods = set(_periods(new_rows["fecha"])) if "fecha" in new_rows.columns else {NO_PERIOD}
+    if fmt == "parquet":
+        periods |= {p for p in (_period(o["Key"]) for o in raw) if p}
+    old = [o for o in listing if generation(o["Key"]) is not None and _period(o["Key"]) in periods]
+    frames = [_read(s3, bucket, o["Key"]) for o in sorted(old, key=lambda o: o["Key"])] + new_frames
+    merged = pd.concat(frames, ignore_index=True)
+
+    # 2) Duplicados por clave + fecha: gana la fila de la carga más reciente
+    subset = [c for c in DEDUP_COLS if c in merged.columns]
+    deduped = merged.drop_duplicates(subset=subset or None, keep="last")
+
+    # 3) Escribir la generación nueva por periodo
+    gen = state.get("generation", 0) + 1
+    run = f"{gen:06d}-{uuid.uuid4().hex[:8]}"   # dos compactaciones simultáneas no pisan sus salidas
+    outputs: List[str] = []
+    by_period = _periods(deduped["fecha"]) if "fecha" in deduped.columns else pd.Series(NO_PERIOD, index=deduped.index)
+    for period, part in deduped.groupby(by_period, sort=True):
+        outputs += _write_period(s3, bucket, prefix, fmt, period, run, part.reset_index(drop=True), schema or {})
+
+    # 4) Publicar (punto de commit) y borrar las entradas
+    inputs = [o["Key"] for o in old] + [o["Key"] for o in raw]
+    published = {
+        "generation": gen,
+        "committed_at": _now(),
+        "retired": inputs,
+        "inputs": len(inputs),
+        "outputs": outputs,
+        "rows_in": len(merged),
+        "rows_out": len(deduped),
+    }
+    new_etag = _write_state(s3, bucket, published, etag)
+    if new_etag is None:   # otra compactación publicó primero: se descarta esta generación
+        s3_move.delete_objects(s3, bucket, outputs)
+        return {"action": "conflict", "generation": gen}
+    errors = s3_move.delete_objects(s3, bucket, inputs)
+    if not errors:
+        _write_state(s3, bucket, {**published, "retired": []}, new_etag)
+
+    return {
+        "action": "compacted",
+        "generation": gen,
+        "inputs": len(inputs),
+        "outputs": len(outputs),
+        "periods": len(set(by_period)),
+        "rows_in": len(merged),
+        "duplicates": len(merged) - len(deduped),
+        "delete_errors": len(errors),
+        "pending_files": pending - len(raw),
+    }
@@ -1,26 +1,65 @@
 from __future__ import annotations
 
+import runtime  # noqa: I001  (primero: marca el inicio del init)
+
 import io
+import json
 import os
 import re
 import unicodedata
 from datetime import datetime, timedelta, timezone
-from typing import List
+from typing import List, Optional
+
+from botocore.exceptions import BotoCoreError, ClientError
 
-import boto3
-import pandas as pd
+import catalog
+import classify
+import compaction
+import metrics
+import naming
+import parquet_writer
+import rules
+import s3_move
+import s3_stream
+import storage
+import trigger
+
+pd = runtime.lazy("pandas")   # una invocación sin CSV en silver1 no lo importa
 
 # ----------------------- S3 y zona horaria ---------------------------------
 BUCKET = "serverless-architecture-smes-analytics-silver-zone"
 SILVER1_PREFIX = "silver1/procedimientos/"
 SILVER2_PREFIX = "silver2/procedimientos/"
 GOLD1_PREFIX = "gold1/procedimientos/"
-PACIENTES_KEY = "gold1/pacientes/pacientes.csv"
+PACIENTES_KEY = (
+    "gold1/parquet/pacientes/pacientes.parquet"
+    if parquet_writer.output_format("pacientes") == "parquet"
+    else "gold1/pacientes/pacientes.csv"
+)
+GOLD_BUCKET = "serverless-architecture-smes-analytics-gold-zone"
+GOLD_PARQUET_PREFIX = "gold1/parquet/procedimientos/"
+GOLD_SCHEMA = {"fecha": "date"}  # tipos para la salida Parquet
+GOLD_TABLE = "procedimientos"     # tabla del Data Catalog
 CO_TZ = timezone(timedelta(hours=-5))  # America/Bogota
+ADDED_COLS = ["rm", "tipo de procedimiento"]   # columnas que agrega la transformación
+
+# "stream": cada CSV de silver1 se transforma y se agrega a un multipart upload
+# (memoria ≈ un archivo); "memory": concat de todos y un solo put_object.
+# La salida Parquet siempre usa "memory" (se escribe por partición).
+CONSOLIDATION_MODE = os.environ.get("CONSOLIDATION_MODE", "stream").lower()
+HEADER_BYTES = 16 * 1024   # GET por rango para leer solo el encabezado
+
+# Reglas de calidad (rules.RULES["procedimientos"]): reporte JSON por corrida y, con
+# QUALITY_QUARANTINE, las filas con errores van a un CSV aparte en vez de a gold.
+QUALITY_RULES = os.environ.get("QUALITY_RULES", "true").lower() in ("1", "true", "yes")
+QUALITY_QUARANTINE = os.environ.get("QUALITY_QUARANTINE", "false").lower() in ("1", "true", "yes")
+REPORT_PREFIX = "gold1/quality/procedimientos/"
+QUARANTINE_PREFIX = "gold1/quarantine/procedimientos/"
 
 # ----------------------- Cliente AWS --------------------------------------
-s3 = boto3.client("s3")
-glue = boto3.client("glue")            # <-- para lanzar el job
+# Creados en el init y reutilizados en caliente (pool de conexiones ajustado)
+s3 = runtime.client("s3")
+glue = runtime.client("glue")          # <-- para lanzar el job y el catálogo
 
 # --------------------- Utilidades generales --------------------------------
 def _remove_accents(text: str) -> str:
@@ -29,22 +68,9 @@ def _remove_accents(text: str) -> str:
 
 RM_PATTERN = re.compile(r"\bRM[:\s]*([0-9][0-9\.\,]*)", re.IGNORECASE)
 
-def _split_responsable(val: str | float | int) -> tuple[str, str]:
-    if not isinstance(val, str):
-        return "sin responsable", "sin RM"
-
-    original = val.strip()
-    if original == "":
-        return "sin responsable", "sin RM"
-
-    match = RM_PATTERN.search(original)
-    rm_clean = re.sub(r"[^0-9]", "", match.group(1)) if match else "sin RM"
-
-    nombre = RM_PATTERN.sub("", original).rstrip(" -").strip()
-    if nombre == "":
-        nombre = "sin responsable"
-
-    return nombre, rm_clean
+def _split_responsable(values: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """(nombre, RM) por fila; vacíos → "sin responsable" / "sin RM"."""
+    return classify.split_rm(values, RM_PATTERN, "sin responsable", "sin RM")
 
 # ---------- clasificación tipo de procedimiento ---------------------------
 PROC_MAP = {
@@ -54,87 +80,232 @@ PROC_MAP = {
     "terapia neural": "terapia neural",
 }
 
-def _clasificar_proc(actividad: str | float | int) -> str:
-    if not isinstance(actividad, str):
-        return "otro"
-    act_low = _remove_accents(actividad.lower())
-    for clave, categoria in PROC_MAP.items():
-        if clave in act_low:
-            return categoria
-    return "otro"
+# Autómata sobre las claves de PROC_MAP (gana la primera clave del catálogo)
+PROC_AUTOMATON = classify.KeywordAutomaton(PROC_MAP)
+
+def _clasificar_proc(actividades: pd.Series) -> pd.Series:
+    """Categoría por fila según la primera clave de PROC_MAP contenida (sin tildes)."""
+    return classify.classify(
+        actividades, PROC_AUTOMATON, lambda act: _remove_accents(act.lower()), "otro"
+    )
+
+# ---------------------- Lectura de silver1 ------------------------------
+def _read_silver(key: str, timer: metrics.StageTimer,
+                 validator: Optional[rules.Validator] = None,
+                 rejected: Optional[List[pd.DataFrame]] = None) -> pd.DataFrame:
+    """Descarga, parsea, transforma y valida un CSV de silver1.
+
+    Las filas en cuarentena se agregan a `rejected` y no se devuelven.
+    """
+    with timer.stage("download") as m:
+        fh = storage.open_stream(s3, BUCKET, key)   # mmap si silver es local
+        fh.seek(0, io.SEEK_END)
+        m["bytes"] = fh.tell()
+        fh.seek(0)
+    with timer.stage("parse") as m:
+        df = pd.read_csv(fh, dtype=str, encoding="utf-8-sig")
+        m["rows"] = len(df)
+    fh.close()
+
+    with timer.stage("transform", rows=len(df)):
+        # split responsable & RM
+        nombres, rms = _split_responsable(df["medico interno responsable"])
+        df["medico interno responsable"] = nombres
+        df["rm"] = rms
+
+        # tipo de procedimiento
+        df["tipo de procedimiento"] = _clasificar_proc(df["actividad_servicio"])
+
+    if validator is not None:
+        with timer.stage("validate", rows=len(df)):
+            df, bad = validator.split(df, QUALITY_QUARANTINE)
+        if len(bad):
+            rejected.append(bad)
+    return df
+
+def _gold_columns(keys: List[str], timer: metrics.StageTimer) -> List[str]:
+    """Columnas de salida sin descargar los archivos: las mismas (y en el mismo orden)
+    que dejaría pd.concat de todos los CSV transformados."""
+    columns: List[str] = []
+    with timer.stage("download") as m:
+        m["bytes"] = 0
+        for key in keys:
+            head = s3.get_object(Bucket=BUCKET, Key=key, Range=f"bytes=0-{HEADER_BYTES - 1}")["Body"].read()
+            if b"\n" not in head and len(head) >= HEADER_BYTES:   # encabezado más largo que el rango
+                head = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+            m["bytes"] += len(head)
+            names = list(pd.read_csv(io.BytesIO(head), dtype=str, encoding="utf-8-sig", nrows=0).columns)
+            for name in names + ADDED_COLS:
+                if name not in columns:
+                    columns.append(name)
+    return columns
+
+# ---------------------- Reporte de calidad -------------------------------
+def _write_quality(validator: rules.Validator, rejected: List[pd.DataFrame], ts: str,
+                   columns: List[str], timer: metrics.StageTimer) -> dict:
+    """Sube la cuarentena (si hay filas) y el reporte JSON; devuelve el resumen de la respuesta."""
+    quarantine_key = None
+    with timer.stage("upload") as m:
+        if rejected:
+            quarantine_key = f"{QUARANTINE_PREFIX}procedimientos_quarantine_{ts}.csv"
+            with s3_stream.MultipartWriter(s3, GOLD_BUCKET, quarantine_key) as out:
+                stream = s3_stream.CsvStream(out, columns + [rules.FAILED_COL])
+                for bad in rejected:
+                    stream.write(bad)
+                m["bytes"] = stream.close()["bytes"]
+        report = validator.report(quarantined=sum(len(bad) for bad in rejected))
+        report["generated_at"] = datetime.now(CO_TZ).isoformat(timespec="seconds")
+        report["quarantine"] = f"s3://{GOLD_BUCKET}/{quarantine_key}" if quarantine_key else None
+        report_key = f"{REPORT_PREFIX}procedimientos_quality_{ts}.json"
+        s3.put_object(Bucket=GOLD_BUCKET, Key=report_key, ContentType="application/json",
+                      Body=json.dumps(report, ensure_ascii=False).encode("utf-8"))
+    return {
+        "status": report["status"],
+        "rows": report["rows"],
+        "rows_failed": report["rows_failed"],
+        "quarantined": report["quarantined"],
+        "report": f"s3://{GOLD_BUCKET}/{report_key}",
+    }
+
+# ---------------------- Compactación de gold -----------------------------
+# Solo desde LambdaCompactGold (regla programada, mismo zip, más memoria y tiempo):
+# dentro de LambdaQuality un OOM o un timeout no los atrapa ningún except.
+def compact_handler(event, context):  # noqa: N802
+    """Compacta gold procedimientos; un error se informa en la respuesta."""
+    timer = metrics.StageTimer("compact")
+    startup = runtime.invocation()
+    fmt = parquet_writer.output_format("procedimientos")
+    prefix = GOLD_PARQUET_PREFIX if fmt == "parquet" else GOLD1_PREFIX
+    with timer.stage("compact"):
+        try:
+            compacted = compaction.compact(s3, GOLD_BUCKET, prefix, fmt, GOLD_SCHEMA,
+                                           force=bool((event or {}).get("force", True)))
+        except (ClientError, BotoCoreError, ValueError) as exc:
+            compacted = {"action": "error", "error": f"{type(exc).__name__}: {exc}"}
+    return timer.finish({
+        "status": "ERROR" if compacted["action"] == "error" else "SUCCESS",
+        "compaction": compacted,
+        **startup,
+    })
 
 # ---------------------- Lambda handler ------------------------------------
 def lambda_handler(event, context):  # noqa: N802
-    # 0) ¿Debemos lanzar el Glue Job?
-    job_run_id = None
-    try:
-        head = s3.head_object(Bucket="serverless-architecture-smes-analytics-gold-zone", Key=PACIENTES_KEY)
-        last_mod: datetime = head["LastModified"]         # UTC tz-aware
-        age_sec = (datetime.now(timezone.utc) - last_mod).total_seconds()
-
-        if age_sec <= 600:  # 10 minutos
-            resp = glue.start_job_run(JobName="prediction_pacientes")
-            job_run_id = resp["JobRunId"]
-    except s3.exceptions.NoSuchKey:
-        # El archivo pacientes.csv aún no existe; simplemente continúa
-        pass
+    timer = metrics.StageTimer("quality")
+    startup = runtime.invocation()
+    event = event or {}
+    fmt = parquet_writer.output_format("procedimientos")
+
+    # 0) Job de predicción: anotar cambios de pacientes y lanzar un solo run por ráfaga
+    owner = event.get("owner") or getattr(context, "aws_request_id", "local")
+    flush = bool(event.get("flush_prediction"))
+    with timer.stage("trigger"):
+        if storage.is_local(GOLD_BUCKET):   # backfill local: el job de Glue se corre aparte
+            prediction = {"action": "offline", "run_id": None, "coalesced": 0, "wait_s": 0, "owner": owner}
+        else:
+            prediction = trigger.coalesce(s3, glue, GOLD_BUCKET, PACIENTES_KEY, owner, flush=flush)
+    job_run_id = prediction["run_id"] if prediction["action"] == "started" else None
+
+    if flush:   # vuelta de la espera de la Step Function: no hay carga nueva en silver1
+        return timer.finish({
+            "status": "FLUSH",
+            "triggered_job": job_run_id,
+            "prediction": prediction,
+            **startup,
+        })
 
     # 1) Listar CSV en silver1
-    paginator = s3.get_paginator("list_objects_v2")
-    csv_keys: List[str] = [
-        obj["Key"]
-        for page in paginator.paginate(Bucket=BUCKET, Prefix=SILVER1_PREFIX)
-        for obj in page.get("Contents", [])
-        if obj["Key"].lower().endswith(".csv")
-    ]
+    with timer.stage("list") as m:
+        paginator = s3.get_paginator("list_objects_v2")
+        csv_objects: List[dict] = [
+            obj
+            for page in paginator.paginate(Bucket=BUCKET, Prefix=SILVER1_PREFIX)
+            for obj in page.get("Contents", [])
+            if obj["Key"].lower().endswith(".csv")
+        ]
+        csv_keys = [obj["Key"] for obj in csv_objects]
+        m["rows"] = len(csv_keys)
 
     if not csv_keys:
-        return {
+        return timer.finish({
             "status": "NO_DATA",
             "message": "No se encontraron CSV en silver1",
             "triggered_job": job_run_id,
-        }
-
-    frames: List[pd.DataFrame] = []
+            "prediction": prediction,
+            **startup,
+        })
 
-    # 2) Leer y transformar
-    for key in csv_keys:
-        body = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
-        df = pd.read_csv(io.BytesIO(body), dtype=str, encoding="utf-8-sig")
-
-        # 2.1 split responsable & RM
-        nombres, rms = zip(*df["medico interno responsable"].map(_split_responsable))
-        df["medico interno responsable"] = nombres
-        df["rm"] = rms
+    # 2-4) Leer, transformar y guardar a gold1 con timestamp Bogotá + hash de las entradas
+    # (dos corridas en el mismo minuto no se pisan; un reintento reescribe la misma key)
+    ts = f"{datetime.now(CO_TZ).strftime('%d%m%Y%H%M')}_{naming.batch_suffix(csv_objects)}"
+    validator = rules.Validator("procedimientos") if QUALITY_RULES else None
+    rejected: List[pd.DataFrame] = []
+    if fmt != "parquet" and CONSOLIDATION_MODE == "stream":
+        gold_key = f"{GOLD1_PREFIX}procedimientos_gold_{ts}.csv"
+        gold_columns = _gold_columns(csv_keys, timer)
+        with s3_stream.MultipartWriter(s3, GOLD_BUCKET, gold_key) as out:
+            stream = s3_stream.CsvStream(out, gold_columns)
+            for key in csv_keys:
+                df = _read_silver(key, timer, validator, rejected)
+                with timer.stage("upload") as m:   # serializa y sube partes a medida que se llenan
+                    m["bytes"] = stream.write(df)
+                del df
+            with timer.stage("upload"):
+                stream.close()
+        written = [gold_key]
+    else:
+        frames = [_read_silver(key, timer, validator, rejected) for key in csv_keys]
 
-        # 2.2 tipo de procedimiento
-        df["tipo de procedimiento"] = df["actividad_servicio"].map(_clasificar_proc)
+        # 3) Consolidar
+        with timer.stage("transform"):
+            gold = pd.concat(frames, ignore_index=True)
+        gold_columns = list(gold.columns)
 
-        frames.append(df)
+        # 4) CSV o Parquet particionado por mes
+        if fmt == "parquet":
+            with timer.stage("upload"):   # incluye la serialización Parquet
+                written = parquet_writer.write_parquet(
+                    s3, gold, GOLD_BUCKET, GOLD_PARQUET_PREFIX, f"procedimientos_gold_{ts}",
+                    schema=GOLD_SCHEMA, partition_col="fecha",
+                )
+        else:
+            gold_name = f"procedimientos_gold_{ts}.csv"
+            with timer.stage("serialize"):
+                csv_buffer = io.BytesIO()
+                gold.to_csv(csv_buffer, index=False, encoding="utf-8-sig", lineterminator="\n")
+                csv_buffer.seek(0)
+            gold_key = f"{GOLD1_PREFIX}{gold_name}"
+            with timer.stage("upload", nbytes=csv_buffer.getbuffer().nbytes):
+                s3.put_object(Bucket=GOLD_BUCKET, Key=gold_key, Body=csv_buffer.getvalue())
+            written = [gold_key]
 
-    # 3) Consolidar
-    gold = pd.concat(frames, ignore_index=True)
+    # 4.1) Reporte de calidad (y cuarentena) junto a la salida gold
+    quality = _write_quality(validator, rejected, ts, gold_columns, timer) if validator else {"status": "disabled"}
 
-    # 4) Guardar a gold1 con timestamp Bogotá
-    ts = datetime.now(CO_TZ).strftime("%d%m%Y%H%M")
-    gold_name = f"procedimientos_gold_{ts}.csv"
-    csv_buffer = io.BytesIO()
-    gold.to_csv(csv_buffer, index=False, encoding="utf-8-sig", lineterminator="\n")
-    csv_buffer.seek(0)
-    gold_key = f"{GOLD1_PREFIX}{gold_name}"
-    s3.put_object(Bucket="serverless-architecture-smes-analytics-gold-zone", Key=gold_key, Body=csv_buffer.getvalue())
+    # 4.2) Declarar tabla y particiones nuevas en el catálogo
+    with timer.stage("catalog"):
+        synced = catalog.register(
+            GOLD_TABLE, GOLD_BUCKET, GOLD_PARQUET_PREFIX if fmt == "parquet" else GOLD1_PREFIX,
+            catalog.columns(gold_columns, GOLD_SCHEMA, fmt), fmt,
+            keys=written, partitioned=fmt == "parquet", glue=glue,
+        )
 
     # 5) Mover CSV procesados a silver2
-    for key in csv_keys:
-        dest_key = f"{SILVER2_PREFIX}{os.path.basename(key)}"
-        s3.copy_object(
-            Bucket=BUCKET, CopySource={"Bucket": BUCKET, "Key": key}, Key=dest_key
+    with timer.stage("archive") as m:
+        archive = s3_move.move_objects(
+            s3, BUCKET, [(key, f"{SILVER2_PREFIX}{os.path.basename(key)}") for key in csv_keys]
         )
-        s3.delete_object(Bucket=BUCKET, Key=key)
+        m["rows"] = archive["moved"]
 
-    return {
-        "status": "SUCCESS",
+    return timer.finish({
+        "status": "SUCCESS" if not archive["failed"] else "PARTIAL",
         "processed_files": len(csv_keys),
-        "output": f"s3://{BUCKET}/{gold_key}",
+        "moved": archive["moved"],
+        "archive_errors": s3_move.failures(archive),
+        "output": f"s3://{GOLD_BUCKET}/{written[0]}",
+        "files": len(written),
+        "quality": quality,
+        "catalog": synced,
         "triggered_job": job_run_id,
-    }
+        "prediction": prediction,
+        **startup,
+    })
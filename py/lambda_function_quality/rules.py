@@ -0,0 +1,259 @@
+# rules.py  (reglas de calidad declarativas por dataset, evaluadas en una pasada vectorizada)
+#
+# Cada dataset declara una lista de reglas (dicts, serializables a JSON):
+#   schema    {"columns": [...]}                          columnas obligatorias
+#   not_null  {"column"}                                  vacío / NaN falla
+#   null_ratio {"column", "max"}                          proporción de vacíos en todo el lote
+#   allowed   {"column", "values"}                        valor fuera del conjunto falla
+#   date      {"column", "format", "min", "max"}          fecha ilegible o fuera de rango falla
+#   regex     {"column", "pattern"}                       valor que no cumple el patrón completo falla
+#   unique    {"columns"}                                 fila repetida (en el archivo o en uno anterior)
+# "severity": "error" marca la fila como fallida (candidata a cuarentena); "warn" solo se informa.
+# Las reglas de fila se evalúan sobre los valores únicos de cada columna (pd.factorize) y su
+# resultado se expande a un bit por regla; null_ratio y schema se resuelven en report().
+from __future__ import annotations
+
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import runtime
+
+np = runtime.lazy("numpy")
+pd = runtime.lazy("pandas")
+
+CO_TZ = timezone(timedelta(hours=-5))  # America/Bogota
+SAMPLES = 5                            # valores de ejemplo por regla en el reporte
+FAILED_COL = "reglas_fallidas"         # columna agregada a las filas en cuarentena
+
+_ROW_RULES = {"not_null", "allowed", "date", "regex", "unique"}
+_SAMPLED   = {"allowed", "date", "regex"}   # reglas cuyo valor fallido sirve de ejemplo
+
+# ------------------------- Reglas por dataset ------------------------------
+KEY_COLS = ["nombre del paciente", "numero de documento - historia clinica", "actividad_servicio"]
+
+RULES: Dict[str, List[dict]] = {
+    "procedimientos": [
+        {"rule": "schema", "columns": ["fecha", *KEY_COLS, "medico interno responsable",
+                                       "rm", "tipo de procedimiento"]},
+        {"rule": "not_null", "column": "fecha", "severity": "error"},
+        {"rule": "date", "column": "fecha", "format": "%d/%m/%Y", "min": "2015-01-01", "max": "hoy",
+         "severity": "error"},
+        {"rule": "null_ratio", "column": "fecha", "max": 0.01},
+        *({"rule": "not_null", "column": c, "severity": "error"} for c in KEY_COLS),
+        {"rule": "regex", "column": "numero de documento - historia clinica", "pattern": r"\d{5,12}",
+         "severity": "warn"},
+        {"rule": "regex", "column": "rm", "pattern": r"\d{1,10}|sin RM", "severity": "warn"},
+        {"rule": "allowed", "column": "tipo de procedimiento",
+         "values": ["biopuntura", "ozonoterapia", "sueroterapia", "terapia neural", "otro"],
+         "severity": "error"},
+        {"rule": "unique", "columns": [*KEY_COLS, "fecha"], "severity": "warn"},
+    ],
+}
+
+
+def rule_name(rule: dict) -> str:
+    """Nombre estable de una regla para el reporte ("regex:rm", "unique:a+b", "schema")."""
+    target = rule.get("column") or "+".join(rule.get("columns", [])) if rule["rule"] != "schema" else ""
+    return f"{rule['rule']}:{target}" if target else rule["rule"]
+
+
+def _bound(value: Optional[str]) -> Optional[pd.Timestamp]:
+    if value is None:
+        return None
+    if value == "hoy":   # fechas sin hora: mayor que hoy (Bogotá) es futura
+        return pd.Timestamp(datetime.now(CO_TZ).date())
+    return pd.Timestamp(value)
+
+
+# ------------------- Evaluación por valor único ----------------------------
+_FNV = 0x100000001B3   # combina los hashes de varias columnas en uno por fila
+
+
+class _Factorized:
+    """Códigos y valores únicos de una columna: una sola factorización por frame,
+    compartida por todas las reglas que miran esa columna."""
+
+    def __init__(self, values: pd.Series):
+        self.codes, uniques = pd.factorize(values)
+        self.uniques = pd.Series(uniques, dtype=object)
+        self.missing = self.codes < 0
+        self._text: Optional[pd.Series] = None
+
+    @property
+    def text(self) -> pd.Series:
+        """Únicos como texto sin espacios alrededor."""
+        if self._text is None:
+            self._text = self.uniques.astype(str).str.strip()
+        return self._text
+
+    def expand(self, per_unique: np.ndarray) -> np.ndarray:
+        """bool por valor único → bool por fila (NaN → False)."""
+        if not len(per_unique):
+            return np.zeros(len(self.codes), dtype=bool)
+        return per_unique[self.codes] & ~self.missing
+
+    def blank(self) -> np.ndarray:
+        return self.missing | self.expand(self.text.eq("").to_numpy())
+
+    def hashes(self) -> np.ndarray:
+        per_unique = pd.util.hash_array(self.uniques.to_numpy())
+        return np.where(self.missing, np.uint64(0), per_unique[self.codes] if len(per_unique) else np.uint64(0))
+
+
+def _check_allowed(rule: dict):
+    allowed = list(rule["values"])
+    return lambda text: (text.ne("") & ~text.isin(allowed)).to_numpy()
+
+
+def _check_regex(rule: dict):
+    pattern = re.compile(rule["pattern"])
+    return lambda text: (text.ne("") & ~text.str.fullmatch(pattern).astype(bool)).to_numpy()
+
+
+def _check_date(rule: dict):
+    low, high = _bound(rule.get("min")), _bound(rule.get("max"))
+
+    def check(text: pd.Series) -> np.ndarray:
+        dates = pd.to_datetime(text, format=rule.get("format"), errors="coerce")
+        bad = dates.isna()
+        if low is not None:
+            bad |= dates < low
+        if high is not None:
+            bad |= dates > high
+        return (bad & text.ne("")).to_numpy()
+    return check
+
+
+def _isin_sorted(values: np.ndarray, ordered: np.ndarray) -> np.ndarray:
+    if not ordered.size:
+        return np.zeros(len(values), dtype=bool)
+    idx = np.searchsorted(ordered, values).clip(max=ordered.size - 1)
+    return ordered[idx] == values
+
+
+class Validator:
+    """Evalúa las reglas de un dataset archivo por archivo y acumula el reporte del lote."""
+
+    def __init__(self, dataset: str, rules: Optional[List[dict]] = None):
+        self.dataset = dataset
+        self.rules = list(RULES.get(dataset, []) if rules is None else rules)
+        self.row_rules = [r for r in self.rules if r["rule"] in _ROW_RULES]
+        if len(self.row_rules) > 63:
+            raise ValueError("más de 63 reglas de fila: no caben en la máscara de bits")
+        self.names = [rule_name(r) for r in self.row_rules]
+        self._index = {id(r): i for i, r in enumerate(self.row_rules)}
+        self._used = list(dict.fromkeys(c for r in self.rules if r["rule"] != "schema"
+                                        for c in r.get("columns", [r.get("column")])))
+        self._error_bits = sum(1 << i for i, r in enumerate(self.row_rules)
+                               if r.get("severity", "error") == "error")
+        self._checks = {
+            "allowed": {i: _check_allowed(r) for i, r in enumerate(self.row_rules) if r["rule"] == "allowed"},
+            "regex": {i: _check_regex(r) for i, r in enumerate(self.row_rules) if r["rule"] == "regex"},
+            "date": {i: _check_date(r) for i, r in enumerate(self.row_rules) if r["rule"] == "date"},
+        }
+        self.rows = 0
+        self.rows_failed = 0
+        self.rows_warned = 0
+        self.columns: List[str] = []
+        self.failed = [0] * len(self.row_rules)
+        self.samples: List[List[str]] = [[] for _ in self.row_rules]
+        self.nulls: Dict[str, int] = {}
+        self._seen: Dict[int, np.ndarray] = {}   # hashes de filas ya vistas por regla unique
+
+    # ---------------------------------------------------------------------
+    def _mask(self, i: int, rule: dict, cols: Dict[str, _Factorized]) -> Optional[np.ndarray]:
+        kind = rule["rule"]
+        if kind == "unique":
+            keys = [cols[c] for c in rule["columns"] if c in cols]
+            if not keys:
+                return None
+            hashes = keys[0].hashes()
+            for col in keys[1:]:
+                hashes = hashes * np.uint64(_FNV) ^ col.hashes()
+            dup = pd.Series(hashes).duplicated().to_numpy()
+            seen = self._seen.get(i, np.empty(0, dtype=np.uint64))
+            dup |= _isin_sorted(hashes, seen)
+            # los ya vistos quedan ordenados: el sort estable sobre dos tramos ordenados es casi lineal
+            self._seen[i] = np.sort(np.concatenate([seen, np.unique(hashes)]), kind="stable")
+            return dup
+        col = cols.get(rule["column"])
+        if col is None:
+            return None   # lo informa la regla schema
+        if kind == "not_null":
+            return col.blank()
+        return col.expand(self._checks[kind][i](col.text))
+
+    def evaluate(self, df: pd.DataFrame) -> np.ndarray:
+        """Un bit por regla de fila (bit i = regla i falló); actualiza los contadores del lote."""
+        bits = np.zeros(len(df), dtype=np.uint64)
+        cols = {name: _Factorized(df[name]) for name in self._used if name in df.columns}
+        for i, rule in enumerate(self.row_rules):
+            mask = self._mask(i, rule, cols)
+            if mask is None or not mask.any():
+                continue
+            bits |= mask.astype(np.uint64) << np.uint64(i)
+            self.failed[i] += int(mask.sum())
+            if rule["rule"] in _SAMPLED and len(self.samples[i]) < SAMPLES:
+                sample = df[rule["column"]][mask].drop_duplicates().head(SAMPLES).astype(str).tolist()
+                self.samples[i] += [v for v in sample if v not in self.samples[i]][:SAMPLES - len(self.samples[i])]
+
+        self.rows += len(df)
+        for name in df.columns:
+            if name not in self.columns:
+                self.columns.append(name)
+        for rule in self.rules:
+            if rule["rule"] == "null_ratio" and rule["column"] in df.columns:
+                self.nulls[rule["column"]] = self.nulls.get(rule["column"], 0) + int(cols[rule["column"]].blank().sum())
+        errors = (bits & np.uint64(self._error_bits)) != 0
+        self.rows_failed += int(errors.sum())
+        self.rows_warned += int(((bits != 0) & ~errors).sum())
+        return bits
+
+    def split(self, df: pd.DataFrame, quarantine: bool) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """(filas válidas, filas en cuarentena con FAILED_COL). Sin `quarantine` solo evalúa."""
+        bits = self.evaluate(df)
+        bad = (bits & np.uint64(self._error_bits)) != 0
+        if not quarantine or not bad.any():
+            return df, df.iloc[0:0]
+        rejected = df[bad].copy()
+        codes, patterns = pd.factorize(bits[bad])
+        labels = [";".join(n for j, n in enumerate(self.names) if int(p) >> j & 1) for p in patterns]
+        rejected[FAILED_COL] = np.asarray(labels, dtype=object)[codes]
+        return df[~bad], rejected
+
+    # ---------------------------------------------------------------------
+    def report(self, quarantined: int = 0) -> dict:
+        """Resumen compacto del lote: estado, filas fallidas y detalle por regla."""
+        results = []
+        status = "PASS"
+        for rule in self.rules:
+            kind, severity = rule["rule"], rule.get("severity", "error")
+            entry = {"rule": rule_name(rule), "severity": severity}
+            if kind == "schema":
+                missing = [c for c in rule["columns"] if c not in self.columns]
+                entry.update(passed=not missing, missing=missing)
+            elif kind == "null_ratio":
+                ratio = self.nulls.get(rule["column"], self.rows) / self.rows if self.rows else 0.0
+                entry.update(passed=ratio <= rule["max"], ratio=round(ratio, 6), max=rule["max"])
+            else:
+                i = self._index[id(rule)]
+                skipped = (kind == "unique" and not any(c in self.columns for c in rule["columns"])) or \
+                          (kind != "unique" and rule["column"] not in self.columns)
+                entry.update(passed=not self.failed[i] and not skipped, failed=self.failed[i])
+                if skipped:
+                    entry["skipped"] = True
+                if self.samples[i]:
+                    entry["samples"] = self.samples[i]
+            if not entry["passed"]:
+                status = "FAIL" if severity == "error" else (status if status == "FAIL" else "WARN")
+            results.append(entry)
+        return {
+            "dataset": self.dataset,
+            "status": status,
+            "rows": self.rows,
+            "rows_failed": self.rows_failed,
+            "rows_warned": self.rows_warned,
+            "quarantined": quarantined,
+            "rules": results,
+        }
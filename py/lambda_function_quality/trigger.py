@@ -0,0 +1,167 @@
+# trigger.py  (lanzamiento del job de predicción con debounce: una ráfaga de cargas → un solo run)
+#
+# Estado en s3://<gold>/state/prediction/trigger.json, escrito con PUT condicional:
+#   covered  ETag de pacientes que cubrió el último run lanzado
+#   pending  {"etag", "since", "last", "requests", "owner"} mientras hay cambios sin run
+#   last_run {"run_id", "started_at", "coalesced"}
+#
+# Cada invocación que ve un ETag nuevo de pacientes solo anota el pendiente y pasa a ser
+# su dueña. El run se lanza cuando pasan DEBOUNCE_S sin cambios nuevos (lo hace la dueña
+# al volver de la espera de la Step Function) o cuando el pendiente supera MAX_WAIT_S
+# (cualquier invocación). Si el job ya corre, el pendiente espera a que termine.
+# Si la ejecución dueña falla, la Step Function igual vuelve tras el debounce (Catch de
+# LambdaQuality) y la regla FlushPredictionPendingSweep vacía cada MAX_WAIT_S cualquier
+# pendiente vencido, aunque su dueña ya no exista.
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+JOB_NAME   = os.environ.get("PREDICTION_JOB", "prediction_pacientes")
+DEBOUNCE_S = int(os.environ.get("PREDICTION_DEBOUNCE_S", "120"))
+MAX_WAIT_S = int(os.environ.get("PREDICTION_MAX_WAIT_S", "900"))
+WINDOW_S   = 600   # sin estado previo: solo cuenta un pacientes escrito en los últimos 10 min
+STATE_KEY  = "state/prediction/trigger.json"
+
+_ACTIVE    = {"STARTING", "RUNNING", "STOPPING", "WAITING"}
+_CONFLICT  = {"PreconditionFailed", "ConditionalRequestConflict"}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(ts: datetime) -> str:
+    return ts.isoformat(timespec="seconds")
+
+
+def _age(value: str, now: datetime) -> float:
+    return (now - datetime.fromisoformat(value)).total_seconds()
+
+
+def _read(s3, bucket: str) -> Tuple[dict, Optional[str]]:
+    """(estado, etag) o ({}, None) si aún no existe."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=STATE_KEY)
+    except s3.exceptions.NoSuchKey:
+        return {}, None
+    return json.loads(obj["Body"].read()), obj["ETag"]
+
+
+def _write(s3, bucket: str, state: dict, etag: Optional[str]) -> bool:
+    """PUT condicional; False si otra invocación cambió el estado primero."""
+    cond = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        s3.put_object(Bucket=bucket, Key=STATE_KEY, Body=json.dumps(state).encode("utf-8"),
+                      ContentType="application/json", **cond)
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") in _CONFLICT:
+            return False
+        raise
+    return True
+
+
+def _source(s3, bucket: str, key: str) -> Optional[dict]:
+    try:
+        return s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") in {"404", "NoSuchKey", "NotFound"}:
+            return None
+        raise
+
+
+def _job_active(glue) -> bool:
+    runs = glue.get_job_runs(JobName=JOB_NAME, MaxResults=5).get("JobRuns", [])
+    return any(run.get("JobRunState") in _ACTIVE for run in runs)
+
+
+def _observe(s3, bucket: str, key: str, owner: str, now: datetime) -> Tuple[dict, Optional[str]]:
+    """Anota un pendiente (y toma su propiedad) si pacientes cambió; devuelve (estado, etag)."""
+    for _ in range(3):   # reintento corto ante escrituras concurrentes del estado
+        state, etag = _read(s3, bucket)
+        head = _source(s3, bucket, key)
+        if head is None:
+            return state, etag
+        seen = head["ETag"]
+        pending = state.get("pending")
+        if seen == state.get("covered") or (pending and seen == pending["etag"]):
+            return state, etag
+        if not state and (now - head["LastModified"]).total_seconds() > WINDOW_S:
+            return state, etag
+        state["pending"] = {
+            "etag": seen,
+            "since": pending["since"] if pending else _iso(now),
+            "last": _iso(now),
+            "requests": (pending["requests"] if pending else 0) + 1,
+            "owner": owner,
+        }
+        if _write(s3, bucket, state, etag):
+            break
+    return _read(s3, bucket)
+
+
+def _start(s3, glue, bucket: str, state: dict, etag: Optional[str], now: datetime) -> Tuple[str, Optional[str]]:
+    """Reclama el pendiente con PUT condicional y lanza el job; devuelve (acción, run_id)."""
+    pending = state["pending"]
+    claimed = {
+        "covered": pending["etag"],
+        "last_run": {"run_id": None, "started_at": _iso(now), "coalesced": pending["requests"]},
+    }
+    if not _write(s3, bucket, claimed, etag):
+        return "coalesced", None   # otra invocación lo reclamó primero
+    try:
+        run_id = glue.start_job_run(JobName=JOB_NAME)["JobRunId"]
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") != "ConcurrentRunsExceededException":
+            raise
+        current, current_etag = _read(s3, bucket)   # devolver el pendiente (si nadie lo tocó)
+        if current == claimed:
+            _write(s3, bucket, state, current_etag)
+        return "running", None
+    claimed["last_run"]["run_id"] = run_id
+    current, current_etag = _read(s3, bucket)
+    if current.get("last_run", {}).get("started_at") == claimed["last_run"]["started_at"]:
+        current["last_run"] = claimed["last_run"]
+        _write(s3, bucket, current, current_etag)
+    return "started", run_id
+
+
+def coalesce(s3, glue, bucket: str, key: str, owner: str, flush: bool = False) -> dict:
+    """Decide si esta invocación lanza el job de predicción.
+
+    `owner` identifica a la ejecución (la Step Function lo reenvía al volver de la espera);
+    `flush` indica que no hay carga nueva que procesar, solo revisar el pendiente.
+    Devuelve {"action", "run_id", "coalesced", "wait_s", "owner"}: wait_s > 0 pide a la
+    Step Function volver a invocar con {"flush_prediction": true, "owner": owner}.
+    """
+    now = _now()
+    state, etag = _read(s3, bucket) if flush else _observe(s3, bucket, key, owner, now)
+    pending = state.get("pending")
+    result = {"action": "idle", "run_id": None, "coalesced": 0, "wait_s": 0, "owner": owner}
+    if not pending:
+        last = state.get("last_run") or {}
+        if flush and last:
+            result.update(action="coalesced", run_id=last.get("run_id"))
+        return result
+
+    result["coalesced"] = pending["requests"]
+    quiet = _age(pending["last"], now)
+    overdue = _age(pending["since"], now) >= MAX_WAIT_S
+    mine = pending["owner"] == owner
+    if not overdue and not (mine and quiet >= DEBOUNCE_S):
+        if not mine:   # la dueña más reciente se encarga; esta ejecución termina
+            result["action"] = "coalesced"
+            return result
+        result.update(action="pending", wait_s=max(1, int(DEBOUNCE_S - quiet)))
+        return result
+    if _job_active(glue):
+        result.update(action="running", wait_s=DEBOUNCE_S if mine else 0)
+        return result
+
+    action, run_id = _start(s3, glue, bucket, state, etag, now)
+    result.update(action=action, run_id=run_id, wait_s=DEBOUNCE_S if action == "running" and mine else 0)
+    return result
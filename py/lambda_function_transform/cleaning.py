@@ -0,0 +1,199 @@
+# cleaning.py  (etapa de limpieza vectorizada: por columna, sin lambdas por celda)
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import runtime
+
+np = runtime.lazy("numpy")
+pd = runtime.lazy("pandas")   # detect_format / parse_text (ruta rápida de pacientes) no lo importan
+
+DATE_FMT = "%d/%m/%Y"
+
+# Formatos de fecha conocidos, en orden de preferencia día-primero: "01/02/2024" es 1 de
+# febrero en todos los flujos. Los mes-primero solo ganan si el valor no admite otra lectura.
+DATE_FORMATS = (
+    "%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%y", "%d-%m-%Y", "%d.%m.%Y",
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y/%m/%d",
+    "%m/%d/%Y", "%m/%d/%Y %H:%M:%S",
+)
+DATE_SAMPLE = 50          # valores distintos con que se detecta el formato de una columna
+DATE_MEMO   = 200_000     # textos memoizados por parser antes de vaciar la caché
+DATE_STATS  = "fechas"    # clave en df.attrs con los contadores de clean_frame
+
+
+def _map_unique(values: pd.Series, fn) -> pd.Series:
+    """Aplica `fn` solo a los valores únicos (en orden de aparición) y los expande."""
+    codes, uniques = pd.factorize(values)
+    out = fn(pd.Series(uniques)).reindex(codes)  # código -1 (NaN) → NaN/NaT
+    out.index = values.index
+    return out
+
+
+def strip_cells(df: pd.DataFrame) -> pd.DataFrame:
+    """NaN → "" y strip de cada celda; equivale a applymap(str(x).strip())."""
+    out = df.copy()
+    for i in range(out.shape[1]):  # por posición: tolera columnas duplicadas
+        col = out.iloc[:, i]
+        out.isetitem(i, _map_unique(col, lambda u: u.astype(str).str.strip()).fillna(""))
+    return out
+
+
+def drop_empty_keys(df: pd.DataFrame, key_cols: List[str]) -> pd.DataFrame:
+    """Elimina las filas cuyas columnas clave están todas vacías ("")."""
+    empty = (df[key_cols] == "").all(axis=1)
+    return df.loc[~empty]
+
+
+def _candidates(fmt: Optional[str] = None, dayfirst: bool = True) -> List[str]:
+    """`fmt` primero y luego DATE_FORMATS (con dayfirst=False, los mes-primero adelante)."""
+    order = list(DATE_FORMATS) if dayfirst else sorted(DATE_FORMATS, key=lambda f: not f.startswith("%m"))
+    return [fmt, *(f for f in order if f != fmt)] if fmt else order
+
+
+def _strptime(value: str, fmt: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(value, fmt)
+    except ValueError:
+        return None
+
+
+def detect_format(values: Iterable, dayfirst: bool = True, sample: int = DATE_SAMPLE) -> Optional[str]:
+    """Formato de DATE_FORMATS que lee más valores de una muestra de `sample` distintos."""
+    seen: Dict[str, None] = {}
+    for value in values:
+        text = "" if value is None or value != value else str(value).strip()   # NaN → ""
+        if text:
+            seen[text] = None
+            if len(seen) >= sample:
+                break
+    best, hits = None, 0
+    for fmt in _candidates(dayfirst=dayfirst):
+        n = sum(_strptime(text, fmt) is not None for text in seen)
+        if n > hits:
+            best, hits = fmt, n
+        if hits == len(seen):
+            break
+    return best
+
+
+def parse_text(value: str, fmt: Optional[str] = None, dayfirst: bool = True) -> Optional[datetime]:
+    """Un valor con la misma regla que DateParser (sin pandas); None si es ilegible."""
+    value = value.strip()
+    if not value:
+        return None
+    for candidate in _candidates(fmt, dayfirst):
+        parsed = _strptime(value, candidate)
+        if parsed is not None:
+            return parsed
+    return None
+
+
+class DateParser:
+    """Fechas de una columna: formato detectado una vez sobre una muestra, parseo
+    vectorizado solo de los valores únicos (memoizados entre bloques y archivos) y
+    contadores de valores ilegibles. Lo que el formato detectado no lee se intenta con
+    el resto de DATE_FORMATS; lo que ninguno lee queda NaT."""
+
+    def __init__(self, dayfirst: bool = True, fmt: Optional[str] = None):
+        self.dayfirst = dayfirst
+        self.format = fmt
+        self.values = 0        # valores no vacíos vistos
+        self.unparseable = 0   # de esos, los que quedaron NaT
+        self.samples: List[str] = []
+        self._memo: Dict[str, int] = {}   # texto → ns desde epoch (NaT = mínimo int64)
+
+    def _parse(self, texts: pd.Series) -> np.ndarray:
+        out = pd.Series(pd.NaT, index=texts.index, dtype="datetime64[ns]")
+        pending = texts.ne("")
+        if self.format is None and pending.any():
+            self.format = detect_format(texts[pending], self.dayfirst)
+        for fmt in _candidates(self.format, self.dayfirst):
+            if not pending.any():
+                break
+            parsed = pd.to_datetime(texts[pending], format=fmt, errors="coerce")
+            parsed = parsed[parsed.notna()]
+            out[parsed.index] = parsed
+            pending[parsed.index] = False
+        return out.to_numpy().view("int64")
+
+    def __call__(self, values: pd.Series) -> pd.Series:
+        """Serie datetime64 con el índice de `values`; vacío o ilegible → NaT."""
+        codes, uniques = pd.factorize(values)
+        texts = pd.Series(uniques, dtype=object).astype(str).str.strip().tolist()
+        todo = [t for t in dict.fromkeys(texts) if t not in self._memo]
+        if todo:
+            if len(self._memo) + len(todo) > DATE_MEMO:
+                self._memo.clear()
+            self._memo.update(zip(todo, self._parse(pd.Series(todo, dtype=object)).tolist()))
+        parsed = np.fromiter((self._memo[t] for t in texts), dtype=np.int64, count=len(texts))
+        parsed = np.append(parsed, np.iinfo(np.int64).min).view("datetime64[ns]")   # código -1 → NaT
+
+        # Contadores: por valor único y luego expandidos a filas
+        blank = np.append(np.asarray(texts, dtype=object) == "", True)
+        bad = np.isnat(parsed) & ~blank
+        self.values += int((~blank)[codes].sum())
+        if bad.any():
+            self.unparseable += int(bad[codes].sum())
+            self.samples += [texts[i] for i in np.flatnonzero(bad)[:max(0, 5 - len(self.samples))]]
+        return pd.Series(parsed[codes], index=values.index)
+
+    def counters(self) -> dict:
+        return {"format": self.format, "values": self.values,
+                "unparseable": self.unparseable, "samples": list(self.samples)}
+
+
+def merge_counters(counters: Iterable[Optional[dict]]) -> dict:
+    """Suma los contadores de varios DateParser (p. ej. uno por archivo)."""
+    total = {"format": None, "values": 0, "unparseable": 0, "samples": []}
+    for c in counters:
+        if not c:
+            continue
+        total["format"] = total["format"] or c["format"]
+        total["values"] += c["values"]
+        total["unparseable"] += c["unparseable"]
+        total["samples"] += [v for v in c["samples"] if v not in total["samples"]][:5 - len(total["samples"])]
+    return total
+
+
+def parse_dates(values: pd.Series, dayfirst: bool = True) -> pd.Series:
+    """Parsea una columna de fechas una sola vez; lo inválido queda NaT."""
+    return DateParser(dayfirst)(values)
+
+
+def correct_year(dates: pd.Series, from_year: int = 2023, to_year: int = 2024) -> pd.Series:
+    """Mueve a `to_year` las fechas de `from_year` (conserva día, mes y hora)."""
+    mask = dates.dt.year == from_year
+    if not mask.any():
+        return dates
+    out = dates.copy()
+    out.loc[mask] = dates.loc[mask] + pd.DateOffset(years=to_year - from_year)
+    return out
+
+
+def format_dates(dates: pd.Series, fmt: str = DATE_FMT) -> pd.Series:
+    """Formatea fechas ya parseadas; NaT queda como NaN ("" en el CSV)."""
+    return _map_unique(dates, lambda u: u.dt.strftime(fmt))
+
+
+def clean_frame(
+    df: pd.DataFrame,
+    date_col: str = "fecha",
+    dayfirst: bool = True,
+    year_fix: Tuple[int, int] | None = (2023, 2024),
+) -> pd.DataFrame:
+    """Strip + parseo único de `date_col` + corrección de año, por archivo.
+
+    Los contadores del parseo quedan en df.attrs[DATE_STATS] (viajan con el frame
+    aunque se haya limpiado en otro proceso).
+    """
+    df = strip_cells(df)
+    if date_col in df.columns:
+        parser = DateParser(dayfirst)
+        dates = parser(df[date_col])
+        if year_fix:
+            dates = correct_year(dates, *year_fix)
+        df[date_col] = dates
+        df.attrs[DATE_STATS] = parser.counters()
+    return df
@@ -1,31 +1,138 @@
 # lambda_handler.py  (handler principal de la única Lambda)
+import runtime  # noqa: I001  (primero: marca el inicio del init)
+
+import importlib
 import json
-import cups
-import pacientes
-import mensual_proc
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
 
-def lambda_handler(event, context):
-    """Orquesta los tres flujos: CUPS, Pacientes y Consolidador Mensual."""
-    
-    result = {"cups": None, "pacientes": None, "mensual_proc": None}
+from botocore.exceptions import ClientError
 
-    # Ejecutar CUPS
-    try:
-        result["cups"] = cups.process_cups(event, context)
-    except Exception as exc:
-        result["cups"] = {"status": "ERROR", "message": str(exc)}
+import ledger
+
+# ─────────── Configuración de la orquestación ────────────────────────────
+# Flujos que orquesta esta Lambda (nombre en `result` → "módulo.función").
+# Los módulos se importan al primer uso: un evento de pacientes no carga
+# openpyxl ni el parser de CUPS.
+FLOWS = {
+    "cups": "cups.process_cups",
+    "pacientes": "pacientes.process_pacientes",
+    "mensual_proc": "mensual_proc.process_mensual_proc",
+}
+BRONZE_BUCKET = "serverless-architecture-smes-analytics-bronze-zone"
+
+# "concurrent" ejecuta los flujos en paralelo; "sequential" uno tras otro
+ORCHESTRATION_MODE = os.environ.get("ORCHESTRATION_MODE", "concurrent")
+MAX_WORKERS        = int(os.environ.get("ORCHESTRATOR_MAX_WORKERS", len(FLOWS)))
+
+# Modo por evento: si el evento trae detail.object.key solo se procesa ese objeto
+EVENT_SCOPED = os.environ.get("EVENT_SCOPED", "true").lower() == "true"
+# Solo los objetos que cada flujo sabe leer: pacientes y mensual_proc reemplazan una
+# salida fija en gold, así que un archivo suelto en su prefijo no debe dispararlos.
+EXACT_ROUTES = {"bronze1/pacientes/pacientes.csv": "pacientes"}
+ROUTES = {   # prefijo → (flujo, extensión)
+    "bronze1/procedimientos/": ("cups", ".xlsx"),
+    "bronze1/mensual_proc/": ("mensual_proc", ".xlsx"),
+}
 
-    # Ejecutar Pacientes
+
+def _flow(name: str):
+    module, func = FLOWS[name].rsplit(".", 1)
+    return getattr(importlib.import_module(module), func)
+
+
+def _run_flow(name, event, context, s3, **kwargs) -> dict:
+    """Ejecuta un flujo aislando sus errores (también los de import) y midiendo su duración."""
+    start = time.perf_counter()
     try:
-        result["pacientes"] = pacientes.process_pacientes(event, context)
+        out = _flow(name)(event, context, s3=s3, **kwargs)
     except Exception as exc:
-        result["pacientes"] = {"status": "ERROR", "message": str(exc)}
+        out = {"status": "ERROR", "message": str(exc)}
+    out["duration_s"] = round(time.perf_counter() - start, 3)
+    return out
+
 
-    # Ejecutar Consolidado Mensual
+def _event_object(event):
+    """(key, versión de la subida) del evento S3 "Object Created", o (None, None)."""
+    obj = ((event or {}).get("detail") or {}).get("object") or {}
+    return obj.get("key"), obj.get("sequencer") or obj.get("etag") or ""
+
+
+def _resolve_key(s3, key: str) -> str:
+    """Las keys de eventos S3 pueden venir URL-encoded ('+' por espacio)."""
+    decoded = unquote_plus(key)
+    if decoded == key:
+        return key
     try:
-        result["mensual_proc"] = mensual_proc.process_mensual_proc(event, context)
-    except Exception as exc:
-        result["mensual_proc"] = {"status": "ERROR", "message": str(exc)}
+        s3.head_object(Bucket=BRONZE_BUCKET, Key=key)
+        return key
+    except ClientError:
+        return decoded
+
+
+def _route(key: str):
+    """Flujo del objeto (key exacta o prefijo + extensión) o None."""
+    if key in EXACT_ROUTES:
+        return EXACT_ROUTES[key]
+    return next((flow for prefix, (flow, ext) in ROUTES.items()
+                 if key.startswith(prefix) and key.lower().endswith(ext)), None)
+
+
+def _run_event_scoped(event, context, s3, key: str, version: str) -> dict:
+    """Enruta el objeto del evento a su flujo y lo procesa bajo una reclamación del ledger."""
+    result = {name: {"status": "SKIPPED", "message": "evento de otro flujo"} for name in FLOWS}
+    flow = _route(key)
+    if flow is None:
+        result["message"] = f"{key} no corresponde a ningún flujo: se ignora"
+        return result
+
+    owner = getattr(context, "aws_request_id", "local")
+    if not ledger.claim(s3, key, version, owner):
+        result[flow] = {"status": "DUPLICATE", "message": f"{key} ya fue reclamado por otra ejecución"}
+        return result
+
+    kwargs = {"keys": [key]} if flow == "cups" else {"key": key}
+    out = _run_flow(flow, event, context, s3, **kwargs)
+    if out["status"] == "ERROR":
+        ledger.release(s3, key, version)
+    else:
+        ledger.complete(s3, key, version, owner, out["status"])
+    result[flow] = out
+    return result
+
+
+def lambda_handler(event, context):
+    """Orquesta los tres flujos: CUPS, Pacientes y Consolidador Mensual."""
+    start = time.perf_counter()
+    startup = runtime.invocation()
+
+    # Un único cliente S3 (thread-safe), reutilizado entre invocaciones en caliente
+    s3 = runtime.client("s3")
+
+    event_key, version = _event_object(event)
+    if EVENT_SCOPED and event_key:
+        event_key = _resolve_key(s3, event_key)
+        result = _run_event_scoped(event, context, s3, event_key, version)
+        result["mode"] = "event"
+        result["event_key"] = event_key
+    elif ORCHESTRATION_MODE == "sequential":
+        result = {name: _run_flow(name, event, context, s3) for name in FLOWS}
+        result["mode"] = ORCHESTRATION_MODE
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as pool:
+            futures = {
+                name: pool.submit(_run_flow, name, event, context, s3)
+                for name in FLOWS
+            }
+            result = {name: fut.result() for name, fut in futures.items()}
+        result["mode"] = ORCHESTRATION_MODE
+
+    # Archivos idénticos a otros ya procesados (ledger de contenido): solo se archivan
+    result["skipped_bytes"] = sum(result[name].get("skipped_bytes", 0) for name in FLOWS)
+    result["duration_s"] = round(time.perf_counter() - start, 3)
+    result.update(startup)
 
     # Registrar en CloudWatch
     print("Orchestrator result:", json.dumps(result, ensure_ascii=False, indent=2))
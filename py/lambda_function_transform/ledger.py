@@ -0,0 +1,193 @@
+# ledger.py  (registro de idempotencia: una "reclamación" por objeto subido)
+#
+# Además del registro por (key, versión) lleva un registro por contenido: la huella
+# checksum + tamaño de cada archivo ya procesado, para no volver a parsear un libro o
+# export que el personal sube otra vez con el mismo contenido (con otro nombre o no).
+# El ETag no sirve: con SSE-KMS (todos los buckets) no es un MD5 del contenido.
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+LEDGER_BUCKET = "serverless-architecture-smes-analytics-bronze-zone"
+LEDGER_PREFIX = "_ledger/claims/"          # fuera de los prefijos de la regla EventBridge
+CLAIM_TTL_S   = int(os.environ.get("LEDGER_CLAIM_TTL_S", "900"))   # reclamación huérfana
+CONTENT_PREFIX = "_ledger/content/"
+CONTENT_DEDUP  = os.environ.get("CONTENT_DEDUP", "true").lower() in ("1", "true", "yes")
+LATEST         = "latest"   # flujos de instantánea: solo cuenta el último contenido procesado
+
+CLAIMED, DONE = "CLAIMED", "DONE"
+_CONFLICT = {"PreconditionFailed", "ConditionalRequestConflict", "412", "409"}
+
+
+def _ledger_key(key: str, version: str) -> str:
+    digest = hashlib.sha1(f"{key}\n{version}".encode("utf-8")).hexdigest()
+    return f"{LEDGER_PREFIX}{digest}.json"
+
+
+def _body(key: str, owner: str, status: str, **extra) -> bytes:
+    return json.dumps({
+        "key": key, "owner": owner, "status": status,
+        "at": datetime.now(timezone.utc).isoformat(), **extra,
+    }).encode("utf-8")
+
+
+def claim(s3, key: str, version: str, owner: str) -> bool:
+    """Reclama (key, version) con un PUT condicional; False si otra ejecución ya lo tiene.
+
+    `version` identifica la subida concreta (sequencer o ETag del evento). Una
+    reclamación CLAIMED más vieja que CLAIM_TTL_S se considera huérfana y se
+    toma con If-Match sobre su ETag.
+    """
+    lkey = _ledger_key(key, version)
+    try:
+        s3.put_object(Bucket=LEDGER_BUCKET, Key=lkey, Body=_body(key, owner, CLAIMED), IfNoneMatch="*")
+        return True
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") not in _CONFLICT:
+            raise
+
+    current = s3.get_object(Bucket=LEDGER_BUCKET, Key=lkey)
+    record = json.loads(current["Body"].read())
+    age = (datetime.now(timezone.utc) - datetime.fromisoformat(record["at"])).total_seconds()
+    if record.get("status") != CLAIMED or age < CLAIM_TTL_S:
+        return False
+    try:
+        s3.put_object(Bucket=LEDGER_BUCKET, Key=lkey, Body=_body(key, owner, CLAIMED), IfMatch=current["ETag"])
+        return True
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") in _CONFLICT:
+            return False
+        raise
+
+
+def complete(s3, key: str, version: str, owner: str, status: str) -> None:
+    """Marca la reclamación como terminada (se conserva como registro)."""
+    s3.put_object(Bucket=LEDGER_BUCKET, Key=_ledger_key(key, version),
+                  Body=_body(key, owner, DONE, result=status))
+
+
+def release(s3, key: str, version: str) -> None:
+    """Libera la reclamación tras un error para que un reintento pueda procesarla."""
+    s3.delete_object(Bucket=LEDGER_BUCKET, Key=_ledger_key(key, version))
+
+
+# ───────────────────── Registro por contenido ─────────────────────────────
+# Checksums de objeto completo que S3 guarda con cada subida, en orden de preferencia.
+# CRC64NVME es el que S3 agrega por defecto a toda subida nueva; los demás solo cuentan
+# si son FULL_OBJECT (un checksum COMPOSITE de multipart depende del tamaño de parte).
+CHECKSUMS = ("CRC64NVME", "SHA256", "CRC32C", "CRC32")
+
+
+def _checksum(head: dict) -> Optional[str]:
+    for algorithm in CHECKSUMS:
+        value = head.get(f"Checksum{algorithm}")
+        if value and (algorithm == "CRC64NVME" or head.get("ChecksumType", "FULL_OBJECT") == "FULL_OBJECT"):
+            return f"{algorithm.lower()}:{value}"
+    return None
+
+
+def fingerprint(obj: dict) -> Optional[str]:
+    """Huella del contenido: checksum de objeto completo + tamaño, o None sin checksum.
+
+    Un objeto sin checksum (subido antes de que S3 los agregara por defecto, o copiado
+    sin él) no se puede comparar: siempre se procesa y no se anota en el registro.
+    Dos algoritmos distintos para el mismo contenido no coinciden (nunca un falso positivo).
+    """
+    checksum = obj.get("Checksum")
+    if not checksum:
+        return None
+    return hashlib.sha256(f"{checksum}\n{obj['Size']}".encode("utf-8")).hexdigest()[:40]
+
+
+def describe(s3, bucket: str, key: str) -> Optional[dict]:
+    """{"Key", "ETag", "Size", "Checksum"} o None si el objeto no existe.
+
+    "Checksum" ("<algoritmo>:<valor>") viene de HEAD con ChecksumMode=ENABLED; None si el
+    objeto no tiene un checksum de objeto completo.
+    """
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key, ChecksumMode="ENABLED")
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") in {"404", "NoSuchKey", "NotFound"}:
+            return None
+        raise
+    return {"Key": key, "ETag": head["ETag"], "Size": head["ContentLength"], "Checksum": _checksum(head)}
+
+
+
+def _content_key(flow: str, name: str) -> str:
+    return f"{CONTENT_PREFIX}{flow}/{name}.json"
+
+
+def _get(s3, lkey: str) -> Optional[dict]:
+    try:
+        return json.loads(s3.get_object(Bucket=LEDGER_BUCKET, Key=lkey)["Body"].read())
+    except s3.exceptions.NoSuchKey:
+        return None
+
+
+def split_new(s3, flow: str, objects: List[dict], snapshot: bool = False) -> Tuple[List[dict], List[dict]]:
+    """(objetos nuevos, duplicados) según el registro de contenido de `flow`.
+
+    Con `snapshot` (la salida reemplaza a la anterior) solo se omite el contenido
+    idéntico al último procesado: volver a una versión anterior sí se reprocesa.
+    Cada duplicado lleva "SameAs" con la key del archivo original. Los objetos deben
+    venir de describe(); los que no tienen checksum siempre son nuevos.
+    """
+    if not CONTENT_DEDUP:
+        return list(objects), []
+    latest = _get(s3, _content_key(flow, LATEST)) if snapshot else None
+    fresh, dups, batch = [], [], {}
+    for obj in objects:
+        fp = fingerprint(obj)
+        if fp is None:
+            fresh.append(obj)
+            continue
+        if fp in batch:
+            dups.append({**obj, "SameAs": batch[fp]})
+            continue
+        record = (latest if latest and latest["fingerprint"] == fp else None) if snapshot \
+            else _get(s3, _content_key(flow, fp))
+        if record is not None:
+            dups.append({**obj, "SameAs": record["key"]})
+            continue
+        batch[fp] = obj["Key"]
+        fresh.append(obj)
+    return fresh, dups
+
+
+def remember(s3, flow: str, objects: List[dict], output: str, snapshot: bool = False) -> None:
+    """Anota el contenido de `objects` como procesado (tras escribir `output`)."""
+    if not CONTENT_DEDUP:
+        return
+    for obj in objects:
+        fp = fingerprint(obj)
+        if fp is None:
+            continue
+        body = json.dumps({
+            "key": obj["Key"], "fingerprint": fp, "size": obj["Size"], "output": output,
+            "at": datetime.now(timezone.utc).isoformat(),
+        }).encode("utf-8")
+        if snapshot:
+            s3.put_object(Bucket=LEDGER_BUCKET, Key=_content_key(flow, LATEST), Body=body)
+            continue
+        try:   # el primer registro de un contenido se conserva
+            s3.put_object(Bucket=LEDGER_BUCKET, Key=_content_key(flow, fp), Body=body, IfNoneMatch="*")
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") not in _CONFLICT:
+                raise
+
+
+def skipped(dups: List[dict]) -> dict:
+    """Resumen de los duplicados para la respuesta del flujo."""
+    return {
+        "skipped": len(dups),
+        "skipped_bytes": sum(d["Size"] for d in dups),
+        "duplicates": [{"key": d["Key"], "same_as": d["SameAs"]} for d in dups],
+    }
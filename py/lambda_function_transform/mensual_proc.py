@@ -1,11 +1,27 @@
 # mensual_proc.py
 from __future__ import annotations
-import io, unicodedata, re
+import io, os, time, unicodedata, re
+import multiprocessing
+import multiprocessing.util
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from typing import List
 
-import boto3
 import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+import catalog
+import cleaning
+import ledger
+import metrics
+import naming
+import parquet_writer
+import runtime
+import s3_move
 
 # ─────────── Constantes S3 y zona horaria ────────────────────────────────
 BUCKET        = "serverless-architecture-smes-analytics-bronze-zone"
@@ -13,8 +29,11 @@ RAW_XLSX_KEY  = "bronze1/mensual_proc/mensual_procedimientos.xlsx"
 PROC_XLSX_KEY = "bronze2/mensual_proc/mensual_procedimientos.xlsx"
 
 CO_TZ         = timezone(timedelta(hours=-5))  # Colombia (UTC-5)
-timestamp      = datetime.now(CO_TZ).strftime("%d%m%Y%H%M")
-GOLD_CSV_KEY  = f"gold1/mensual_proc/consolidado_procedimientos_{timestamp}.csv"
+GOLD_BUCKET   = "serverless-architecture-smes-analytics-gold-zone"
+GOLD_PARQUET_PREFIX = "gold1/parquet/consolidado_procedimientos/"
+GOLD_CSV_PREFIX     = "gold1/mensual_proc/"
+GOLD_BASENAME       = "consolidado_procedimientos_{ts}_{batch}"   # ts ddmmaaaaHHMM (Bogotá) + hash de la entrada
+GOLD_TABLE          = "consolidado_procedimientos"   # tabla del Data Catalog
 
 
 # ─────────── Utilidades ──────────────────────────────────────────────────
@@ -40,46 +59,197 @@ TARGET_COLS = [
 
 NORM_COLS  = [_noacc(c) for c in TARGET_COLS]       # nombres normalizados
 EQUIP_COLS = [c for c in NORM_COLS if "equipo" in c]  # columnas de equipo
+# Tipos de la salida Parquet (el resto de columnas queda como texto)
+PARQUET_SCHEMA = {"fecha": "date", "numero de eventos": "float", "efectos adversos": "float"}
 MONTH_RE   = re.compile(
     r"^(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s+2024$",
     re.I,
 )
+CUTOFF_RE  = re.compile("numero total de eventos", re.I)   # fila de totales: ahí termina la pestaña
+
+# ─────────── Lectura en streaming de las pestañas ─────────────────────────
+# Cada pestaña mensual se lee en modo read-only (sin DOM completo) y se deja
+# de leer en la fila de totales. Pestañas en paralelo: pool de hilos ("thread"),
+# de procesos ("process", spawn) o en serie ("serial").
+MENSUAL_MAX_WORKERS = int(os.environ.get("MENSUAL_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+MENSUAL_PARSE_POOL  = os.environ.get("MENSUAL_PARSE_POOL", "thread")
+
+
+
+def _cell(cell):
+    """Valor como lo entrega pandas.read_excel: vacío → "", enteros sin ".0", error → NaN."""
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return float("nan")
+    if cell.data_type == TYPE_NUMERIC:
+        as_int = int(cell.value)
+        return as_int if as_int == cell.value else float(cell.value)
+    return cell.value
+
+
+def _open(raw: bytes):
+    return load_workbook(io.BytesIO(raw), read_only=True, data_only=True)
+
+
+def _read_sheet(wb, sheet: str) -> pd.DataFrame:
+    """Una pestaña como texto (igual que wb.parse(dtype=str)) hasta la fila de totales."""
+    ws = wb[sheet]
+    ws.reset_dimensions()
+    data, last = [], -1
+    for n, row in enumerate(ws.iter_rows()):
+        values = [_cell(c) for c in row]
+        if n > 0 and values and isinstance(values[0], str) and CUTOFF_RE.search(values[0]):
+            last = n - 1   # las filas vacías antes de los totales se conservan
+            break
+        while values and values[-1] == "":
+            values.pop()
+        if values:
+            last = n
+        data.append(values)
+
+    data = data[: last + 1]
+    if data:
+        width = max(map(len, data))
+        data = [row + [""] * (width - len(row)) for row in data]
+    try:
+        return TextParser(data, header=0, dtype=str, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+class _Workbooks:
+    """Libros read-only de una llamada: uno por hilo que lee, cerrados con close()."""
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened: list = []
+
+    def read(self, sheet: str) -> pd.DataFrame:
+        wb = getattr(self._local, "wb", None)
+        if wb is None:
+            wb = self._local.wb = _open(self.raw)
+            with self._lock:
+                self._opened.append(wb)
+        return _read_sheet(wb, sheet)
+
+    def close(self) -> None:
+        with self._lock:
+            opened, self._opened = self._opened, []
+        for wb in opened:
+            wb.close()
+
+
+# Solo en los hijos del pool de procesos: cada pool es de una llamada, así que el
+# proceso no comparte su libro con otra; se cierra al apagarse el pool.
+_child_books = None
+
+
+def _init_child(raw: bytes) -> None:
+    global _child_books
+    _child_books = _Workbooks(raw)
+    multiprocessing.util.Finalize(_child_books, _child_books.close, exitpriority=10)
+
+
+def _read_sheet_child(sheet: str) -> pd.DataFrame:
+    return _child_books.read(sheet)
+
+
+def _process_pool(raw: bytes, workers: int):
+    """Pool de procesos para las pestañas o None si no se puede (Lambda no tiene /dev/shm)."""
+    try:
+        # spawn, no fork: el pool se crea desde hilos del orquestador y un fork
+        # heredaría locks tomados por otros hilos. El libro viaja una vez por hijo.
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_child, initargs=(raw,),
+                                   mp_context=multiprocessing.get_context("spawn"))
+    except OSError:
+        return None
+
+
+def _read_month_sheets(raw: bytes) -> List[tuple]:
+    """[(pestaña, DataFrame)] de las pestañas “MES 2024”, en el orden del libro."""
+    wb = _open(raw)   # las pestañas se leen a demanda: las ajenas nunca se tocan
+    try:
+        sheets = [name for name in wb.sheetnames if MONTH_RE.match(name)]
+        workers = max(1, min(MENSUAL_MAX_WORKERS, len(sheets)))
+        if MENSUAL_PARSE_POOL == "serial" or workers == 1:
+            return [(name, _read_sheet(wb, name)) for name in sheets]
+    finally:
+        wb.close()
+    pool = _process_pool(raw, workers) if MENSUAL_PARSE_POOL == "process" else None
+    if pool is not None:
+        with pool:
+            return list(zip(sheets, pool.map(_read_sheet_child, sheets)))
+    books = _Workbooks(raw)   # por llamada: dos flujos concurrentes no comparten bytes ni libros
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(zip(sheets, pool.map(books.read, sheets)))
+    finally:
+        books.close()   # después del shutdown: ningún hilo sigue leyendo
 
 # ─────────── Proceso principal reutilizable ──────────────────────────────
-def process_mensual_proc(event=None, context=None) -> dict:
+def _archive_duplicate(s3, raw_key: str, proc_key: str, dups: List[dict],
+                       timer: metrics.StageTimer) -> dict:
+    """Libro idéntico a uno ya consolidado: se archiva sin volver a emitir gold."""
+    with timer.stage("archive") as m:
+        archive = s3_move.move_objects(s3, BUCKET, [(raw_key, proc_key)])
+        m["rows"] = archive["moved"]
+    return timer.finish({
+        "status": "DUPLICATE" if not archive["failed"] else "PARTIAL",
+        "message": f"{raw_key} es idéntico a {dups[0]['SameAs']}",
+        "moved_from": raw_key,
+        "moved_to": proc_key,
+        "archive_errors": s3_move.failures(archive),
+        **ledger.skipped(dups),
+        "timestamp": datetime.now(CO_TZ).isoformat(),
+    })
+
+def process_mensual_proc(event=None, context=None, s3=None, key: str | None = None) -> dict:
     """
     Consolida las 12 pestañas mensuales del archivo Excel en un único CSV,
     limpia tildes, normaliza encabezados y agrega la columna 'fecha'.
     """
-    s3 = boto3.client("s3")
+    s3 = s3 or runtime.client("s3")
+    raw_key  = key or RAW_XLSX_KEY                          # modo por evento: objeto del evento
+    proc_key = raw_key.replace("bronze1/", "bronze2/", 1)
+
+    timer = metrics.StageTimer("mensual_proc")
+
+    # 0. Contenido ya consolidado (ledger por ETag + tamaño): solo archivar
+    with timer.stage("list"):
+        source = ledger.describe(s3, BUCKET, raw_key)
+        fresh, dups = ledger.split_new(s3, "mensual_proc", [source] if source else [])
+    if source is None:
+        return timer.finish({"status": "NO_DATA", "message": f"{raw_key} no existe"})
+    if dups:
+        return _archive_duplicate(s3, raw_key, proc_key, dups, timer)
 
     # 1. Descargar el Excel de origen
-    try:
-        raw = s3.get_object(Bucket=BUCKET, Key=RAW_XLSX_KEY)["Body"].read()
-    except s3.exceptions.NoSuchKey:
-        return {"status": "NO_DATA", "message": f"{RAW_XLSX_KEY} no existe"}
+    with timer.stage("download") as m:
+        try:
+            raw = s3.get_object(Bucket=BUCKET, Key=raw_key, IfMatch=source["ETag"])["Body"].read()
+        except s3.exceptions.NoSuchKey:
+            raw = None
+        m["bytes"] = len(raw or b"")
+    if raw is None:
+        return timer.finish({"status": "NO_DATA", "message": f"{raw_key} no existe"})
 
-    wb = pd.ExcelFile(io.BytesIO(raw))
+    # 2. Leer solo las pestañas “MES 2024”, cada una hasta “numero total de eventos”
+    with timer.stage("parse") as m:
+        sheets = _read_month_sheets(raw)
+        m["rows"] = sum(len(df) for _, df in sheets)
     frames: List[pd.DataFrame] = []
 
-    # 2. Procesar cada pestaña “MES 2024”
-    for sheet in wb.sheet_names:
-        m = MONTH_RE.match(sheet)
-        if not m:
-            continue
-
-        month_name = m.group(1).lower()
+    for sheet, df in sheets:
+        month_name = MONTH_RE.match(sheet).group(1).lower()
         month_num  = SPANISH_MONTHS[month_name]
-        fecha_const = f"01/{month_num:02d}/2024"   # dd/mm/aaaa
+        fecha_const = datetime(2024, month_num, 1).strftime(cleaning.DATE_FMT)   # mismo formato que cups/pacientes
 
-        df = wb.parse(sheet_name=sheet, dtype=str)
+        start = time.perf_counter()
         df.columns = [_noacc(c) for c in df.columns]
 
-        # Cortar desde “numero total de eventos” hacia abajo
-        cutoff = df[df.iloc[:, 0].str.contains("numero total de eventos", case=False, na=False)].index
-        if not cutoff.empty:
-            df = df.loc[: cutoff[0] - 1]
-
         # Quedarnos con las columnas objetivo y crear faltantes
         df = df[[c for c in df.columns if c in NORM_COLS]]
         for col in NORM_COLS:
@@ -96,29 +266,61 @@ def process_mensual_proc(event=None, context=None) -> dict:
 
         df["fecha"] = fecha_const
         frames.append(df[NORM_COLS + ["fecha"]])
+        timer.add("transform", time.perf_counter() - start, rows=len(frames[-1]))
 
     if not frames:
-        return {"status": "NO_DATA", "message": "No se encontraron pestañas válidas"}
+        return timer.finish({"status": "NO_DATA", "message": "No se encontraron pestañas válidas"})
+
+    # 3. Unir y escribir resultado a Gold (CSV o Parquet particionado por mes)
+    with timer.stage("transform"):
+        final = pd.concat(frames, ignore_index=True)
+    # El nombre se calcula aquí: un contenedor en caliente no reutiliza el de su init
+    basename = GOLD_BASENAME.format(ts=datetime.now(CO_TZ).strftime("%d%m%Y%H%M"),
+                                    batch=naming.batch_suffix([source]))
+    gold_csv_key = f"{GOLD_CSV_PREFIX}{basename}.csv"
+    fmt = parquet_writer.output_format("consolidado_procedimientos")
+    if fmt == "parquet":
+        with timer.stage("upload"):   # incluye la serialización Parquet
+            written = parquet_writer.write_parquet(
+                s3, final, GOLD_BUCKET, GOLD_PARQUET_PREFIX,
+                basename,
+                schema=PARQUET_SCHEMA, partition_col="fecha",
+            )
+    else:
+        with timer.stage("serialize"):
+            buf = io.BytesIO()
+            final.to_csv(buf, index=False, sep=";", encoding="utf-8-sig", lineterminator="\n")
+            buf.seek(0)
+        with timer.stage("upload", nbytes=buf.getbuffer().nbytes):
+            s3.put_object(Bucket=GOLD_BUCKET, Key=gold_csv_key, Body=buf.getvalue())
+        written = [gold_csv_key]
 
-    # 3. Unir y escribir resultado a Gold
-    final = pd.concat(frames, ignore_index=True)
-    buf = io.BytesIO()
-    final.to_csv(buf, index=False, sep=";", encoding="utf-8-sig", lineterminator="\n")
-    buf.seek(0)
+    # Declarar tabla y particiones nuevas en el catálogo
+    with timer.stage("catalog"):
+        synced = catalog.register(
+            GOLD_TABLE, GOLD_BUCKET, GOLD_PARQUET_PREFIX if fmt == "parquet" else GOLD_CSV_PREFIX,
+            catalog.columns(final.columns, PARQUET_SCHEMA, fmt), fmt,
+            keys=written, sep=";", partitioned=fmt == "parquet",
+        )
 
-    s3.put_object(Bucket="serverless-architecture-smes-analytics-gold-zone", Key=GOLD_CSV_KEY, Body=buf.getvalue())
-    # Mover el archivo original a bronze2
-    s3.copy_object(Bucket=BUCKET, CopySource={"Bucket": BUCKET, "Key": RAW_XLSX_KEY}, Key=PROC_XLSX_KEY)
-    s3.delete_object(Bucket=BUCKET, Key=RAW_XLSX_KEY)
+    # Registrar el contenido y mover el archivo original a bronze2
+    ledger.remember(s3, "mensual_proc", fresh, f"s3://{GOLD_BUCKET}/{written[0]}")
+    with timer.stage("archive") as m:
+        archive = s3_move.move_objects(s3, BUCKET, [(raw_key, proc_key)])
+        m["rows"] = archive["moved"]
 
-    return {
-        "status": "SUCCESS",
+    return timer.finish({
+        "status": "SUCCESS" if not archive["failed"] else "PARTIAL",
         "rows": len(final),
-        "output": f"s3://serverless-architecture-smes-analytics-gold-zone/{GOLD_CSV_KEY}",
-        "moved_from": RAW_XLSX_KEY,
-        "moved_to": PROC_XLSX_KEY,
+        "output": f"s3://{GOLD_BUCKET}/{written[0]}",
+        "files": len(written),
+        "moved_from": raw_key,
+        "moved_to": proc_key,
+        "archive_errors": s3_move.failures(archive),
+        "catalog": synced,
+        **ledger.skipped(dups),
         "timestamp": datetime.now(CO_TZ).isoformat(),
-    }
+    })
 
 # ─────────── Wrapper — permite usar esta Lambda de forma independiente ───
 def lambda_handler(event, context):  # pragma: no cover
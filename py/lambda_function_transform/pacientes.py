@@ -1,48 +1,135 @@
 # pacientes.py
 from __future__ import annotations
 
-import io, unicodedata, csv
+import io, os, re, sys, unicodedata, csv, codecs
 from datetime import datetime, timezone, timedelta
+from typing import Iterator, List, Optional, Tuple
 
-import boto3
-import pandas as pd
+import catalog
+import cleaning
+import ledger
+import metrics
+import parquet_writer
+import runtime
+import s3_move
+
+pd = runtime.lazy("pandas")   # la ruta rápida (archivos pequeños en CSV) no lo importa
 
 # ------------------  Constantes S3 y zona horaria -------------------------
 BUCKET                 = "serverless-architecture-smes-analytics-bronze-zone"
 PATIENTS_RAW_KEY       = "bronze1/pacientes/pacientes.csv"
 PATIENTS_PROCESSED_KEY = "bronze2/pacientes/pacientes.csv"
 PATIENTS_OUTPUT_KEY    = "gold1/pacientes/pacientes.csv"
+GOLD_BUCKET            = "serverless-architecture-smes-analytics-gold-zone"
+PATIENTS_PARQUET_PREFIX = "gold1/parquet/pacientes/"
+PATIENTS_SCHEMA        = {"Fecha Ingreso": "date"}   # tipos para la salida Parquet
+PATIENTS_TABLE         = "pacientes"                  # tabla del Data Catalog
 CO_TZ = timezone(timedelta(hours=-5))   # Colombia
 
+# ------------------  Lectura del CSV -------------------------------------
+SAMPLE_BYTES = 64 * 1024                                          # muestra para detectar encoding
+CSV_ENGINE   = os.environ.get("PACIENTES_CSV_ENGINE", "c")        # "c" | "pyarrow"
+CHUNK_BYTES  = int(os.environ.get("PACIENTES_CHUNK_BYTES", "0"))  # 0 = archivo completo
+FAST_BYTES   = int(os.environ.get("PACIENTES_FAST_BYTES", str(2 * 1024 * 1024)))  # 0 = siempre pandas
+
 # -------------------- Helpers --------------------------------------------
 def _normalize(text: str) -> str:
     return "".join(c for c in unicodedata.normalize("NFKD", text)
                    if not unicodedata.combining(c)).lower().strip()
 
-def _read_patients_csv(raw: bytes) -> pd.DataFrame:
-    for enc in ("utf-8-sig", "latin-1", "cp1252"):
-        try:
-            return pd.read_csv(
-                io.BytesIO(raw), dtype=str, encoding=enc,
-                sep=";", engine="python", on_bad_lines="skip"
-            )
-        except (UnicodeDecodeError, pd.errors.ParserError):
-            continue
-    return pd.read_csv(
-        io.BytesIO(raw), dtype=str, encoding="utf-8",
-        sep=";", engine="python", on_bad_lines="skip", encoding_errors="replace"
-    )
+def _detect_encoding(raw: bytes) -> str:
+    """utf-8-sig si la muestra es UTF-8 válido; si no latin-1 (igual que el fallback original)."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        decoder.decode(raw[:SAMPLE_BYTES], final=len(raw) <= SAMPLE_BYTES)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "latin-1"
 
-# ------------------ API reutilizable -------------------------------------
-def process_pacientes(event=None, context=None) -> dict:
-    s3 = boto3.client("s3")
+def _is_utf8(raw: bytes, step: int = 1 << 20) -> bool:
+    """Valida UTF-8 por tramos, sin materializar el texto completo."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for i in range(0, len(raw), step):
+            decoder.decode(raw[i:i + step], final=i + step >= len(raw))
+    except UnicodeDecodeError:
+        return False
+    return True
+
+_BLANK_LINE = re.compile(rb"\n[ \t\r]*(?=\n)")   # línea vacía o solo espacios: el motor C la salta
 
+def _count_records(data: bytes, encoding: str, header: bool) -> int:
+    """Registros no vacíos de `data`, sin el encabezado: lo que el motor C intenta leer."""
+    if b'"' in data:   # puede haber saltos de línea entre comillas
+        text = io.TextIOWrapper(io.BytesIO(data), encoding=encoding, newline="")
+        n = sum(1 for row in csv.reader(text, delimiter=";") if len(row) > 1 or (row and row[0].strip()))
+    else:
+        n = data.count(b"\n") + 1 - len(_BLANK_LINE.findall(b"\n" + data + b"\n"))
+    return max(n - header, 0)
+
+def _parse_csv(data: bytes, encoding: str, engine: str = CSV_ENGINE, **kwargs) -> Tuple[pd.DataFrame, int]:
+    """Parsea con el motor C/pyarrow y devuelve (df, líneas descartadas).
+
+    Sin warnings.catch_warnings (estado global, no apto para hilos): pyarrow cuenta las
+    filas inválidas en su manejador; con el motor C se comparan registros y filas leídas.
+    """
+    if engine == "pyarrow":
+        bad: List[object] = []
+        df = pd.read_csv(
+            io.BytesIO(data), dtype=str, encoding=encoding, sep=";", engine=engine,
+            on_bad_lines=lambda row: bad.append(row) or "skip", **kwargs
+        )
+        return df, len(bad)
+    df = pd.read_csv(
+        io.BytesIO(data), dtype=str, encoding=encoding,
+        sep=";", engine=engine, on_bad_lines="skip", **kwargs
+    )
+    return df, _count_records(data, encoding, kwargs.get("header", 0) is not None) - len(df)
+
+def _read_patients_csv(raw: bytes) -> Tuple[pd.DataFrame, int, str]:
+    """Decodifica y parsea una sola vez; (df, líneas descartadas, encoding)."""
+    enc = _detect_encoding(raw)
     try:
-        obj = s3.get_object(Bucket=BUCKET, Key=PATIENTS_RAW_KEY)
-    except s3.exceptions.NoSuchKey:
-        return {"status": "NO_DATA", "message": f"{PATIENTS_RAW_KEY} no existe"}
+        df, skipped = _parse_csv(raw, enc)
+    except UnicodeDecodeError:        # bytes no UTF-8 después de la muestra
+        enc = "latin-1"
+        df, skipped = _parse_csv(raw, enc)
+    return df, skipped, enc
+
+def _split_blocks(raw: bytes, block_bytes: int) -> Iterator[bytes]:
+    """Corta `raw` en bloques de ~block_bytes que terminan en un salto de línea fuera de comillas."""
+    start, n = 0, len(raw)
+    while start < n:
+        end = min(start + block_bytes, n)
+        while end < n:
+            nl = raw.find(b"\n", end)
+            end = n if nl == -1 else nl + 1
+            if raw.count(b'"', start, end) % 2 == 0:
+                break
+        yield raw[start:end]
+        start = end
+
+def _iter_patients_csv(raw: bytes, block_bytes: int, stats: dict) -> Iterator[pd.DataFrame]:
+    """Versión por bloques de _read_patients_csv: memoria acotada por bloque."""
+    enc = _detect_encoding(raw)
+    if enc == "utf-8-sig" and not _is_utf8(raw):   # se valida antes de emitir bloques
+        enc = "latin-1"
+    stats.update(encoding=enc, skipped_lines=0, chunks=0)
 
-    df = _read_patients_csv(obj["Body"].read())
+    columns: Optional[List[str]] = None
+    for block in _split_blocks(raw, block_bytes):
+        if columns is None:
+            df, skipped = _parse_csv(block, enc)
+            columns = list(df.columns)
+        else:   # sin BOM ni encabezado en los bloques siguientes
+            df, skipped = _parse_csv(block, "utf-8" if enc == "utf-8-sig" else enc,
+                                     header=None, names=columns)
+        stats["skipped_lines"] += skipped
+        stats["chunks"] += 1
+        yield df
+
+def _transform_patients(df: pd.DataFrame, dates: Optional[cleaning.DateParser] = None) -> pd.DataFrame:
+    """Normaliza nombre, sexo/género y fecha de ingreso (operaciones fila a fila)."""
     df.columns = df.columns.str.strip()
 
     # ---- nombre_completo -------------------------------------------------
@@ -79,28 +166,248 @@ def process_pacientes(event=None, context=None) -> dict:
 
     # ---- Fecha ingreso ----------------------------------------------------
     if "Fecha Ingreso" in df.columns:
-        df["Fecha Ingreso"] = pd.to_datetime(df["Fecha Ingreso"], errors="coerce").dt.strftime("%d/%m/%Y")
+        dates = dates or cleaning.DateParser()   # sin parser compartido: uno solo para este bloque
+        df["Fecha Ingreso"] = cleaning.format_dates(dates(df["Fecha Ingreso"]))
+
+    return df
+
+# ------------------ Ruta rápida sin pandas -------------------------------
+# Mismo resultado que _read_patients_csv + _transform_patients + to_csv, con el
+# módulo csv. Ante cualquier caso que no reproduce exactamente (encabezados
+# vacíos o repetidos, fechas fuera del rango de Timestamp, ...) se cae a la ruta
+# pandas. Las fechas usan las mismas reglas que cleaning.DateParser.
+_NA_VALUES = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})   # na_values por defecto de read_csv
+_WS = re.compile(r"\s+")
+
+
+class _Fallback(Exception):
+    """La ruta rápida no puede garantizar el mismo resultado que pandas."""
+
+
+def _fast_fecha(value: str, fmt: Optional[str]) -> str:
+    parsed = cleaning.parse_text(value, fmt)
+    if parsed is None:
+        return ""                       # vacío o ilegible (NaT en la ruta pandas)
+    if not 1678 <= parsed.year <= 2261:
+        raise _Fallback("fecha fuera del rango de Timestamp")
+    return parsed.strftime(cleaning.DATE_FMT)
+
+
+def _fast_patients(raw: bytes, timer: metrics.StageTimer) -> Tuple[bytes, List[str], int, int, str, dict]:
+    """(CSV gold, columnas, filas, líneas descartadas, encoding, contadores de fechas) sin pandas."""
+    with timer.stage("parse") as m:
+        enc = _detect_encoding(raw)
+        try:
+            text = raw.decode(enc)
+        except UnicodeDecodeError:
+            enc, text = "latin-1", raw.decode("latin-1")
+        lines = (r for r in csv.reader(io.StringIO(text, newline=""), delimiter=";")
+                 if r and not (len(r) == 1 and r[0].strip() == ""))   # skip_blank_lines
+        header = next(lines, None)
+        if not header or any(h == "" for h in header):
+            raise _Fallback("encabezado vacío")
+        names = [h.strip() for h in header]
+        if len(set(header)) < len(header) or len(set(names)) < len(names):
+            raise _Fallback("encabezados repetidos")
+        width, skipped, rows = len(names), 0, []
+        for r in lines:
+            if len(r) > width:
+                skipped += 1            # on_bad_lines="warn"
+                continue
+            r += [""] * (width - len(r))
+            rows.append(["" if v in _NA_VALUES else v for v in r])
+        m["rows"] = len(rows)
+
+    with timer.stage("transform") as m:
+        if "Sexo" not in names or "nombre_completo" in names:
+            raise _Fallback("columnas")
+        col_map = {_normalize(c): i for i, c in enumerate(names)}
+        parts = [col_map.get(k) for k in ("primer nombre", "segundo nombre", "primer apellido", "segundo apellido")]
+        drop = {i for i in parts if i is not None}
+        genero = next((i for i, c in enumerate(names) if _normalize(c) == "identidad de genero"), None)
+        if genero is not None and "genero" in names:
+            raise _Fallback("columnas")
+        if genero is None and "genero" in names:
+            genero = names.index("genero")
+        out_names = ["genero" if i == genero else c for i, c in enumerate(names) if i not in drop]
+        keep = [i for i in range(width) if i not in drop]
+        out_names.append("nombre_completo")
+        if genero is None:
+            out_names.append("genero")
+        sexo = names.index("Sexo")
+        fecha = names.index("Fecha Ingreso") if "Fecha Ingreso" in names else None
+        # Mismo formato que detectaría DateParser: muestra de valores distintos en orden
+        fmt = cleaning.detect_format(r[fecha] for r in rows) if fecha is not None else None
+        dates = {"format": fmt, "values": 0, "unparseable": 0, "samples": []}
+
+        body, fechas = [], {}   # fechas: memo por valor (se repiten mucho)
+        for r in rows:
+            nombre = _WS.sub(" ", " ".join("" if i is None else r[i] for i in parts)).strip()
+            g = r[genero].title().strip() if genero is not None else ""
+            sx = r[sexo].upper().strip()
+            if g == "" and sx in ("F", "M"):
+                g = "Femenino" if sx == "F" else "Masculino"
+            if sx in ("", "0") and g in ("Femenino", "Masculino"):
+                sx = "F" if g == "Femenino" else "M"
+            r[sexo] = sx
+            if genero is not None:
+                r[genero] = g
+            if fecha is not None:
+                v = r[fecha]
+                if v not in fechas:
+                    fechas[v] = _fast_fecha(v, fmt)
+                    if fechas[v] == "" and v.strip() and len(dates["samples"]) < 5:
+                        dates["samples"].append(v.strip())
+                if v.strip():
+                    dates["values"] += 1
+                    dates["unparseable"] += fechas[v] == ""
+                r[fecha] = fechas[v]
+            row = [r[i] for i in keep] + [nombre]
+            if genero is None:
+                row.append(g)
+            body.append(row)
+        m["rows"] = len(body)
+
+    with timer.stage("serialize"):
+        out = io.StringIO()
+        writer = csv.writer(out, delimiter=";", lineterminator="\n")
+        writer.writerow(out_names)
+        writer.writerows(body)
+        data = out.getvalue().encode("utf-8-sig")
+    return data, out_names, len(body), skipped, enc, dates
+
+# ------------------ API reutilizable -------------------------------------
+def _archive_duplicate(s3, raw_key: str, processed_key: str, dups: List[dict],
+                       timer: metrics.StageTimer) -> dict:
+    with timer.stage("archive") as m:
+        archive = s3_move.move_objects(s3, BUCKET, [(raw_key, processed_key)])
+        m["rows"] = archive["moved"]
+    return timer.finish({
+        "status": "DUPLICATE" if not archive["failed"] else "PARTIAL",
+        "message": f"{raw_key} es idéntico a la última instantánea procesada",
+        "moved_from": raw_key,
+        "moved_to": processed_key,
+        "archive_errors": s3_move.failures(archive),
+        **ledger.skipped(dups),
+        "timestamp": datetime.now(CO_TZ).isoformat(),
+    })
+
+def process_pacientes(event=None, context=None, s3=None, key: str | None = None) -> dict:
+    s3 = s3 or runtime.client("s3")
+    raw_key = key or PATIENTS_RAW_KEY                       # modo por evento: objeto del evento
+    processed_key = raw_key.replace("bronze1/", "bronze2/", 1)
+
+    timer = metrics.StageTimer("pacientes")
+
+    # Mismo contenido que la última instantánea procesada: solo archivar
+    with timer.stage("list"):
+        source = ledger.describe(s3, BUCKET, raw_key)
+        fresh, dups = ledger.split_new(s3, "pacientes", [source] if source else [], snapshot=True)
+    if source is None:
+        return timer.finish({"status": "NO_DATA", "message": f"{raw_key} no existe"})
+    if dups:
+        return _archive_duplicate(s3, raw_key, processed_key, dups, timer)
+
+    with timer.stage("download") as m:
+        try:
+            obj = s3.get_object(Bucket=BUCKET, Key=raw_key, IfMatch=source["ETag"])
+            raw = obj["Body"].read()
+        except s3.exceptions.NoSuchKey:
+            raw = None
+        m["bytes"] = len(raw or b"")
+    if raw is None:
+        return timer.finish({"status": "NO_DATA", "message": f"{raw_key} no existe"})
+
+    to_parquet = parquet_writer.output_format("pacientes") == "parquet"
+    out, parts, rows, names = io.BytesIO(), [], 0, []
+    dates = cleaning.DateParser()   # 'Fecha Ingreso': formato y memo compartidos por los bloques
+    stats: dict = {"path": "pandas"}
+
+    fast = None
+    # Solo compensa si pandas aún no está cargado en este contenedor
+    if not to_parquet and len(raw) <= FAST_BYTES and "pandas" not in sys.modules:
+        try:
+            fast = _fast_patients(raw, timer)
+        except _Fallback:
+            pass
+    if fast is not None:
+        data, names, rows, skipped, enc, counters = fast
+        out.write(data)
+        stats.update(encoding=enc, skipped_lines=skipped, chunks=1, path="csv", dates=counters)
+        chunks = iter(())
+    elif CHUNK_BYTES and len(raw) > CHUNK_BYTES:
+        chunks = timer.iterate("parse", _iter_patients_csv(raw, CHUNK_BYTES, stats))
+    else:
+        with timer.stage("parse") as m:
+            df, skipped, enc = _read_patients_csv(raw)
+            m["rows"] = len(df)
+        stats.update(encoding=enc, skipped_lines=skipped, chunks=1)
+        chunks = iter([df])
+
+    # ---- Transformar (por bloque) y serializar ---------------------------
+    for i, df in enumerate(chunks):
+        with timer.stage("transform") as m:
+            df = _transform_patients(df, dates)
+            m["rows"] = len(df)
+        if i == 0:
+            names = list(df.columns)
+        rows += len(df)
+        if to_parquet:
+            parts.append(df)
+        else:   # encabezado y BOM solo en el primer bloque
+            with timer.stage("serialize"):
+                df.to_csv(out, index=False, header=i == 0, encoding="utf-8-sig" if i == 0 else "utf-8",
+                          sep=";", lineterminator="\n")
+        del df
 
     # ---- Guardar en gold --------------------------------------------------
-    out = io.BytesIO()
-    df.to_csv(out, index=False, encoding="utf-8-sig", sep=";", lineterminator="\n")
-    out.seek(0)
-    s3.put_object(Bucket="serverless-architecture-smes-analytics-gold-zone", Key=PATIENTS_OUTPUT_KEY, Body=out.getvalue())
-
-    s3.copy_object(
-        Bucket=BUCKET, CopySource={"Bucket": BUCKET, "Key": PATIENTS_RAW_KEY},
-        Key=PATIENTS_PROCESSED_KEY
-    )
-    s3.delete_object(Bucket=BUCKET, Key=PATIENTS_RAW_KEY)
-
-    return {
-        "status": "SUCCESS",
-        "rows": len(df),
-        "output": f"s3://serverless-architecture-smes-analytics-gold-zone/{PATIENTS_OUTPUT_KEY}",
-        "moved_from": PATIENTS_RAW_KEY,
-        "moved_to": PATIENTS_PROCESSED_KEY,
+    if to_parquet:
+        # Instantánea completa de pacientes: un único archivo sin particiones
+        # ("upload" incluye la serialización Parquet)
+        with timer.stage("upload"):
+            written = parquet_writer.write_parquet(
+                s3, pd.concat(parts, ignore_index=True), GOLD_BUCKET, PATIENTS_PARQUET_PREFIX,
+                "pacientes", schema=PATIENTS_SCHEMA,
+            )
+    else:
+        with timer.stage("upload", nbytes=out.getbuffer().nbytes):
+            out.seek(0)
+            s3.put_object(Bucket=GOLD_BUCKET, Key=PATIENTS_OUTPUT_KEY, Body=out.getvalue())
+        written = [PATIENTS_OUTPUT_KEY]
+
+    # ---- Registrar en el catálogo (sin esperar al crawler) ------------------
+    with timer.stage("catalog"):
+        fmt = "parquet" if to_parquet else "csv"
+        synced = catalog.register(
+            PATIENTS_TABLE, GOLD_BUCKET,
+            PATIENTS_PARQUET_PREFIX if to_parquet else PATIENTS_OUTPUT_KEY.rsplit("/", 1)[0] + "/",
+            catalog.columns(names, PATIENTS_SCHEMA, fmt), fmt, sep=";",
+        )
+
+    ledger.remember(s3, "pacientes", fresh, f"s3://{GOLD_BUCKET}/{written[0]}", snapshot=True)
+    with timer.stage("archive") as m:
+        archive = s3_move.move_objects(s3, BUCKET, [(raw_key, processed_key)])
+        m["rows"] = archive["moved"]
+
+    return timer.finish({
+        "status": "SUCCESS" if not archive["failed"] else "PARTIAL",
+        "rows": rows,
+        "skipped_lines": stats["skipped_lines"],
+        "encoding": stats["encoding"],
+        "chunks": stats["chunks"],
+        "path": stats["path"],
+        "dates": stats.get("dates") or dates.counters(),
+        "output": f"s3://{GOLD_BUCKET}/{written[0]}",
+        "moved_from": raw_key,
+        "moved_to": processed_key,
+        "archive_errors": s3_move.failures(archive),
+        "catalog": synced,
+        **ledger.skipped(dups),
         "timestamp": datetime.now(CO_TZ).isoformat(),
-    }
+    })
 
 # ----- wrapper opcional para ejecutar pacientes.py de forma aislada -------
 def lambda_handler(event, context):  # pragma: no cover
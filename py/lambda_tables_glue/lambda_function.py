@@ -1,55 +1,137 @@
+import hashlib
 import json
 import os
 import time
+from datetime import datetime, timezone
+
 import boto3
+from botocore.exceptions import ClientError
 
 # ────────────── Configuración ─────────────────────────────────────────────
 REGION        = "us-east-1"
 DB_NAME       = "smes_analytics"
 GLUE_ROLE_ARN = "arn:aws:iam::302772524387:role/glue_service_role_for_crawlers"
 
-# Conjuntos de datos que vamos a catalogar
+# Conjuntos de datos que vamos a catalogar.
+# "format" (FORMAT_<DATASET>=csv|parquet) debe coincidir con el del escritor:
+# en "parquet" el crawler apunta a "parquet_path" (particiones anio=/mes=)
+# y no usa clasificadores CSV.
 DATASETS = {
     "pacientes": {
         "path": "s3://serverless-architecture-smes-analytics-gold-zone/gold1/pacientes/",
         "classifiers": ["csv_semicolon"],
+        "format": os.environ.get("FORMAT_PACIENTES", "csv"),
+        "parquet_path": "s3://serverless-architecture-smes-analytics-gold-zone/gold1/parquet/pacientes/",
     },
     "procedimientos": {
         "path": "s3://serverless-architecture-smes-analytics-gold-zone/gold1/procedimientos/",
         "classifiers": ["csv_comma"],
+        "format": os.environ.get("FORMAT_PROCEDIMIENTOS", "csv"),
+        "parquet_path": "s3://serverless-architecture-smes-analytics-gold-zone/gold1/parquet/procedimientos/",
     },
     "recomendacion_pacientes": {
         "path": "s3://serverless-architecture-smes-analytics-predictive/prediction/recomendacion_procedimientos/",
         "classifiers": ["csv_comma"],
+        "format": os.environ.get("FORMAT_RECOMENDACION_PACIENTES", "csv"),
+        "parquet_path": "s3://serverless-architecture-smes-analytics-predictive/prediction/parquet/recomendacion_pacientes/",
     },
     "consolidado_procedimientos": {
         "path": "s3://serverless-architecture-smes-analytics-gold-zone/gold1/mensual_proc/",
         "classifiers": ["csv_semicolon"],
+        "format": os.environ.get("FORMAT_CONSOLIDADO_PROCEDIMIENTOS", "csv"),
+        "parquet_path": "s3://serverless-architecture-smes-analytics-gold-zone/gold1/parquet/consolidado_procedimientos/",
     },
 }
 
-# Intervalo entre sondeos al crawler si se desea esperar
-CRAWLER_POLL = 30
+# Espera (event["wait"]): sondeo conjunto de todos los crawlers lanzados con
+# backoff adaptativo entre POLL_MIN y POLL_MAX, dentro del timeout de la Lambda
+POLL_MIN      = float(os.environ.get("CRAWLER_POLL_MIN", "2"))
+POLL_MAX      = float(os.environ.get("CRAWLER_POLL_MAX", "30"))
+WAIT_MARGIN_S = 15            # reserva para escribir el manifiesto y responder
+WAIT_BUDGET_S = 285           # sin `context` (ejecución local)
+
+# Manifiesto: keys/ETags de cada prefijo en el último crawl exitoso
+MANIFEST_BUCKET = "serverless-architecture-smes-analytics-gold-zone"
+MANIFEST_KEY    = "state/crawlers/manifest.json"
+DONE_STATES     = {"SUCCEEDED", "FAILED", "CANCELLED"}
+CLOCK_SKEW_S    = 30          # tolerancia al comparar LastCrawl.StartTime con nuestro reloj
+PENDING_MAX_AGE_S = int(os.environ.get("CRAWLER_PENDING_MAX_AGE_S", "7200"))   # pendiente sin cierre → se descarta
+
+# "direct": las Lambdas y el job registran tablas y particiones al escribir; los
+# crawlers quedan como respaldo (tabla ausente) y como detector de drift sobre
+# las tablas declaradas, sin modificarlas. "crawler": comportamiento anterior.
+CATALOG_MODE = os.environ.get("CATALOG_MODE", "direct").lower()
 
 
 def lambda_handler(event, context):
     glue = boto3.client("glue", region_name=REGION)
+    s3 = boto3.client("s3", region_name=REGION)
+    event = event or {}
+    drift_check = bool(event.get("drift_check"))   # p. ej. desde una regla programada
+    force = bool(event.get("force"))               # ignora el manifiesto
 
     _ensure_database(glue)
+    manifest, etag = _read_manifest(s3)
 
     crawlers_started = []
+    registered = []
+    skipped = {}
+    snapshots = {}
 
     for tbl, cfg in DATASETS.items():
-        _ensure_crawler(glue, tbl, cfg)
-        _start_crawler(glue, tbl, wait=False)
+        declared = CATALOG_MODE == "direct" and _table_exists(glue, tbl)
+        _ensure_crawler(glue, tbl, cfg, declared)
+        if declared:
+            registered.append(tbl)
+            if not drift_check:
+                continue
+
+        name = f"crawler_{tbl}"
+        entry = _promote_pending(glue, manifest.setdefault(name, {}), name)
+        if "pending" in entry and not force:
+            skipped[tbl] = "crawl en curso"   # lo nuevo se detecta cuando termine
+            continue
+        path, _ = _crawler_target(cfg)
+        objects = _list_objects(s3, path)
+        changes = _diff(entry.get("objects", {}), objects)
+        if not force and not any(changes.values()) and entry.get("path") == path:
+            skipped[tbl] = "sin cambios"
+            continue
+        if not objects:
+            skipped[tbl] = "prefijo vacío"
+            continue
+
+        started_at = _now()
+        if not _start_crawler(glue, tbl):
+            skipped[tbl] = "crawl en curso"   # no es nuestro: se reintenta en la próxima invocación
+            continue
+        entry["pending"] = {"path": path, "objects": objects, "started_at": started_at}
+        snapshots[name] = changes
         crawlers_started.append(tbl)
 
-    return {
+    result = {
         "status": "OK",
         "database": DB_NAME,
+        "catalog_mode": CATALOG_MODE,
+        "tables_registered": registered,
         "crawlers_started": crawlers_started,
+        "crawlers_skipped": skipped,
+        "changes": snapshots,
     }
 
+    if event.get("wait") and crawlers_started:
+        since = {f"crawler_{t}": manifest[f"crawler_{t}"]["pending"]["started_at"] for t in crawlers_started}
+        runs = _wait_crawlers(glue, since, _deadline(context))
+        for name, run in runs.items():
+            if run["status"] == "SUCCEEDED":
+                _promote_pending(glue, manifest[name], name, force=True)
+        result["crawlers"] = runs
+        if any(r["status"] != "SUCCEEDED" for r in runs.values()):
+            result["status"] = "PARTIAL"
+
+    _write_manifest(s3, manifest, etag)
+    return result
+
 
 # ────────────── Funciones auxiliares ──────────────────────────────────────
 
@@ -65,16 +147,44 @@ def _ensure_database(glue):
         )
 
 
-def _ensure_crawler(glue, table_name, cfg):
+def _table_exists(glue, table_name):
+    """¿La tabla ya la declaró un escritor? Sin permiso para leerla se trata como no
+    declarada: el crawler vuelve al destino S3 en lugar de fallar la invocación."""
+    try:
+        glue.get_table(DatabaseName=DB_NAME, Name=table_name)
+        return True
+    except glue.exceptions.EntityNotFoundException:
+        return False
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") in {"AccessDeniedException", "AccessDenied"}:
+            return False
+        raise
+
+
+def _crawler_target(cfg):
+    """(path, classifiers) según el formato del dataset."""
+    if cfg.get("format", "csv") == "parquet":
+        return cfg["parquet_path"], []
+    return cfg["path"], cfg.get("classifiers", [])
+
+
+def _ensure_crawler(glue, table_name, cfg, declared=False):
+    """Crawler sobre la ruta S3 o, si la tabla ya la declaró el escritor, sobre la
+    tabla misma con UpdateBehavior=LOG (reporta drift sin pisar el esquema)."""
     crawler_name = f"crawler_{table_name}"
+    path, classifiers = _crawler_target(cfg)
+    targets = (
+        {"CatalogTargets": [{"DatabaseName": DB_NAME, "Tables": [table_name]}]}
+        if declared else {"S3Targets": [{"Path": path}]}
+    )
     args = {
         "Name": crawler_name,
         "Role": GLUE_ROLE_ARN,
         "DatabaseName": DB_NAME,
-        "Targets": {"S3Targets": [{"Path": cfg["path"]}]},
-        "Classifiers": cfg.get("classifiers", []),
+        "Targets": targets,
+        "Classifiers": classifiers,
         "SchemaChangePolicy": {
-            "UpdateBehavior": "UPDATE_IN_DATABASE",
+            "UpdateBehavior": "LOG" if declared else "UPDATE_IN_DATABASE",
             "DeleteBehavior": "LOG",
         },
     }
@@ -86,20 +196,137 @@ def _ensure_crawler(glue, table_name, cfg):
         glue.create_crawler(**args)
 
 
-def _start_crawler(glue, table_name, wait=False):
+def _start_crawler(glue, table_name):
+    """True si se lanzó el crawl. Si ya corría, ese crawl empezó antes de nuestro listado
+    (puede no cubrir lo nuevo) y su inicio no es el nuestro: no se anota como pendiente."""
     crawler_name = f"crawler_{table_name}"
-
-    state = glue.get_crawler(Name=crawler_name)["Crawler"]["State"]
-    if state in {"READY", "STOPPING", "STOPPED"}:
+    try:
         glue.start_crawler(Name=crawler_name)
+    except glue.exceptions.CrawlerRunningException:
+        return False
+    return True
+
+
+# ────────────── Manifiesto de cambios ─────────────────────────────────────
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _list_objects(s3, path):
+    """{key: etag} bajo s3://bucket/prefix/."""
+    bucket, _, prefix = path[len("s3://"):].partition("/")
+    paginator = s3.get_paginator("list_objects_v2")
+    return {
+        obj["Key"]: obj["ETag"]
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if not obj["Key"].endswith("/")
+    }
+
+
+def _diff(before, after):
+    return {
+        "added": sum(1 for k in after if k not in before),
+        "removed": sum(1 for k in before if k not in after),
+        "modified": sum(1 for k, e in after.items() if k in before and before[k] != e),
+    }
+
+
+def _fingerprint(objects):
+    return hashlib.sha1(json.dumps(sorted(objects.items())).encode("utf-8")).hexdigest()
+
+
+def _read_manifest(s3):
+    """(manifiesto, etag) o ({}, None) si aún no existe."""
+    try:
+        obj = s3.get_object(Bucket=MANIFEST_BUCKET, Key=MANIFEST_KEY)
+    except s3.exceptions.NoSuchKey:
+        return {}, None
+    return json.loads(obj["Body"].read())["crawlers"], obj["ETag"]
+
+
+def _write_manifest(s3, manifest, etag):
+    """PUT condicional: si otra invocación lo cambió, se descarta este (solo se repetiría un crawl)."""
+    for entry in manifest.values():
+        if "objects" in entry:
+            entry["fingerprint"] = _fingerprint(entry["objects"])
+    body = json.dumps({"updated_at": _now(), "crawlers": manifest}).encode("utf-8")
+    cond = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        s3.put_object(Bucket=MANIFEST_BUCKET, Key=MANIFEST_KEY, Body=body,
+                      ContentType="application/json", **cond)
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") not in {"PreconditionFailed", "ConditionalRequestConflict"}:
+            raise
+
+
+def _promote_pending(glue, entry, crawler_name, force=False):
+    """Si el crawl lanzado antes terminó bien, su snapshot pasa a ser el de referencia."""
+    pending = entry.get("pending")
+    if not pending:
+        return entry
+    if not force:
+        status = _finished(glue.get_crawler(Name=crawler_name)["Crawler"], pending["started_at"])
+        if status != "SUCCEEDED":
+            age = (datetime.now(timezone.utc) - datetime.fromisoformat(pending["started_at"])).total_seconds()
+            if status is not None or age > PENDING_MAX_AGE_S:
+                entry.pop("pending")   # falló o nunca se vio terminar: se reintenta en la próxima invocación
+            return entry
+    entry.update(path=pending["path"], objects=pending["objects"], crawled_at=_now())
+    entry.pop("pending")
+    return entry
+
+
+def _finished(crawler, since):
+    """Estado final del crawl iniciado después de `since` (ISO) o None si no terminó."""
+    last = crawler.get("LastCrawl", {})
+    started = last.get("StartTime")
+    if crawler.get("State") != "READY" or last.get("Status") not in DONE_STATES or started is None:
+        return None
+    if (datetime.fromisoformat(since) - started).total_seconds() > CLOCK_SKEW_S:
+        return None   # es el crawl anterior
+    return last["Status"]
+
+
+# ────────────── Espera concurrente ────────────────────────────────────────
+
+def _deadline(context):
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        budget = context.get_remaining_time_in_millis() / 1000 - WAIT_MARGIN_S
+    else:
+        budget = WAIT_BUDGET_S
+    return time.monotonic() + max(budget, 0)
+
 
-    if not wait:
-        return
+def _wait_crawlers(glue, since, deadline):
+    """Sondea todos los crawlers juntos (batch_get_crawlers) hasta que terminen o se
+    acabe el tiempo; el intervalo crece ×1.5 mientras ninguno cambie de estado.
 
-    while True:
-        crawl_info = glue.get_crawler(Name=crawler_name)["Crawler"]
-        last_crawl = crawl_info.get("LastCrawl", {})
-        status = last_crawl.get("Status")
-        if status in {"SUCCEEDED", "FAILED", "CANCELLED"}:
+    `since` es {crawler: inicio ISO}; devuelve {crawler: {status, duration_s, error}}.
+    """
+    start = time.monotonic()
+    runs = {n: {"status": "RUNNING", "duration_s": None} for n in since}
+    pending = set(since)
+    delay = POLL_MIN
+    while pending:
+        crawlers = glue.batch_get_crawlers(CrawlerNames=sorted(pending))["Crawlers"]
+        finished = 0
+        for crawler in crawlers:
+            status = _finished(crawler, since[crawler["Name"]])
+            if status is not None:
+                runs[crawler["Name"]] = {
+                    "status": status,
+                    "duration_s": round(time.monotonic() - start, 1),
+                    "error": crawler["LastCrawl"].get("ErrorMessage"),
+                }
+                pending.discard(crawler["Name"])
+                finished += 1
+        remaining = deadline - time.monotonic()
+        if not pending or remaining <= 0:
             break
-        time.sleep(CRAWLER_POLL)
+        delay = POLL_MIN if finished else min(delay * 1.5, POLL_MAX)
+        time.sleep(min(delay, remaining))
+    for name in pending:
+        runs[name]["duration_s"] = round(time.monotonic() - start, 1)   # sigue corriendo
+    return runs
@@ -0,0 +1,151 @@
+# catalog.py  (registro directo en el Glue Data Catalog: tabla + particiones, sin crawler)
+from __future__ import annotations
+
+import os
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+import runtime
+import storage
+
+DB_NAME      = os.environ.get("GLUE_DATABASE", "smes_analytics")
+CATALOG_SYNC = os.environ.get("CATALOG_SYNC", "true").lower() in ("1", "true", "yes")
+
+PARTITION_KEYS = ("anio", "mes")
+_PARTITION_RE  = re.compile(r"anio=([^/]+)/mes=([^/]+)/")
+_GLUE_TYPES    = {"date": "date", "float": "double", "string": "string"}
+_BATCH         = 100   # máximo de batch_create_partition
+
+_PARQUET = {
+    "InputFormat": "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
+    "OutputFormat": "org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
+    "SerdeInfo": {"SerializationLibrary": "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"},
+}
+_CSV = {
+    "InputFormat": "org.apache.hadoop.mapred.TextInputFormat",
+    "OutputFormat": "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat",
+}
+
+_glue = None
+
+
+def _client():
+    global _glue
+    if _glue is None:
+        _glue = runtime.client("glue")
+    return _glue
+
+
+def column_name(name: str) -> str:
+    """Nombre de columna como lo deja el crawler: sin BOM ni tildes y en minúsculas."""
+    name = unicodedata.normalize("NFKD", name.lstrip("\ufeff"))
+    return "".join(c for c in name if not unicodedata.combining(c)).strip().lower()
+
+
+def columns(names: Iterable[str], schema: Optional[Dict[str, str]] = None, fmt: str = "csv") -> List[dict]:
+    """Columnas Glue de una salida. En CSV todo es texto (OpenCSVSerde no tipa)."""
+    schema = schema or {}
+    return [
+        {"Name": column_name(n), "Type": _GLUE_TYPES.get(schema.get(n, "string"), "string") if fmt == "parquet"
+         else "string"}
+        for n in names
+    ]
+
+
+def _storage(location: str, cols: List[dict], fmt: str, sep: str) -> dict:
+    if fmt == "parquet":
+        return {"Columns": cols, "Location": location, **_PARQUET}
+    return {
+        "Columns": cols, "Location": location, **_CSV,
+        "SerdeInfo": {
+            "SerializationLibrary": "org.apache.hadoop.hive.serde2.OpenCSVSerde",
+            "Parameters": {"separatorChar": sep, "quoteChar": '"', "escapeChar": "\\"},
+        },
+    }
+
+
+def table_input(table: str, location: str, cols: List[dict], fmt: str,
+                sep: str = ",", partitioned: bool = False) -> dict:
+    params = {"classification": fmt, "source": "catalog.register"}
+    if fmt == "csv":
+        params["skip.header.line.count"] = "1"
+    return {
+        "Name": table,
+        "TableType": "EXTERNAL_TABLE",
+        "Parameters": params,
+        "PartitionKeys": [{"Name": k, "Type": "string"} for k in PARTITION_KEYS] if partitioned else [],
+        "StorageDescriptor": _storage(location, cols, fmt, sep),
+    }
+
+
+def partitions(keys: Iterable[str]) -> List[Tuple[str, str]]:
+    """(anio, mes) distintos en las keys escritas por parquet_writer."""
+    found = {m.groups() for m in map(_PARTITION_RE.search, keys) if m}
+    return sorted(found)
+
+
+def _ensure_table(glue, tinput: dict) -> str:
+    """Crea la tabla o la alinea con el esquema declarado; devuelve la acción tomada."""
+    try:
+        current = glue.get_table(DatabaseName=DB_NAME, Name=tinput["Name"])["Table"]
+    except glue.exceptions.EntityNotFoundException:
+        glue.create_table(DatabaseName=DB_NAME, TableInput=tinput)
+        return "created"
+    sd = current.get("StorageDescriptor", {})
+    same = (
+        [(c["Name"], c["Type"]) for c in sd.get("Columns", [])]
+        == [(c["Name"], c["Type"]) for c in tinput["StorageDescriptor"]["Columns"]]
+        and sd.get("Location") == tinput["StorageDescriptor"]["Location"]
+        and [k["Name"] for k in current.get("PartitionKeys", [])] == [k["Name"] for k in tinput["PartitionKeys"]]
+    )
+    if same:
+        return "unchanged"
+    glue.update_table(DatabaseName=DB_NAME, TableInput=tinput)
+    return "updated"
+
+
+def _add_partitions(glue, tinput: dict, values: List[Tuple[str, str]]) -> int:
+    """Registra las particiones nuevas; las existentes se ignoran."""
+    base = tinput["StorageDescriptor"]
+    created = 0
+    for i in range(0, len(values), _BATCH):
+        batch = values[i:i + _BATCH]
+        resp = glue.batch_create_partition(
+            DatabaseName=DB_NAME,
+            TableName=tinput["Name"],
+            PartitionInputList=[
+                {"Values": list(v),
+                 "StorageDescriptor": {**base, "Location": f"{base['Location']}anio={v[0]}/mes={v[1]}/"}}
+                for v in batch
+            ],
+        )
+        errors = [e for e in resp.get("Errors", [])
+                  if e.get("ErrorDetail", {}).get("ErrorCode") != "AlreadyExistsException"]
+        if errors:
+            raise RuntimeError(f"batch_create_partition: {errors[0]['ErrorDetail']}")
+        created += len(batch) - len(resp.get("Errors", []))
+    return created
+
+
+def register(table: str, bucket: str, prefix: str, cols: List[dict], fmt: str,
+             keys: Iterable[str] = (), sep: str = ",", partitioned: bool = False, glue=None) -> dict:
+    """Declara `table` sobre s3://bucket/prefix y sus particiones nuevas.
+
+    No interrumpe al escritor: un error del catálogo se devuelve en el resumen
+    (el crawler de LambdaGlue sigue disponible como respaldo).
+    """
+    if not CATALOG_SYNC:
+        return {"table": table, "action": "disabled"}
+    if storage.is_local(bucket):   # datos fuera de S3: no hay ubicación que declarar
+        return {"table": table, "action": "offline"}
+    glue = glue or _client()
+    tinput = table_input(table, f"s3://{bucket}/{prefix}", cols, fmt, sep, partitioned)
+    try:
+        action = _ensure_table(glue, tinput)
+        added = _add_partitions(glue, tinput, partitions(keys)) if partitioned else 0
+    except (ClientError, BotoCoreError, RuntimeError) as exc:
+        return {"table": table, "action": "error", "error": f"{type(exc).__name__}: {exc}"}
+    return {"table": table, "action": action, "partitions_added": added}
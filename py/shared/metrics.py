@@ -0,0 +1,162 @@
+# metrics.py  (instrumentación por etapa: duración, bytes, filas y memoria → CloudWatch EMF)
+from __future__ import annotations
+
+import json
+import os
+import random
+import resource
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+NAMESPACE   = os.environ.get("METRICS_NAMESPACE", "SmesAnalytics/Pipeline")
+SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", "1"))   # 0 = nunca emitir EMF
+
+# Etapas conocidas (orden del desglose): list → download → parse → transform → serialize → upload → catalog → archive
+STAGES = ("trigger", "list", "download", "parse", "transform", "validate", "serialize", "upload", "catalog", "archive", "compact")
+_DONE  = object()
+
+# Corridas abiertas en el proceso. El pico de RSS (y su reinicio vía clear_refs) es de
+# todo el proceso: solo se atribuye a un flujo si corrió solo (modo secuencial o por evento).
+_OPEN: "weakref.WeakSet[StageTimer]" = weakref.WeakSet()
+_OPEN_LOCK = threading.Lock()
+
+
+def _reset_peak() -> None:
+    """Reinicia el high-water mark del RSS (Linux ≥ 4.0); si no se puede, queda el acumulado."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    """Pico de RSS del proceso (VmHWM) en MB."""
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageTimer:
+    """Acumula métricas por etapa de un flujo y las emite como un registro EMF.
+
+    La duración se mide siempre (perf_counter); la memoria y la emisión EMF solo
+    en las invocaciones muestreadas (METRICS_SAMPLE_RATE). La memoria es la del
+    proceso: si otro flujo corre a la vez, el contador no se reinicia y el desglose
+    solo trae "process_peak_rss_mb" (pico del proceso, sin desglose por etapa ni EMF).
+    """
+
+    def __init__(self, flow: str, sampled: Optional[bool] = None):
+        self.flow = flow
+        self.sampled = random.random() < SAMPLE_RATE if sampled is None else sampled
+        self.stages: Dict[str, dict] = {}
+        with _OPEN_LOCK:
+            for other in _OPEN:
+                other.shared = True
+            self.shared = bool(_OPEN)
+            _OPEN.add(self)
+        self._reset_peak()   # en caliente, el pico no arrastra el de invocaciones anteriores
+        self._start = time.perf_counter()
+
+    def _reset_peak(self) -> None:
+        """Reinicia el pico del proceso solo si ningún otro flujo lo está midiendo."""
+        with _OPEN_LOCK:
+            if not self.shared:
+                _reset_peak()
+
+    def _stage_peak(self) -> Optional[float]:
+        return _peak_rss_mb() if self.sampled and not self.shared else None
+
+    def peak_rss_mb(self) -> float:
+        """Pico de RSS de la corrida (las etapas muestreadas reinician el contador del proceso)."""
+        stage_peaks = [m["peak_rss_mb"] for m in self.stages.values() if "peak_rss_mb" in m]
+        return max([_peak_rss_mb()] + stage_peaks)
+
+    def add(self, name: str, seconds: float, rows: Optional[int] = None,
+            nbytes: Optional[int] = None, peak_mb: Optional[float] = None) -> None:
+        """Suma una medición a la etapa `name` (una etapa puede repetirse, p. ej. por archivo)."""
+        stage = self.stages.setdefault(name, {"ms": 0.0, "calls": 0})
+        stage["ms"] += seconds * 1000
+        stage["calls"] += 1
+        if rows is not None:
+            stage["rows"] = stage.get("rows", 0) + rows
+        if nbytes is not None:
+            stage["bytes"] = stage.get("bytes", 0) + nbytes
+        if peak_mb is not None:
+            stage["peak_rss_mb"] = max(stage.get("peak_rss_mb", 0.0), peak_mb)
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None, nbytes: Optional[int] = None) -> Iterator[dict]:
+        """Mide el bloque; el dict que entrega admite "rows" y "bytes" conocidos al final."""
+        rec = {"rows": rows, "bytes": nbytes}
+        if self.sampled:
+            self._reset_peak()
+        start = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            self.add(name, time.perf_counter() - start, rec["rows"], rec["bytes"], self._stage_peak())
+
+    def iterate(self, name: str, frames: Iterable) -> Iterator:
+        """Itera `frames` (p. ej. bloques leídos de forma perezosa) midiendo cada next()."""
+        it = iter(frames)
+        while True:
+            with self.stage(name) as m:
+                item = next(it, _DONE)
+                m["rows"] = len(item) if item is not _DONE else None
+            if item is _DONE:
+                return
+            yield item
+
+    def breakdown(self) -> dict:
+        """Desglose para el payload de respuesta: {"total_ms", "stages": {...}}."""
+        order = {name: i for i, name in enumerate(STAGES)}
+        stages = {
+            name: {k: round(v, 3) if isinstance(v, float) else v
+                   for k, v in m.items() if not (self.shared and k == "peak_rss_mb")}
+            for name, m in sorted(self.stages.items(), key=lambda kv: order.get(kv[0], len(order)))
+        }
+        return {
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 3),
+            "process_peak_rss_mb" if self.shared else "peak_rss_mb": round(self.peak_rss_mb(), 1),
+            "stages": stages,
+        }
+
+    def emit(self, status: str = "") -> None:
+        """Imprime un registro EMF por etapa (dimensiones Flow y Stage) y uno de la corrida (Stage "run")."""
+        if not self.sampled:
+            return
+        now = int(time.time() * 1000)
+        run = {"run": {"ms": (time.perf_counter() - self._start) * 1000, "peak_rss_mb": self.peak_rss_mb()}}
+        for name, m in {**self.stages, **run}.items():
+            values = {"Duration": m["ms"], "Rows": m.get("rows"), "Bytes": m.get("bytes"),
+                      "PeakMemory": None if self.shared else m.get("peak_rss_mb")}
+            units = {"Duration": "Milliseconds", "Rows": "Count", "Bytes": "Bytes", "PeakMemory": "Megabytes"}
+            present = {k: v for k, v in values.items() if v is not None}
+            print(json.dumps({
+                "_aws": {
+                    "Timestamp": now,
+                    "CloudWatchMetrics": [{
+                        "Namespace": NAMESPACE,
+                        "Dimensions": [["Flow", "Stage"]],
+                        "Metrics": [{"Name": k, "Unit": units[k]} for k in present],
+                    }],
+                },
+                "Flow": self.flow, "Stage": name, "Status": status, **present,
+            }))
+
+    def finish(self, result: dict) -> dict:
+        """Emite las métricas y agrega el desglose a `result` (lo devuelve)."""
+        self.emit(result.get("status", ""))
+        result["timings"] = self.breakdown()
+        with _OPEN_LOCK:
+            _OPEN.discard(self)
+        return result
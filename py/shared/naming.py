@@ -0,0 +1,17 @@
+# naming.py  (nombres de las salidas por corrida, comunes a LambdaTransform y LambdaQuality)
+from __future__ import annotations
+
+import hashlib
+from typing import List
+
+
+def batch_suffix(objects: List[dict]) -> str:
+    """Sufijo corto para las salidas de una corrida: hash de (Key, ETag) de sus entradas.
+
+    Dos ejecuciones por evento en el mismo minuto escriben keys distintas; un reintento
+    con las mismas entradas reescribe la misma (idempotente).
+    """
+    digest = hashlib.sha1()
+    for obj in sorted(objects, key=lambda o: o["Key"]):
+        digest.update(f"{obj['Key']}\n{obj.get('ETag', '')}\n".encode("utf-8"))
+    return digest.hexdigest()[:8]
@@ -0,0 +1,65 @@
+# parquet_writer.py  (salida columnar: Parquet comprimido, tipado y particionado por año/mes)
+from __future__ import annotations
+
+import io
+import os
+from typing import Dict, List, Optional
+
+import runtime
+
+pd = runtime.lazy("pandas")   # solo al escribir Parquet
+
+PARQUET_COMPRESSION = os.environ.get("PARQUET_COMPRESSION", "snappy")
+DEFAULT_PARTITION   = "__HIVE_DEFAULT_PARTITION__"   # fechas nulas / inválidas
+
+
+def output_format(dataset: str) -> str:
+    """Formato de salida del dataset según FORMAT_<DATASET> ("csv" por defecto)."""
+    return os.environ.get(f"FORMAT_{dataset.upper()}", "csv").lower()
+
+
+def typed_frame(df: pd.DataFrame, schema: Dict[str, str], date_fmt: str = "%d/%m/%Y") -> pd.DataFrame:
+    """Aplica los tipos de `schema` ("date" | "float"); el resto queda como texto."""
+    out = df.copy()
+    for col in out.columns:
+        kind = schema.get(col, "string")
+        if kind == "date":
+            out[col] = pd.to_datetime(out[col], format=date_fmt, errors="coerce").dt.date
+        elif kind == "float":
+            out[col] = pd.to_numeric(out[col], errors="coerce").astype("float64")
+        else:
+            out[col] = out[col].astype("string")
+    return out
+
+
+def _partitions(df: pd.DataFrame, partition_col: Optional[str]):
+    """Itera (sufijo 'anio=YYYY/mes=MM/', sub-frame) según la fecha de `partition_col`."""
+    if not partition_col:
+        yield "", df
+        return
+    dates = pd.to_datetime(df[partition_col], errors="coerce")
+    anio = dates.dt.strftime("%Y").fillna(DEFAULT_PARTITION)
+    mes  = dates.dt.strftime("%m").fillna(DEFAULT_PARTITION)
+    for (a, m), part in df.groupby([anio, mes], sort=True):
+        yield f"anio={a}/mes={m}/", part
+
+
+def write_parquet(
+    s3,
+    df: pd.DataFrame,
+    bucket: str,
+    prefix: str,
+    basename: str,
+    schema: Optional[Dict[str, str]] = None,
+    partition_col: Optional[str] = None,
+) -> List[str]:
+    """Escribe `df` como Parquet bajo `prefix` y devuelve las keys creadas."""
+    typed = typed_frame(df, schema or {})
+    keys: List[str] = []
+    for suffix, part in _partitions(typed, partition_col):
+        buf = io.BytesIO()
+        part.to_parquet(buf, index=False, compression=PARQUET_COMPRESSION)
+        key = f"{prefix}{suffix}{basename}.parquet"
+        s3.put_object(Bucket=bucket, Key=key, Body=buf.getvalue())
+        keys.append(key)
+    return keys
@@ -0,0 +1,85 @@
+# runtime.py  (arranque de la Lambda: imports perezosos y clientes AWS reutilizados en caliente)
+from __future__ import annotations
+
+import importlib
+import os
+import threading
+import time
+from types import ModuleType
+
+import storage
+
+INIT_STARTED = time.perf_counter()   # primer import de este módulo ≈ inicio del init
+
+S3_MAX_POOL = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "32"))
+# Módulos pesados a importar durante el init (p. ej. "pandas" con concurrencia
+# aprovisionada); por defecto se importan al primer uso.
+PRELOAD = [m.strip() for m in os.environ.get("PRELOAD_MODULES", "").split(",") if m.strip()]
+
+_clients: dict = {}
+_lock = threading.Lock()
+_cold = True
+
+
+class LazyModule(ModuleType):
+    """Módulo que se importa en el primer acceso a un atributo."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self) -> ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            module = self.__dict__["_module"] = importlib.import_module(self.__name__)
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy(name: str) -> ModuleType:
+    """`pd = lazy("pandas")`: el costo del import se paga solo si el flujo lo usa."""
+    return LazyModule(name)
+
+
+def client(service: str):
+    """Cliente boto3 compartido entre flujos, hilos e invocaciones en caliente.
+
+    Para "s3" respeta la configuración por zona de storage (STORAGE_ROOT / STORAGE_<ZONA>).
+    """
+    cached = _clients.get(service)
+    if cached is not None:
+        return cached
+    with _lock:
+        if service not in _clients:
+            # S3 pasa por storage: una zona configurada como local o memoria no usa boto3
+            _clients[service] = storage.client(lambda: _boto(service)) if service == "s3" else _boto(service)
+    return _clients[service]
+
+
+def _boto(service: str):
+    import boto3
+    from botocore.config import Config
+    return boto3.client(service, config=Config(
+        max_pool_connections=S3_MAX_POOL,
+        retries={"max_attempts": 5, "mode": "adaptive"},
+        tcp_keepalive=True,
+    ))
+
+
+def invocation() -> dict:
+    """{"cold_start", "init_ms"} de esta invocación (init_ms solo en la primera)."""
+    global _cold
+    cold, _cold = _cold, False
+    info = {"cold_start": cold}
+    if cold:
+        info["init_ms"] = round((time.perf_counter() - INIT_STARTED) * 1000, 1)
+    return info
+
+
+for _name in PRELOAD:
+    importlib.import_module(_name)
@@ -0,0 +1,117 @@
+# s3_move.py  (archivado masivo: copia concurrente + borrado por lotes, con reporte por key)
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+MOVE_MAX_WORKERS    = int(os.environ.get("S3_MOVE_MAX_WORKERS", "16"))
+MULTIPART_THRESHOLD = int(os.environ.get("S3_MOVE_MULTIPART_THRESHOLD", str(512 * 1024 ** 2)))
+MIN_PART_SIZE       = 128 * 1024 ** 2
+MAX_PARTS           = 10_000
+PART_WORKERS        = 8
+DELETE_BATCH        = 1000          # máximo de delete_objects
+COPY_LIMIT_CODES    = {"InvalidRequest", "EntityTooLarge"}   # copy_object > 5 GB
+
+MOVED, COPY_FAILED, DELETE_FAILED = "MOVED", "COPY_FAILED", "DELETE_FAILED"
+
+
+def _multipart_copy(s3, bucket: str, key: str, dest_bucket: str, dest: str, size: int) -> None:
+    """Copia por rangos con upload_part_copy (objetos grandes o > 5 GB)."""
+    part = max(MIN_PART_SIZE, -(-size // MAX_PARTS))
+    ranges = [(n + 1, off, min(off + part, size) - 1) for n, off in enumerate(range(0, size, part))]
+    upload_id = s3.create_multipart_upload(Bucket=dest_bucket, Key=dest)["UploadId"]
+
+    def copy_part(rng: Tuple[int, int, int]) -> dict:
+        number, first, last = rng
+        resp = s3.upload_part_copy(
+            Bucket=dest_bucket, Key=dest, UploadId=upload_id, PartNumber=number,
+            CopySource={"Bucket": bucket, "Key": key}, CopySourceRange=f"bytes={first}-{last}",
+        )
+        return {"PartNumber": number, "ETag": resp["CopyPartResult"]["ETag"]}
+
+    try:
+        with ThreadPoolExecutor(max_workers=PART_WORKERS) as pool:
+            parts = list(pool.map(copy_part, ranges))
+        s3.complete_multipart_upload(
+            Bucket=dest_bucket, Key=dest, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=dest_bucket, Key=dest, UploadId=upload_id)
+        raise
+
+
+def _copy(s3, bucket: str, key: str, dest_bucket: str, dest: str, size: Optional[int]) -> None:
+    if size is not None and size > MULTIPART_THRESHOLD:
+        return _multipart_copy(s3, bucket, key, dest_bucket, dest, size)
+    try:
+        s3.copy_object(Bucket=dest_bucket, CopySource={"Bucket": bucket, "Key": key}, Key=dest)
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") not in COPY_LIMIT_CODES:
+            raise
+        size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        _multipart_copy(s3, bucket, key, dest_bucket, dest, size)
+
+
+def delete_objects(s3, bucket: str, keys: Iterable[str]) -> Dict[str, str]:
+    """Borra `keys` en lotes de DELETE_BATCH; devuelve {key: error} de las que fallaron."""
+    keys = list(keys)
+    errors: Dict[str, str] = {}
+    for i in range(0, len(keys), DELETE_BATCH):
+        batch = keys[i:i + DELETE_BATCH]
+        try:
+            resp = s3.delete_objects(
+                Bucket=bucket, Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True}
+            )
+            errors.update({e["Key"]: e.get("Message", e.get("Code")) for e in resp.get("Errors", [])})
+        except Exception as exc:
+            errors.update({k: str(exc) for k in batch})
+    return errors
+
+
+def move_objects(
+    s3,
+    bucket: str,
+    moves: Iterable[Tuple[str, str]],
+    dest_bucket: Optional[str] = None,
+    sizes: Optional[Dict[str, int]] = None,
+) -> dict:
+    """Mueve (src → dest) dentro de `bucket` (o hacia `dest_bucket`).
+
+    Copia en paralelo, borra los orígenes copiados en lotes de DELETE_BATCH y
+    devuelve {"moved", "failed", "outcomes": [{"key", "dest", "status", "error"?}]}.
+    Un origen solo se borra si su copia terminó bien.
+    """
+    dest_bucket = dest_bucket or bucket
+    sizes = sizes or {}
+    moves = list(moves)
+    outcomes: Dict[str, dict] = {src: {"key": src, "dest": dest, "status": MOVED} for src, dest in moves}
+
+    def copy_one(move: Tuple[str, str]) -> None:
+        src, dest = move
+        try:
+            _copy(s3, bucket, src, dest_bucket, dest, sizes.get(src))
+        except Exception as exc:
+            outcomes[src].update(status=COPY_FAILED, error=str(exc))
+
+    if moves:
+        with ThreadPoolExecutor(max_workers=max(1, min(MOVE_MAX_WORKERS, len(moves)))) as pool:
+            list(pool.map(copy_one, moves))
+
+    copied: List[str] = [src for src, _ in moves if outcomes[src]["status"] == MOVED]
+    for key, message in delete_objects(s3, bucket, copied).items():
+        outcomes[key].update(status=DELETE_FAILED, error=message)
+
+    report = list(outcomes.values())
+    return {
+        "moved": sum(o["status"] == MOVED for o in report),
+        "failed": sum(o["status"] != MOVED for o in report),
+        "outcomes": report,
+    }
+
+
+def failures(report: dict) -> List[dict]:
+    """Solo los resultados no exitosos (para respuestas compactas)."""
+    return [o for o in report["outcomes"] if o["status"] != MOVED]
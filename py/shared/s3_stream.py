@@ -0,0 +1,123 @@
+# s3_stream.py  (salida en streaming: CSV por bloques → multipart upload, memoria acotada)
+from __future__ import annotations
+
+import io
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+import runtime
+
+pd = runtime.lazy("pandas")
+
+PART_SIZE = int(os.environ.get("S3_STREAM_PART_SIZE", str(8 * 1024 ** 2)))
+MIN_PART  = 5 * 1024 ** 2   # mínimo de S3 para toda parte salvo la última
+
+
+class MultipartWriter:
+    """Acumula bytes y sube partes de `part_size` mientras el llamador sigue produciendo.
+
+    A lo sumo hay una parte subiendo y otra llenándose (≈ 2 × part_size en memoria).
+    Si todo cabe en una parte se hace un solo put_object. Como context manager,
+    aborta el multipart ante una excepción para no dejar partes huérfanas.
+    """
+
+    def __init__(self, s3, bucket: str, key: str, part_size: int = PART_SIZE, **put_args):
+        self.s3, self.bucket, self.key = s3, bucket, key
+        self.part_size = max(MIN_PART, part_size)
+        self.put_args = put_args
+        self.bytes = 0
+        self._buf = bytearray()
+        self._parts: List[dict] = []
+        self._upload_id: Optional[str] = None
+        self._pending: Optional[Future] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def write(self, data: bytes) -> None:
+        self._buf += data
+        self.bytes += len(data)
+        while len(self._buf) >= self.part_size:
+            chunk = bytes(self._buf[:self.part_size])
+            del self._buf[:self.part_size]
+            self._upload(chunk)
+
+    def _upload(self, chunk: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.s3.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.put_args)["UploadId"]
+            self._pool = ThreadPoolExecutor(max_workers=1)
+        self._wait()
+        number = len(self._parts) + 1
+        self._parts.append({"PartNumber": number})
+        self._pending = self._pool.submit(
+            self.s3.upload_part, Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            PartNumber=number, Body=chunk,
+        )
+
+    def _wait(self) -> None:
+        if self._pending is not None:
+            self._parts[-1]["ETag"] = self._pending.result()["ETag"]
+            self._pending = None
+
+    def close(self) -> dict:
+        """Sube lo que queda y cierra el objeto; devuelve {"bytes", "parts"}."""
+        if self._upload_id is None:
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buf), **self.put_args)
+            self._buf.clear()
+            return {"bytes": self.bytes, "parts": 1}
+        if self._buf:
+            self._upload(bytes(self._buf))
+            self._buf.clear()
+        self._wait()
+        self._pool.shutdown()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+        return {"bytes": self.bytes, "parts": len(self._parts)}
+
+    def abort(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        if self._upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        self._buf.clear()
+
+    def __enter__(self) -> "MultipartWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.abort()
+
+
+class CsvStream:
+    """Serializa DataFrames sucesivos como un solo CSV: BOM y encabezado solo al inicio.
+
+    Las filas de cada bloque se alinean a `columns` (columnas faltantes → vacío), de
+    modo que el resultado es igual a `pd.concat(bloques)[columns].to_csv(...)`.
+    """
+
+    def __init__(self, writer: MultipartWriter, columns: Sequence[str], encoding: str = "utf-8-sig"):
+        self.writer, self.columns = writer, list(columns)
+        self.encoding = encoding
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> int:
+        """Agrega las filas de `df`; devuelve los bytes serializados."""
+        first = self.writer.bytes == 0
+        buf = io.BytesIO()
+        df.reindex(columns=self.columns).to_csv(
+            buf, index=False, header=first, lineterminator="\n",
+            encoding=self.encoding if first else self.encoding.replace("-sig", ""),
+        )
+        data = buf.getvalue()
+        self.writer.write(data)
+        self.rows += len(df)
+        return len(data)
+
+    def close(self) -> dict:
+        """Cierra el objeto (solo el encabezado si no hubo filas); devuelve {"bytes", "parts", "rows"}."""
+        if self.writer.bytes == 0:
+            self.write(pd.DataFrame(columns=self.columns))
+        return {**self.writer.close(), "rows": self.rows}
@@ -0,0 +1,563 @@
+# storage.py  (almacenamiento por zona: S3, sistema de archivos local con mmap o memoria)
+#
+# Los flujos hablan con un cliente con la interfaz de boto3 S3 (get_object, put_object,
+# list_objects_v2, copy/delete y multipart), así que s3_stream (escritura en streaming) y
+# s3_move (archivado) funcionan igual sobre cualquier backend. Cada zona se configura aparte:
+#   STORAGE_<ZONA>=s3 | file:///ruta/lago/ | memory      ZONA: BRONZE, SILVER, GOLD, PREDICTIVE
+#   STORAGE_ROOT=file:///ruta/lago/                      zonas sin valor propio
+# En disco un objeto es <raíz>/<bucket>/<key>: la misma estructura que usa el job de Glue
+# con Spark local (--STORAGE_ROOT). Sin configuración todo es S3 y runtime.client("s3")
+# devuelve el cliente boto3 de siempre.
+#
+# Fuente única en py/shared: py/build_packages.py la copia a la raíz de cada zip.
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import mmap
+import os
+import stat
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from botocore.exceptions import ClientError
+
+try:
+    import fcntl   # PUT condicional entre procesos sobre el mismo lago local
+except ImportError:  # pragma: no cover  (Windows)
+    fcntl = None
+
+ZONES = {
+    "bronze": "serverless-architecture-smes-analytics-bronze-zone",
+    "silver": "serverless-architecture-smes-analytics-silver-zone",
+    "gold": "serverless-architecture-smes-analytics-gold-zone",
+    "predictive": "serverless-architecture-smes-analytics-predictive",
+}
+_TMP = ".storage-tmp"        # sufijo de los archivos a medio escribir (no se listan)
+_MULTIPART = ".multipart"    # partes de uploads en curso, fuera de los buckets
+
+
+def _error(code: str, op: str, message: str = "") -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message or code}}, op)
+
+
+class NoSuchKey(ClientError):
+    def __init__(self, key: str):
+        super().__init__({"Error": {"Code": "NoSuchKey", "Message": key}}, "GetObject")
+
+
+class _Exceptions:
+    NoSuchKey = NoSuchKey
+    ClientError = ClientError
+
+
+def _etag(data) -> str:
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def _multipart_etag(digests: List[bytes]) -> str:
+    """ETag como el de S3 para un objeto multipart: md5(md5 de cada parte)-N."""
+    return f'"{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests)}"'
+
+
+def _range(spec: Optional[str], size: int) -> tuple:
+    """"bytes=a-b" → (a, b + 1) acotado al tamaño del objeto."""
+    if not spec:
+        return 0, size
+    first, _, last = spec.split("=", 1)[1].partition("-")
+    if not first:   # sufijo: los últimos N bytes
+        return max(0, size - int(last)), size
+    return int(first), min(size, int(last) + 1 if last else size)
+
+
+class _Body:
+    """StreamingBody mínimo sobre un buffer (bytes o mmap) sin copiarlo entero."""
+
+    def __init__(self, buf, start: int = 0, end: Optional[int] = None, owner=None):
+        self._buf, self._pos = buf, start
+        self._end = len(buf) if end is None else end
+        self._owner = owner
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        stop = self._end if amt is None else min(self._end, self._pos + amt)
+        data = bytes(self._buf[self._pos:stop])
+        self._pos = stop
+        return data
+
+    def iter_chunks(self, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        while self._pos < self._end:
+            yield self.read(chunk_size)
+
+    def close(self) -> None:
+        if self._owner is not None:
+            self._owner.close()
+
+
+class _Paginator:
+    def __init__(self, store: "ObjectStore"):
+        self.store = store
+
+    def paginate(self, Bucket: str, Prefix: str = "", PaginationConfig: Optional[dict] = None,
+                 PageSize: int = 1000, **_) -> Iterator[dict]:
+        size = (PaginationConfig or {}).get("PageSize", PageSize)
+        objects = list(self.store.list(Bucket, Prefix))
+        if not objects:
+            yield {"KeyCount": 0}
+            return
+        for i in range(0, len(objects), size):
+            page = objects[i:i + size]
+            yield {"Contents": page, "KeyCount": len(page)}
+
+
+# ───────────────────── Backends ────────────────────────────────────────────
+class ObjectStore:
+    """Subconjunto de la API de boto3 S3 sobre cinco primitivas por backend:
+    _stat, _buffer, _write, _remove y _keys. Agrega además las operaciones
+    directas head / list / open / move."""
+
+    exceptions = _Exceptions
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._uploads: Dict[str, dict] = {}
+
+    # ---- primitivas --------------------------------------------------------
+    def _stat(self, bucket: str, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def _buffer(self, bucket: str, key: str):
+        """(buffer, dueño a cerrar o None) o None si no existe."""
+        raise NotImplementedError
+
+    def _write(self, bucket: str, key: str, chunks: Iterable[bytes], etag: str) -> None:
+        raise NotImplementedError
+
+    def _remove(self, bucket: str, key: str) -> None:
+        raise NotImplementedError
+
+    def _keys(self, bucket: str, prefix: str) -> List[str]:
+        raise NotImplementedError
+
+    def _locked(self):
+        return self._lock
+
+    # ---- operaciones directas ---------------------------------------------
+    def head(self, bucket: str, key: str) -> Optional[dict]:
+        """{"Key", "Size", "ETag", "LastModified"} o None."""
+        info = self._stat(bucket, key)
+        return {"Key": key, **info} if info else None
+
+    def list(self, bucket: str, prefix: str = "") -> Iterator[dict]:
+        """Objetos bajo `prefix` en orden de key, como los "Contents" de list_objects_v2."""
+        for key in self._keys(bucket, prefix):
+            obj = self.head(bucket, key)
+            if obj is not None:
+                yield obj
+
+    def open(self, Bucket: str, Key: str):
+        """Archivo binario de solo lectura (seek/read) sobre el objeto, sin copiarlo."""
+        found = self._buffer(Bucket, Key)
+        if found is None:
+            raise NoSuchKey(Key)
+        return io.BytesIO(found[0])
+
+    def move(self, bucket: str, key: str, dest_bucket: str, dest: str) -> None:
+        self.copy_object(Bucket=dest_bucket, Key=dest, CopySource={"Bucket": bucket, "Key": key})
+        self.delete_object(Bucket=bucket, Key=key)
+
+    # ---- API boto3 -----------------------------------------------------------
+    def head_object(self, Bucket: str, Key: str, ChecksumMode: Optional[str] = None, **_) -> dict:
+        info = self._stat(Bucket, Key)
+        if info is None:
+            raise _error("404", "HeadObject", Key)
+        out = {"ContentLength": info["Size"], "ETag": info["ETag"], "LastModified": info["LastModified"]}
+        if ChecksumMode == "ENABLED":   # como S3: checksum de objeto completo (aquí SHA-256)
+            found = self._buffer(Bucket, Key)
+            if found is not None:
+                buf, owner = found
+                out.update(ChecksumSHA256=base64.b64encode(hashlib.sha256(buf).digest()).decode("ascii"),
+                           ChecksumType="FULL_OBJECT")
+                if owner is not None:
+                    owner.close()
+        return out
+
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None,
+                   IfMatch: Optional[str] = None, **_) -> dict:
+        info = self._stat(Bucket, Key)
+        found = self._buffer(Bucket, Key) if info else None
+        if found is None:
+            raise NoSuchKey(Key)
+        if IfMatch is not None and IfMatch != info["ETag"]:
+            raise _error("PreconditionFailed", "GetObject")
+        buf, owner = found
+        start, end = _range(Range, len(buf))
+        return {"Body": _Body(buf, start, end, owner), "ContentLength": end - start,
+                "ETag": info["ETag"], "LastModified": info["LastModified"]}
+
+    def put_object(self, Bucket: str, Key: str, Body=b"", IfMatch: Optional[str] = None,
+                   IfNoneMatch: Optional[str] = None, **_) -> dict:
+        data = Body.read() if hasattr(Body, "read") else bytes(Body)
+        etag = _etag(data)
+        with self._locked():
+            current = self._stat(Bucket, Key)
+            if IfNoneMatch == "*" and current is not None:
+                raise _error("PreconditionFailed", "PutObject")
+            if IfMatch is not None and (current is None or current["ETag"] != IfMatch):
+                raise _error("PreconditionFailed", "PutObject")
+            self._write(Bucket, Key, [data], etag)
+        return {"ETag": etag}
+
+    def copy_object(self, Bucket: str, Key: str, CopySource: dict, **_) -> dict:
+        src = self.get_object(Bucket=CopySource["Bucket"], Key=CopySource["Key"])
+        etag = src["ETag"]
+        self._write(Bucket, Key, src["Body"].iter_chunks(), etag)
+        src["Body"].close()
+        return {"CopyObjectResult": {"ETag": etag}}
+
+    def delete_object(self, Bucket: str, Key: str, **_) -> dict:
+        self._remove(Bucket, Key)
+        return {}
+
+    def delete_objects(self, Bucket: str, Delete: dict, **_) -> dict:
+        deleted = []
+        for obj in Delete.get("Objects", []):
+            self._remove(Bucket, obj["Key"])
+            deleted.append({"Key": obj["Key"]})
+        return {"Deleted": deleted, "Errors": []}
+
+    def get_paginator(self, name: str) -> _Paginator:
+        if name != "list_objects_v2":
+            raise NotImplementedError(name)
+        return _Paginator(self)
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", MaxKeys: int = 1000,
+                        StartAfter: str = "", **_) -> dict:
+        objects = [o for o in self.list(Bucket, Prefix) if o["Key"] > StartAfter][:MaxKeys + 1]
+        page = objects[:MaxKeys]
+        return {"Contents": page, "KeyCount": len(page), "IsTruncated": len(objects) > MaxKeys}
+
+    # ---- multipart (s3_stream / s3_move) ---------------------------------------
+    def _stash_part(self, upload_id: str, number: int, data: bytes):
+        return data
+
+    def _part_chunks(self, part) -> Iterator[bytes]:
+        yield part
+
+    def _drop_parts(self, upload_id: str) -> None:
+        pass
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **_) -> dict:
+        upload_id = uuid.uuid4().hex
+        self._uploads[upload_id] = {"bucket": Bucket, "key": Key, "parts": {}}
+        return {"UploadId": upload_id}
+
+    def _upload(self, upload_id: str) -> dict:
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise _error("NoSuchUpload", "UploadPart", upload_id)
+        return upload
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body, **_) -> dict:
+        data = Body.read() if hasattr(Body, "read") else bytes(Body)
+        digest = hashlib.md5(data).digest()
+        self._upload(UploadId)["parts"][PartNumber] = (self._stash_part(UploadId, PartNumber, data), digest)
+        return {"ETag": f'"{digest.hex()}"'}
+
+    def upload_part_copy(self, Bucket: str, Key: str, UploadId: str, PartNumber: int,
+                         CopySource: dict, CopySourceRange: Optional[str] = None, **_) -> dict:
+        src = self.get_object(Bucket=CopySource["Bucket"], Key=CopySource["Key"], Range=CopySourceRange)
+        etag = self.upload_part(Bucket=Bucket, Key=Key, UploadId=UploadId, PartNumber=PartNumber,
+                                Body=src["Body"].read())["ETag"]
+        src["Body"].close()
+        return {"CopyPartResult": {"ETag": etag}}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict, **_) -> dict:
+        parts = self._upload(UploadId)["parts"]
+        numbers = [p["PartNumber"] for p in MultipartUpload["Parts"]]
+        etag = _multipart_etag([parts[n][1] for n in numbers])
+        self._write(Bucket, Key, (chunk for n in numbers for chunk in self._part_chunks(parts[n][0])), etag)
+        self.abort_multipart_upload(Bucket=Bucket, Key=Key, UploadId=UploadId)
+        return {"ETag": etag}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **_) -> dict:
+        self._uploads.pop(UploadId, None)
+        self._drop_parts(UploadId)
+        return {}
+
+
+class MemoryStore(ObjectStore):
+    """Objetos en un dict del proceso (pruebas, corridas efímeras)."""
+
+    def __init__(self):
+        super().__init__()
+        self.objects: Dict[tuple, tuple] = {}   # (bucket, key) → (bytes, etag, last_modified)
+
+    def _stat(self, bucket, key):
+        found = self.objects.get((bucket, key))
+        if found is None:
+            return None
+        return {"Size": len(found[0]), "ETag": found[1], "LastModified": found[2]}
+
+    def _buffer(self, bucket, key):
+        found = self.objects.get((bucket, key))
+        return None if found is None else (found[0], None)
+
+    def _write(self, bucket, key, chunks, etag):
+        self.objects[(bucket, key)] = (b"".join(chunks), etag, datetime.now(timezone.utc))
+
+    def _remove(self, bucket, key):
+        self.objects.pop((bucket, key), None)
+
+    def _keys(self, bucket, prefix):
+        return sorted(k for b, k in self.objects if b == bucket and k.startswith(prefix))
+
+
+class _FileLock:
+    """Lock del proceso + flock sobre <raíz>/.lock: PUT condicional entre procesos."""
+
+    def __init__(self, root: str, lock: threading.RLock):
+        self.path, self.lock = os.path.join(root, ".lock"), lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.fh = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self.fh, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fh, fcntl.LOCK_UN)
+        self.fh.close()
+        self.lock.release()
+
+
+class LocalStore(ObjectStore):
+    """Objetos como archivos en <raíz>/<bucket>/<key>; las lecturas son mmap del archivo.
+
+    Las escrituras van a un temporal y se publican con os.replace (un lector nunca ve
+    un objeto a medias). El ETag es el MD5 del contenido, calculado al escribir o, para
+    archivos copiados a mano al lago, en el primer acceso (cacheado por tamaño y mtime).
+    """
+
+    def __init__(self, root: str):
+        super().__init__()
+        self.root = os.path.abspath(root[len("file://"):] if root.startswith("file://") else root)
+        os.makedirs(self.root, exist_ok=True)
+        self._etags: Dict[str, tuple] = {}   # path → (size, mtime_ns, etag)
+
+    def path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def _locked(self):
+        return _FileLock(self.root, self._lock)
+
+    def _stat(self, bucket, key):
+        path = self.path(bucket, key)
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        cached = self._etags.get(path)
+        if cached is None or cached[:2] != (st.st_size, st.st_mtime_ns):
+            found = self._buffer(bucket, key)
+            if found is None:
+                return None
+            etag = _etag(found[0])
+            if found[1] is not None:
+                found[1].close()
+            self._etags[path] = cached = (st.st_size, st.st_mtime_ns, etag)
+        return {"Size": st.st_size, "ETag": cached[2],
+                "LastModified": datetime.fromtimestamp(st.st_mtime, timezone.utc)}
+
+    def _buffer(self, bucket, key):
+        try:
+            with open(self.path(bucket, key), "rb") as fh:
+                if os.fstat(fh.fileno()).st_size == 0:
+                    return b"", None
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            return None
+        return mm, mm
+
+    def open(self, Bucket: str, Key: str):
+        """mmap del archivo (read/seek/readline): pandas y openpyxl lo leen sin copiarlo."""
+        found = self._buffer(Bucket, Key)
+        if found is None:
+            raise NoSuchKey(Key)
+        return found[1] or io.BytesIO(found[0])
+
+    def _write(self, bucket, key, chunks, etag):
+        path = self.path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}{_TMP}"
+        try:
+            with open(tmp, "wb") as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        st = os.stat(path)
+        self._etags[path] = (st.st_size, st.st_mtime_ns, etag)
+
+    def _remove(self, bucket, key):
+        path = self.path(bucket, key)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        self._etags.pop(path, None)
+        # Como en S3 no quedan "carpetas" vacías
+        folder, top = os.path.dirname(path), os.path.join(self.root, bucket)
+        while folder != top and folder.startswith(top):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+
+    def _keys(self, bucket, prefix):
+        top = os.path.join(self.root, bucket)
+        start = os.path.join(top, *prefix.split("/")[:-1])   # solo el subárbol del prefijo
+        keys = []
+        for folder, _, files in os.walk(start):
+            rel = os.path.relpath(folder, top).replace(os.sep, "/")
+            for name in files:
+                key = name if rel == "." else f"{rel}/{name}"
+                if key.startswith(prefix) and not name.endswith(_TMP):
+                    keys.append(key)
+        return sorted(keys)
+
+    # Las partes de un multipart van a disco: subir un objeto grande no lo acumula en memoria
+    def _part_path(self, upload_id: str, number: int) -> str:
+        return os.path.join(self.root, _MULTIPART, upload_id, f"{number:05d}")
+
+    def _stash_part(self, upload_id, number, data):
+        path = self._part_path(upload_id, number)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(data)
+        return path
+
+    def _part_chunks(self, part):
+        with open(part, "rb") as fh:
+            while True:
+                chunk = fh.read(8 * 1024 * 1024)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _drop_parts(self, upload_id):
+        folder = os.path.join(self.root, _MULTIPART, upload_id)
+        if os.path.isdir(folder):
+            for name in os.listdir(folder):
+                os.remove(os.path.join(folder, name))
+            os.rmdir(folder)
+
+
+# ───────────────────── Enrutado por zona ───────────────────────────────────
+class _RoutedExceptions:
+    def __init__(self, backends: Iterable):
+        classes = {getattr(getattr(b, "exceptions", None), "NoSuchKey", None) for b in backends}
+        self.NoSuchKey = tuple(c for c in classes if c is not None) or NoSuchKey
+        self.ClientError = ClientError
+
+
+class _RoutedPaginator:
+    def __init__(self, router: "Router", name: str):
+        self.router, self.name = router, name
+
+    def paginate(self, Bucket: str, **kwargs):
+        return self.router.backend(Bucket).get_paginator(self.name).paginate(Bucket=Bucket, **kwargs)
+
+
+class Router:
+    """Cliente "S3" que envía cada llamada al backend del bucket (Bucket=...).
+
+    Las copias entre backends distintos (p. ej. bronze local → silver en S3) se hacen
+    leyendo el origen y escribiendo el destino.
+    """
+
+    def __init__(self, backends: Dict[str, object], default):
+        self.backends, self.default = backends, default
+        self.exceptions = _RoutedExceptions([default, *backends.values()])
+
+    def backend(self, bucket: str):
+        return self.backends.get(bucket, self.default)
+
+    def get_paginator(self, name: str) -> _RoutedPaginator:
+        return _RoutedPaginator(self, name)
+
+    def copy_object(self, Bucket: str, Key: str, CopySource: dict, **kwargs) -> dict:
+        src, dest = self.backend(CopySource["Bucket"]), self.backend(Bucket)
+        if src is dest:
+            return dest.copy_object(Bucket=Bucket, Key=Key, CopySource=CopySource, **kwargs)
+        body = src.get_object(Bucket=CopySource["Bucket"], Key=CopySource["Key"])["Body"].read()
+        etag = dest.put_object(Bucket=Bucket, Key=Key, Body=body)["ETag"]
+        return {"CopyObjectResult": {"ETag": etag}}
+
+    def upload_part_copy(self, Bucket: str, Key: str, UploadId: str, PartNumber: int,
+                         CopySource: dict, CopySourceRange: Optional[str] = None, **kwargs) -> dict:
+        src, dest = self.backend(CopySource["Bucket"]), self.backend(Bucket)
+        if src is dest:
+            return dest.upload_part_copy(Bucket=Bucket, Key=Key, UploadId=UploadId, PartNumber=PartNumber,
+                                         CopySource=CopySource, CopySourceRange=CopySourceRange, **kwargs)
+        args = {"Range": CopySourceRange} if CopySourceRange else {}
+        body = src.get_object(Bucket=CopySource["Bucket"], Key=CopySource["Key"], **args)["Body"].read()
+        etag = dest.upload_part(Bucket=Bucket, Key=Key, UploadId=UploadId, PartNumber=PartNumber, Body=body)["ETag"]
+        return {"CopyPartResult": {"ETag": etag}}
+
+    def __getattr__(self, name: str):
+        def call(*args, **kwargs):
+            return getattr(self.backend(kwargs.get("Bucket")), name)(*args, **kwargs)
+        return call
+
+
+# ───────────────────── Configuración ───────────────────────────────────────
+_stores: Dict[str, ObjectStore] = {}   # misma raíz / memoria → mismo backend
+
+
+def zone_setting(zone: str) -> str:
+    """Valor configurado de una zona ("s3" si no hay nada)."""
+    return (os.environ.get(f"STORAGE_{zone.upper()}") or os.environ.get("STORAGE_ROOT") or "s3").strip()
+
+
+def offline() -> bool:
+    """True si alguna zona no es S3 (corrida local / backfill)."""
+    return any(zone_setting(z).lower() != "s3" for z in ZONES)
+
+
+def _store(setting: str) -> ObjectStore:
+    if setting not in _stores:
+        _stores[setting] = MemoryStore() if setting.lower() == "memory" else LocalStore(setting)
+    return _stores[setting]
+
+
+def is_local(bucket: str) -> bool:
+    zone = next((z for z, b in ZONES.items() if b == bucket), None)
+    return zone is not None and zone_setting(zone).lower() != "s3"
+
+
+def client(s3_factory: Callable[[], object]):
+    """Cliente para los flujos: boto3 si todo es S3; si no, un Router por zona."""
+    if not offline():
+        return s3_factory()
+    backends = {bucket: _store(zone_setting(zone)) for zone, bucket in ZONES.items()
+                if zone_setting(zone).lower() != "s3"}
+    remote = s3_factory() if len(backends) < len(ZONES) else next(iter(backends.values()))
+    return Router(backends, remote)
+
+
+def open_stream(s3, bucket: str, key: str):
+    """Archivo binario legible sobre un objeto: mmap en el backend local, BytesIO en S3."""
+    backend = s3.backend(bucket) if isinstance(s3, Router) else s3
+    if isinstance(backend, ObjectStore):
+        return backend.open(Bucket=bucket, Key=key)
+    return io.BytesIO(backend.get_object(Bucket=bucket, Key=key)["Body"].read())